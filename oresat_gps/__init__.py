@@ -1,20 +1,10 @@
 """OreSat GPS application interface.
 
-This module exposes the package API (`__version__`, `main()`) and wires the
-runtime interface for the GPS service:
-- `main()` initializes OLAF, selects real or mock SkyTraq hardware, and starts
-  the service loop.
-- `/skytraq` serves the SkyTraq status/control page template.
+This module exposes the package API (`__version__`, `main()`). The OLAF app itself is wired up in
+`oresat_gps._app` and only imported by `main()`, so the rest of the package, e.g. the codec for
+decoding captures on the ground, can be imported without OLAF or the card's hardware libraries.
 """
 
-from importlib.resources import files
-from pathlib import Path
-
-from olaf import app, logger, olaf_run, olaf_setup, render_olaf_template, rest_api
-
-from oresat_gps.gps_service import GpsService
-from oresat_gps.skytraq import MockSkyTraq, SkyTraq, SkyTraq10, SkyTraq11
-
 try:
     from ._version import version as __version__
 except ImportError:
@@ -23,35 +13,8 @@ except ImportError:
 __all__ = ["__version__", "main"]
 
 
-@rest_api.app.route("/skytraq")
-def skytraq_template() -> str:
-    """Render skytraq webpage."""
-    return render_olaf_template("skytraq.html", name="SkyTraq")
-
-
 def main() -> None:
     """GPS OLAF app main."""
-    args, _ = olaf_setup("gps")
-    mock_args = [i.lower() for i in args.mock_hw]
-    mock_skytraq = "skytraq" in mock_args or "all" in mock_args
-
-    app.od["versions"]["sw_version"].value = __version__  # type: ignore[index]
-    hw_version = app.od["versions"]["hw_version"].value  # type: ignore[index]
-
-    if mock_skytraq:
-        logger.debug("Mocking the skytraq.")
-        skytraq: SkyTraq = MockSkyTraq()
-    elif hw_version == "1.0":
-        skytraq = SkyTraq10(Path("/dev/ttyS2"))
-    elif hw_version == "1.1":
-        skytraq = SkyTraq11(Path("/dev/ttyS2"))
-    else:
-        logger.error("Invalid gps board version")
-        # attempt the latest anyway
-        skytraq = SkyTraq11(Path("/dev/ttyS2"))
-
-    app.add_service(GpsService(skytraq))
-
-    rest_api.add_template(str(files('oresat_gps') / 'templates' / 'skytraq.html'))
+    from ._app import main as app_main  # noqa: PLC0415
 
-    olaf_run()
+    app_main()
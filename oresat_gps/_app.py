@@ -0,0 +1,204 @@
+"""OLAF app wiring for the GPS service.
+
+Only imported by `oresat_gps.main()`, so OLAF and Flask are only loaded by the app itself, and the
+routes are only added once `main()` has set OLAF up.
+
+- `main()` initializes OLAF, selects real, mock or replayed SkyTraq hardware,
+  optionally records the raw byte stream and archives fixes, and starts the
+  service loop.
+- `/skytraq` serves the SkyTraq status/control page template.
+- `/skytraq/metrics` serves the pipeline latency histograms and counters as JSON.
+- `/skytraq/history` serves the recent fixes as JSON.
+- `/skytraq/stream` streams the status and navigation data as server-sent events, from a
+  server of its own on the `--stream-port`, which the route redirects to.
+"""
+
+from argparse import ArgumentParser
+from http.server import ThreadingHTTPServer
+from importlib.resources import files
+from os import geteuid
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlsplit
+
+from flask import redirect, request
+from olaf import app, logger, olaf_parser, olaf_run, olaf_setup, render_olaf_template, rest_api
+from werkzeug.wrappers import Response
+
+from oresat_gps import __version__
+from oresat_gps.archive import FixArchiveWriter
+from oresat_gps.capture import CaptureRecorder
+from oresat_gps.clock import ClockDiscipline, slew_clock, step_clock
+from oresat_gps.gps_service import GpsService
+from oresat_gps.reader import OverflowPolicy, SkyTraqReader
+from oresat_gps.simulator import SimulatedSkyTraq
+from oresat_gps.skytraq import MockSkyTraq, ReplaySkyTraq, SkyTraq, SkyTraq10, SkyTraq11
+from oresat_gps.stream import serve
+
+
+def main() -> None:
+    """GPS OLAF app main."""
+    parser = ArgumentParser(parents=[olaf_parser])
+    parser.add_argument(
+        "--capture",
+        metavar="DIR",
+        type=Path,
+        help="record the raw SkyTraq byte stream to size-rotated capture files in DIR",
+    )
+    parser.add_argument(
+        "--archive",
+        metavar="FILE",
+        type=Path,
+        help="append every fix to a delta-encoded archive FILE",
+    )
+    parser.add_argument(
+        "--aiding-state",
+        metavar="FILE",
+        type=Path,
+        help="keep the SkyTraq's last fix and ephemeris in FILE to hot start it with, defaults to "
+        "skytraq_aiding in the app's work directory",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="PATH",
+        type=Path,
+        help='with "-m skytraq", replay a capture file or directory of them instead',
+    )
+    parser.add_argument(
+        "--replay-fast",
+        action="store_true",
+        help="replay as fast as possible instead of at the original timing",
+    )
+    parser.add_argument(
+        "--simulate",
+        metavar="HZ",
+        type=int,
+        help='with "-m skytraq", generate navigation data from a simulated orbit at HZ instead',
+    )
+    parser.add_argument(
+        "--stream-port",
+        metavar="PORT",
+        type=int,
+        help="port to serve the live event stream on, defaults to the REST API port plus one",
+    )
+    parser.add_argument(
+        "--overflow-policy",
+        choices=[policy.name.lower().replace("_", "-") for policy in OverflowPolicy],
+        default="drop-oldest",
+        help="what to do with new messages once the service falls behind the reader, drop the "
+        "oldest queued one or drop every queued one to keep the latest, defaults to %(default)s",
+    )
+    args, _ = olaf_setup("gps", parser.parse_args())
+    mock_args = [i.lower() for i in args.mock_hw]
+    mock_skytraq = "skytraq" in mock_args or "all" in mock_args
+
+    app.od["versions"]["sw_version"].value = __version__  # type: ignore[index]
+    hw_version = app.od["versions"]["hw_version"].value  # type: ignore[index]
+
+    if mock_skytraq and args.replay is not None:
+        logger.debug(f"Replaying the skytraq from {args.replay}.")
+        skytraq: SkyTraq = ReplaySkyTraq(args.replay, realtime=not args.replay_fast)
+    elif mock_skytraq and args.simulate is not None:
+        logger.debug(f"Simulating the skytraq at {args.simulate} Hz.")
+        skytraq = SimulatedSkyTraq(args.simulate)
+    elif mock_skytraq:
+        logger.debug("Mocking the skytraq.")
+        skytraq = MockSkyTraq()
+    elif hw_version == "1.0":
+        skytraq = SkyTraq10(Path("/dev/ttyS2"))
+    elif hw_version == "1.1":
+        skytraq = SkyTraq11(Path("/dev/ttyS2"))
+    else:
+        logger.error("Invalid gps board version")
+        # attempt the latest anyway
+        skytraq = SkyTraq11(Path("/dev/ttyS2"))
+
+    if args.capture is not None:
+        skytraq.recorder = CaptureRecorder(args.capture)
+
+    archive = None if args.archive is None else FixArchiveWriter(args.archive)
+    clock = _clock_discipline(mock_skytraq=mock_skytraq)
+    policy = OverflowPolicy[args.overflow_policy.upper().replace("-", "_")]
+    reader = SkyTraqReader(skytraq, policy=policy)
+    gps_service = GpsService(skytraq, reader, archive, args.aiding_state, clock)
+    app.add_service(gps_service)
+
+    stream_port = args.port + 1 if args.stream_port is None else args.stream_port
+    stream_server = _serve_stream(gps_service, args.address, stream_port)
+    _add_routes(gps_service, None if stream_server is None else stream_server.server_address[1])
+    rest_api.add_template(str(files('oresat_gps') / 'templates' / 'skytraq.html'))
+
+    try:
+        olaf_run()
+    finally:
+        if stream_server is not None:
+            stream_server.shutdown()
+
+
+def _clock_discipline(*, mock_skytraq: bool) -> ClockDiscipline:
+    """Get the discipline for the system clock, it is only set from a real receiver as root."""
+    if mock_skytraq:
+        # mocked fixes aren't the time, only measure the clock against them
+        return ClockDiscipline()
+    if geteuid() != 0:
+        logger.warning("not running as root, cannot set system time to time from skytraq")
+        return ClockDiscipline()
+    return ClockDiscipline(step_clock, slew_clock)
+
+
+def _serve_stream(gps_service: GpsService, address: str, port: int) -> ThreadingHTTPServer | None:
+    """Serve the service's live stream, or None if it can't be, the app runs on without it."""
+    try:
+        return serve(gps_service.stream, address, port)
+    except OSError as e:
+        logger.warning(f"not serving the live stream, cannot listen on port {port}: {e}")
+        return None
+
+
+def _add_routes(gps_service: GpsService, stream_port: int | None) -> None:
+    """Add the routes that serve the page and the service's data.
+
+    stream_port is where the events are served, None if they aren't.
+    """
+
+    @rest_api.app.route("/skytraq")
+    def skytraq_template() -> str:
+        """Render skytraq webpage."""
+        return render_olaf_template("skytraq.html", name="SkyTraq")
+
+    @rest_api.app.route("/skytraq/metrics")
+    def skytraq_metrics() -> dict[str, Any]:
+        """Pipeline latency histograms and counters, as JSON."""
+        return gps_service.metrics()
+
+    @rest_api.app.route("/skytraq/history")
+    def skytraq_history() -> dict[str, Any]:
+        """Recent fixes as JSON, column by column.
+
+        Optional query args are start and end, the GPS time range in milliseconds since the GPS
+        epoch, and last, the number of newest fixes in that range.
+        """
+        history = gps_service.history
+        args = request.args
+        return {
+            "summary": history.summary()._asdict(),
+            "fixes": history.columns(
+                args.get("start", type=int), args.get("end", type=int), args.get("last", type=int)
+            ),
+        }
+
+    @rest_api.app.route("/skytraq/stream")
+    def skytraq_stream() -> Response:
+        """Redirect to the stream of status and navigation data as server-sent events.
+
+        The optional query arg rate is the most events per second to send, 1 by default. Events
+        published faster than that, or faster than the client reads them, are dropped for the
+        latest one.
+        """
+        if stream_port is None:
+            return Response("live stream unavailable", status=503)
+        host = urlsplit(request.host_url).hostname or "localhost"
+        if ":" in host:
+            host = f"[{host}]"
+        query = request.query_string.decode()
+        return redirect(f"http://{host}:{stream_port}/skytraq/stream?{query}", code=307)
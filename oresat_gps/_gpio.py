@@ -44,3 +44,8 @@ def request_gpio_output(
                 )
             },
         )
+
+
+def set_gpio_output(request: gpiod.LineRequest, *, active: bool) -> None:
+    """Drive the line of a request from `request_gpio_output()` active or inactive."""
+    request.set_value(request.offsets[0], Value.ACTIVE if active else Value.INACTIVE)
@@ -0,0 +1,116 @@
+"""Object dictionary entries added by the app at runtime.
+
+The card's OD comes from oresat-configs. Entries for app features that aren't in the card's config
+yet are added to it when the service starts, at the indexes after the ones the config uses.
+"""
+
+from typing import NamedTuple, cast
+
+from canopen import ObjectDictionary
+from canopen.objectdictionary import ODRecord, ODVariable, datatypes
+
+
+class Sub(NamedTuple):
+    """A subindex of a runtime OD record."""
+
+    name: str
+    data_type: int
+    access_type: str = "ro"
+    default: int | float | bool | bytes | str = 0
+    subindex: int | None = None
+    """Subindex, None for the one after the previous sub's"""
+
+
+def add_record(od: ObjectDictionary, index: int, name: str, subs: list[Sub]) -> ODRecord:
+    """Add a record to the OD, unless the card's config already has it.
+
+    Parameters
+    ----------
+    od
+        The OD to add to.
+    index
+        The index of the record.
+    name
+        The name of the record.
+    subs
+        The subindexes, numbered from 1 in order unless they give their own.
+
+    Returns
+    -------
+    ODRecord
+        The record.
+    """
+    if name in od:
+        return cast(ODRecord, od[name])
+
+    rec = ODRecord(name, index)
+    sub0 = ODVariable("highest_index_supported", index, 0)
+    sub0.access_type = "const"
+    sub0.data_type = datatypes.UNSIGNED8
+    rec.add_member(sub0)
+
+    subindex = 0
+    for sub in subs:
+        subindex = subindex + 1 if sub.subindex is None else sub.subindex
+        var = ODVariable(sub.name, index, subindex)
+        var.access_type = sub.access_type
+        var.data_type = sub.data_type
+        var.default = sub.default  # type: ignore[assignment]
+        var.value = sub.default  # type: ignore[assignment]
+        rec.add_member(var)
+    sub0.default = subindex
+    sub0.value = sub0.default
+
+    od.add_object(rec)
+    return rec
+
+
+def add_tpdo(od: ObjectDictionary, tpdo: int, mapped: list[ODVariable]) -> None:
+    """Add a TPDO to the OD, unless the card's config already has it.
+
+    It's set up like the config sets up its TPDOs, sent when the app sends it, at the node's
+    default COB-ID for the TPDO number: TPDOs 1 to 4 on the node's own ID, 5 to 8 on the ID plus
+    one and so on.
+
+    Parameters
+    ----------
+    od
+        The OD to add to.
+    tpdo
+        The TPDO number, 1 to 16.
+    mapped
+        The variables the TPDO maps, in order, 8 bytes at most.
+    """
+    n = tpdo - 1
+    cob_id = 0x180 + 0x100 * (n % 4) + cast(int, od.node_id) + n // 4
+    add_record(
+        od,
+        0x1800 + n,
+        f"tpdo_{tpdo}_communication_parameters",
+        [
+            Sub("cob_id", datatypes.UNSIGNED32, "const", cob_id),
+            Sub("transmission_type", datatypes.UNSIGNED8, "const", 0xFE),
+            Sub("inhibit_time", datatypes.UNSIGNED16, "const", 0),
+            Sub("event_timer", datatypes.UNSIGNED16, "rw", 0, subindex=5),
+            Sub("sync_start_value", datatypes.UNSIGNED8, "const", 0),
+        ],
+    )
+    add_record(
+        od,
+        0x1A00 + n,
+        f"tpdo_{tpdo}_mapping_parameters",
+        [
+            Sub(
+                f"mapping_object_{i}",
+                datatypes.UNSIGNED32,
+                "const",
+                var.index << 16
+                | var.subindex << 8
+                | var.STRUCT_TYPES[cast(int, var.data_type)].size * 8,
+            )
+            for i, var in enumerate(mapped, 1)
+        ],
+    )
+    # the node only runs the event timers of the TPDOs it's told it has
+    info = od.device_information
+    info.nr_of_TXPDO = max(info.nr_of_TXPDO or 0, tpdo)
@@ -0,0 +1,198 @@
+"""Receiver aiding state, kept across power cycles.
+
+The receiver forgets everything when it's powered down, so every power up would be a cold start.
+The last good fix, and the ephemeris queried from the receiver before it's powered down, are saved
+to a small state file. On power up the receiver is hot started with the time and the fix's position
+propagated to now (AN0037 system restart, 0x01), and the ephemeris is uploaded again (set GPS
+ephemeris, 0x41).
+
+The state file is a magic number, then the navigation data payload of the fix, the age of the
+ephemeris at the fix and the payload of each ephemeris, as the receiver sent them. It's written to
+a temporary file that's renamed over the old one, so a power loss leaves either the old state or
+the new.
+"""
+
+import os
+import struct
+from datetime import datetime, timezone
+from math import atan2, cos, degrees, hypot, sin, sqrt
+from pathlib import Path
+from typing import NamedTuple
+
+from .codec import MESSAGE_TYPES, GpsEphemeris, NavData
+from .gps_time import MS_PER_WEEK
+from .propagator import EARTH_RADIUS, Propagator
+
+MAGIC = b"STQAID\x00\x02"
+"""Start of every state file, the last byte is the format version"""
+MSG_ID_RESTART = 0x01
+MSG_ID_SET_EPHEMERIS = 0x41
+HOT_START = 0x01
+"""System restart start mode that keeps what the receiver knows and uses the aiding"""
+EPHEMERIS_MAX_AGE_MS = 4 * 3_600_000
+"""Oldest ephemeris to upload, GPS ephemerides are good for about 4 hours"""
+EPHEMERIS_REFRESH_MS = EPHEMERIS_MAX_AGE_MS // 2
+"""Age to query the receiver for a new ephemeris at, until then the saved one is kept"""
+POSITION_MAX_AGE = 2 * 3600.0
+"""Furthest to propagate the fix to, in seconds, the last fix's position is used past that"""
+
+_NAV_FMT = MESSAGE_TYPES[0xA8].fmt
+_EPHEMERIS_FMT = MESSAGE_TYPES[0xB1].fmt
+_EPHEMERIS_AGE = struct.Struct(">I")
+_RESTART = struct.Struct(">BHBBBBBhhh")
+"""Start mode, UTC date and time, latitude and longitude in 0.01 degrees and altitude in meters"""
+_FLATTENING = 1 / 298.257223563
+"""WGS 84 flattening"""
+_E2 = _FLATTENING * (2 - _FLATTENING)
+
+
+class AidingState(NamedTuple):
+    """What the receiver knew before it was powered down."""
+
+    nav_data: NavData
+    """Last good fix"""
+    ephemeris: tuple[GpsEphemeris, ...] = ()
+    """Ephemeris of each SV the receiver had one for"""
+    ephemeris_age_ms: int = 0
+    """Milliseconds from when the ephemeris was queried to the fix, 0 if queried with it"""
+
+
+def save_state(path: Path, state: AidingState) -> None:
+    """Save the aiding state, replacing the old state in one go.
+
+    Parameters
+    ----------
+    path
+        The state file, its directory is made if it doesn't exist.
+    state
+        The state to save.
+    """
+    data = MAGIC + _NAV_FMT.pack(*state.nav_data) + _EPHEMERIS_AGE.pack(state.ephemeris_age_ms)
+    data += b"".join(_EPHEMERIS_FMT.pack(*eph) for eph in state.ephemeris)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    tmp.replace(path)
+
+
+def load_state(path: Path) -> AidingState | None:
+    """Load the aiding state.
+
+    Parameters
+    ----------
+    path
+        The state file.
+
+    Returns
+    -------
+    AidingState | None
+        The state, or None if there's no state file.
+
+    Raises
+    ------
+    ValueError
+        The file isn't a state file or is cut short.
+    """
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return None
+    nav_end = len(MAGIC) + _NAV_FMT.size
+    ephemeris_start = nav_end + _EPHEMERIS_AGE.size
+    if not data.startswith(MAGIC) or len(data) < ephemeris_start:
+        raise ValueError(f"{path} is not an aiding state file")
+    if (len(data) - ephemeris_start) % _EPHEMERIS_FMT.size:
+        raise ValueError(f"{path} is cut short")
+    nav_data = NavData._make(_NAV_FMT.unpack_from(data, len(MAGIC)))
+    (age_ms,) = _EPHEMERIS_AGE.unpack_from(data, nav_end)
+    ephemeris = _EPHEMERIS_FMT.iter_unpack(data[ephemeris_start:])
+    return AidingState(nav_data, tuple(GpsEphemeris._make(e) for e in ephemeris), age_ms)
+
+
+def _geodetic(x: float, y: float, z: float) -> tuple[float, float, float]:
+    """Get the WGS 84 latitude and longitude in degrees and altitude in meters of an ECEF position.
+
+    Uses Bowring's formula, good to well under the 0.01 degrees the aiding is given in.
+    """
+    b = EARTH_RADIUS * (1 - _FLATTENING)
+    ep2 = _E2 / (1 - _E2)
+    p = hypot(x, y)
+    theta = atan2(z * EARTH_RADIUS, p * b)
+    lat = atan2(z + ep2 * b * sin(theta) ** 3, p - _E2 * EARTH_RADIUS * cos(theta) ** 3)
+    sin_lat = sin(lat)
+    alt = p * cos(lat) + z * sin_lat - EARTH_RADIUS * sqrt(1 - _E2 * sin_lat**2)
+    return degrees(lat), degrees(atan2(y, x)), alt
+
+
+def restart_body(nav_data: NavData, unix_ms: int, gps_ms: int) -> bytes:
+    """Get the body of a hot start system restart that aids the receiver with a fix.
+
+    Parameters
+    ----------
+    nav_data
+        The last good fix.
+    unix_ms
+        The time now, as Unix time in milliseconds.
+    gps_ms
+        The time now, as GPS time in milliseconds since the GPS epoch.
+
+    Returns
+    -------
+    bytes
+        The message body, with the time now and the fix's position propagated to now.
+    """
+    propagator = Propagator(step=10.0, blend=0.0, max_age=POSITION_MAX_AGE)
+    propagator.seed(nav_data)
+    state = propagator.state(gps_ms)
+    if state is not None:
+        lat, lon, alt = _geodetic(*state.position)
+    else:
+        lat, lon = nav_data.latitude / 1e7, nav_data.longitude / 1e7
+        alt = nav_data.ellipsoid_alt / 100
+    now = datetime.fromtimestamp(unix_ms / 1000, timezone.utc)
+    return _RESTART.pack(
+        HOT_START,
+        now.year,
+        now.month,
+        now.day,
+        now.hour,
+        now.minute,
+        now.second,
+        round(lat * 100),
+        round(lon * 100),
+        # clamped to what the message takes, in orbit that leaves the receiver the ground track
+        max(min(round(alt), 18_300), -1_000),
+    )
+
+
+def fresh_ephemeris(
+    state: AidingState, gps_ms: int, max_age_ms: int = EPHEMERIS_MAX_AGE_MS
+) -> tuple[GpsEphemeris, ...]:
+    """Get the ephemerides of a state that are still worth uploading.
+
+    Parameters
+    ----------
+    state
+        The saved state.
+    gps_ms
+        The time now, as GPS time in milliseconds since the GPS epoch.
+    max_age_ms
+        Oldest the ephemerides may be, in milliseconds.
+
+    Returns
+    -------
+    tuple[GpsEphemeris, ...]
+        The ephemerides, none if they were queried too long ago.
+    """
+    since_fix = gps_ms - (state.nav_data.gps_week * MS_PER_WEEK + state.nav_data.tow * 10)
+    if since_fix < 0 or since_fix + state.ephemeris_age_ms > max_age_ms:
+        return ()
+    return state.ephemeris
+
+
+def ephemeris_body(ephemeris: GpsEphemeris) -> bytes:
+    """Get the body of the set GPS ephemeris command that uploads an ephemeris."""
+    return _EPHEMERIS_FMT.pack(*ephemeris)[1:]
@@ -0,0 +1,312 @@
+"""Append-only, delta-encoded archive of navigation data.
+
+Fixes are written in blocks. Within a block each field is stored as a zigzag varint of its
+difference from the previous fix, or for the time, position and velocity, which change steadily in
+orbit, of the difference from the previous difference. A fix usually packs into 20 to 30 bytes
+instead of the 59 of the raw payload. The first fix of each block is stored
+against zero, so any block can be decoded on its own.
+
+The GPS time of the first and last fix and the file offset of each block go to a sparse index file
+next to the archive, so a read of a time range seeks straight to the first block it needs. The index
+can be rebuilt from the archive's block headers if it's lost.
+
+A fix earlier than the one before it, e.g. after a receiver reset, starts a new block, so the fixes
+of a block are always in time order. Blocks may still go back in time, and then a read checks each
+block's time range instead of seeking.
+"""
+
+import struct
+from bisect import bisect_right
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from .codec import NavData
+from .gps_time import MS_PER_WEEK
+
+MAGIC = b"STQARC\x00\x02"
+"""Start of every archive file, the last byte is the format version"""
+BLOCK_HEADER = struct.Struct(">qqHI")
+"""GPS time of the first and last fix in milliseconds, number of fixes and length of the encoded
+fixes"""
+INDEX_ENTRY = struct.Struct(">qqQ")
+"""GPS time of the first and last fix of a block in milliseconds and the block's offset"""
+INDEX_SUFFIX = ".idx"
+
+_SECOND_ORDER = frozenset(
+    {"tow", "latitude", "longitude", "ecef_x", "ecef_y", "ecef_z", "ecef_vx", "ecef_vy", "ecef_vz"}
+)
+_ORDERS = tuple(2 if name in _SECOND_ORDER else 1 for name in NavData._fields)
+"""Per field, 1 to store the delta from the previous fix, 2 to store the delta of the delta"""
+
+
+def _gps_ms(nav_data: NavData) -> int:
+    return nav_data.gps_week * MS_PER_WEEK + nav_data.tow * 10
+
+
+def _index_path(path: Path) -> Path:
+    return path.with_name(path.name + INDEX_SUFFIX)
+
+
+class FixArchiveWriter:
+    """Appends fixes to an archive file in delta-encoded blocks."""
+
+    def __init__(self, path: Path, block_size: int = 60) -> None:
+        """Open an archive for appending, creating it if it doesn't exist.
+
+        Parameters
+        ----------
+        path
+            The archive file, the index is written next to it.
+        block_size
+            Fixes per block. Larger blocks pack a little better, but a block is only written once
+            full or on `flush()`, so it's also how many fixes a power loss can cost.
+
+        Raises
+        ------
+        ValueError
+            The file exists and isn't an archive, or is one of another format version. It's left
+            as is.
+        """
+        if not 0 < block_size <= 0xFFFF:
+            raise ValueError("block_size must be from 1 to 65535")
+        if path.exists() and path.stat().st_size:
+            with path.open("rb") as f:
+                if f.read(len(MAGIC)) != MAGIC:
+                    raise ValueError(f"{path} is not a fix archive")
+        self.path = path
+        self._block_size = block_size
+        self._file: BinaryIO = path.open("ab")
+        self._index: BinaryIO = _index_path(path).open("ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+            self._index.truncate(0)
+        else:
+            # drop a block cut short by a power loss, appending after it would bury the next ones,
+            # and bring the index back in line with the blocks that are left
+            blocks = list(_scan_blocks(path, len(MAGIC)))
+            end = blocks[-1][3] if blocks else len(MAGIC)
+            self._file.truncate(end)
+            self._file.seek(end)
+            self._index.truncate(0)
+            for first_ms, last_ms, offset, _ in blocks:
+                self._index.write(INDEX_ENTRY.pack(first_ms, last_ms, offset))
+            self._index.flush()
+        self._body = bytearray()
+        self._count = 0
+        self._first_ms = self._last_ms = 0
+        self._prev = [0] * len(_ORDERS)
+        self._prev_delta = [0] * len(_ORDERS)
+        self.fixes = 0
+        """Number of fixes appended since opening"""
+
+    def append(self, nav_data: NavData) -> None:
+        """Add a fix, writing the block out if it's now full."""
+        gps_ms = _gps_ms(nav_data)
+        if self._count and gps_ms < self._last_ms:
+            # time went back, the block so far keeps its fixes in order
+            self._write_block()
+        if self._count == 0:
+            self._first_ms = gps_ms
+        self._last_ms = gps_ms
+        body = self._body
+        prev = self._prev
+        prev_delta = self._prev_delta
+        for i, value in enumerate(nav_data):
+            delta = value - prev[i]
+            prev[i] = value
+            if _ORDERS[i] == 2:
+                residual = delta - prev_delta[i]
+                prev_delta[i] = delta
+            else:
+                residual = delta
+            # zigzag then LEB128, so small negative residuals are small too
+            n = (residual << 1) ^ (residual >> 63)
+            while n >= 0x80:
+                body.append((n & 0x7F) | 0x80)
+                n >>= 7
+            body.append(n)
+        self._count += 1
+        self.fixes += 1
+        if self._count >= self._block_size:
+            self._write_block()
+
+    def _write_block(self) -> None:
+        offset = self._file.tell()
+        header = BLOCK_HEADER.pack(self._first_ms, self._last_ms, self._count, len(self._body))
+        self._file.write(header)
+        self._file.write(self._body)
+        self._file.flush()
+        self._index.write(INDEX_ENTRY.pack(self._first_ms, self._last_ms, offset))
+        self._index.flush()
+        self._body.clear()
+        self._count = 0
+        self._prev = [0] * len(_ORDERS)
+        self._prev_delta = [0] * len(_ORDERS)
+
+    def flush(self) -> None:
+        """Write out the fixes of a partly filled block, the next fix starts a new block."""
+        if self._count:
+            self._write_block()
+
+    def close(self) -> None:
+        """Flush and close the archive."""
+        self.flush()
+        self._file.close()
+        self._index.close()
+
+
+class FixArchiveReader:
+    """Reads fixes back out of an archive."""
+
+    def __init__(self, path: Path) -> None:
+        """Open an archive.
+
+        Parameters
+        ----------
+        path
+            The archive file. If its index is missing, behind or doesn't match the archive, it's
+            rebuilt from the archive.
+
+        Raises
+        ------
+        ValueError
+            The file isn't an archive.
+        """
+        self.path = path
+        with path.open("rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a fix archive")
+        self._firsts: list[int] = []
+        self._lasts: list[int] = []
+        self._offsets: list[int] = []
+        self._load_index()
+        # each block after the last fix of the one before, so a time range can be bisected
+        self._ordered = all(
+            first >= last for first, last in zip(self._firsts[1:], self._lasts, strict=False)
+        )
+
+    def _load_index(self) -> None:
+        index_path = _index_path(self.path)
+        data = index_path.read_bytes() if index_path.exists() else b""
+        # drop an entry cut short by a power loss
+        data = data[: len(data) - len(data) % INDEX_ENTRY.size]
+        for first_ms, last_ms, offset in INDEX_ENTRY.iter_unpack(data):
+            self._add_block(first_ms, last_ms, offset)
+
+        # pick up any blocks the index is missing, or all of them without an index
+        offset = len(MAGIC)
+        if self._offsets:
+            last = next(_scan_blocks(self.path, self._offsets[-1]), None)
+            if last is None or last[:2] != (self._firsts[-1], self._lasts[-1]):
+                # the index isn't of the archive as it is now, rebuild it from the block headers
+                self._firsts.clear()
+                self._lasts.clear()
+                self._offsets.clear()
+            else:
+                offset = last[3]
+        for first_ms, last_ms, block_offset, _ in _scan_blocks(self.path, offset):
+            self._add_block(first_ms, last_ms, block_offset)
+
+    def _add_block(self, first_ms: int, last_ms: int, offset: int) -> None:
+        self._firsts.append(first_ms)
+        self._lasts.append(last_ms)
+        self._offsets.append(offset)
+
+    def __len__(self) -> int:
+        """Return the number of blocks."""
+        return len(self._offsets)
+
+    def __iter__(self) -> Iterator[NavData]:
+        """Iterate over every fix."""
+        return self.read()
+
+    def read(self, start_ms: int | None = None, end_ms: int | None = None) -> Iterator[NavData]:
+        """Stream the fixes in a GPS time range, in the order they were archived.
+
+        Parameters
+        ----------
+        start_ms
+            Start of the range, inclusive, in milliseconds since the GPS epoch. None for the first.
+        end_ms
+            End of the range, exclusive, in milliseconds since the GPS epoch. None for the last.
+
+        Yields
+        ------
+        NavData
+            The fixes.
+        """
+        first = 0
+        if start_ms is not None and self._ordered:
+            first = max(bisect_right(self._firsts, start_ms) - 1, 0)
+        with self.path.open("rb") as f:
+            for block in range(first, len(self._offsets)):
+                if end_ms is not None and self._firsts[block] >= end_ms:
+                    if self._ordered:
+                        return
+                    continue
+                if start_ms is not None and self._lasts[block] < start_ms:
+                    continue
+                f.seek(self._offsets[block])
+                header = f.read(BLOCK_HEADER.size)
+                _, _, count, body_len = BLOCK_HEADER.unpack(header)
+                body = f.read(body_len)
+                if len(body) < body_len:
+                    return  # cut short by a power loss
+                for nav_data in _decode_block(body, count):
+                    gps_ms = _gps_ms(nav_data)
+                    if start_ms is not None and gps_ms < start_ms:
+                        continue
+                    if end_ms is not None and gps_ms >= end_ms:
+                        break
+                    yield nav_data
+
+
+def _scan_blocks(path: Path, offset: int) -> Iterator[tuple[int, int, int, int]]:
+    """Walk the block headers of an archive.
+
+    Parameters
+    ----------
+    path
+        The archive file.
+    offset
+        Offset of the block to start at.
+
+    Yields
+    ------
+    tuple[int, int, int, int]
+        The GPS time of the first and last fix, the offset and the end offset of each complete
+        block.
+    """
+    size = path.stat().st_size
+    with path.open("rb") as f:
+        while offset + BLOCK_HEADER.size <= size:
+            f.seek(offset)
+            first_ms, last_ms, _, body_len = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+            end = offset + BLOCK_HEADER.size + body_len
+            if end > size:
+                return
+            yield first_ms, last_ms, offset, end
+            offset = end
+
+
+def _decode_block(body: bytes, count: int) -> Iterator[NavData]:
+    prev = [0] * len(_ORDERS)
+    prev_delta = [0] * len(_ORDERS)
+    pos = 0
+    for _ in range(count):
+        for i in range(len(_ORDERS)):
+            n = shift = 0
+            while True:
+                byte = body[pos]
+                pos += 1
+                n |= (byte & 0x7F) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            residual = (n >> 1) ^ -(n & 1)
+            if _ORDERS[i] == 2:
+                residual += prev_delta[i]
+                prev_delta[i] = residual
+            prev[i] += residual
+        yield NavData._make(prev)
@@ -0,0 +1,196 @@
+"""asyncio SkyTraq serial driver.
+
+The serial port is opened non-blocking and its file descriptor is registered with the event loop,
+so one process can serve the receiver alongside other coroutines without a thread per blocking
+read. Framing and decoding are shared with the blocking `SkyTraq` driver.
+"""
+
+import asyncio
+from collections import deque
+from pathlib import Path
+
+from loguru import logger
+from serial import Serial, SerialException
+
+from .codec import Ack, FrameDecoder, Message, Nack, SkyTraqError
+from .skytraq import SkyTraq
+
+
+class AsyncSkyTraq:
+    """asyncio SkyTraq serial driver.
+
+    Messages are read with `await read()` or `async for msg in skytraq`. ACKs and NACKs for
+    commands sent with `send_command()` go to the waiting command instead.
+    """
+
+    def __init__(self, port: Path, queue_size: int = 32) -> None:
+        """Create an AsyncSkyTraq instance associated with a specific serial interface.
+
+        Parameters
+        ----------
+        port
+            Serial port to use.
+        queue_size
+            The most unread messages to hold, the oldest is dropped when a reader falls behind.
+        """
+        self._port = port
+        self._ser: Serial | None = None
+        self._decoder = FrameDecoder(SkyTraq.MAX_PAYLOAD_LEN)
+        # None marks the end of the stream on disconnect
+        self._messages: asyncio.Queue[Message | None] = asyncio.Queue(queue_size)
+        self._pending: dict[int, deque[asyncio.Future[Ack | Nack]]] = {}
+        self.dropped = 0
+        """Number of messages dropped because nobody was reading them"""
+
+    async def connect(self) -> None:
+        """Connect to the Skytraq receiver serial interface and swap it to binary mode.
+
+        Raises
+        ------
+        SkyTraqError
+            Error initializing the SkyTraq
+        """
+        try:
+            self._ser = Serial(str(self._port), SkyTraq.BAUD, timeout=0)
+        except SerialException as e:
+            raise SkyTraqError(f"Error opening {self._port}") from e
+        self._ser.reset_input_buffer()
+        self._decoder.clear()
+        asyncio.get_running_loop().add_reader(self._ser.fileno(), self._on_readable)
+
+        # like the blocking driver, the first binary mode command is not always taken
+        for _ in range(2):
+            try:
+                reply = await self.send_command(0x09, b"\x02\x00", timeout=0.5)
+            except SkyTraqError:
+                continue
+            if isinstance(reply, Ack):
+                return
+        self.disconnect()
+        raise SkyTraqError("Binary mode not acknowledged")
+
+    def disconnect(self) -> None:
+        """Disconnect from the Skytraq receiver serial interface.
+
+        Commands still waiting on an ACK are cancelled and message iteration stops.
+        """
+        if self._ser is None:
+            return
+        asyncio.get_running_loop().remove_reader(self._ser.fileno())
+        self._ser.close()
+        self._ser = None
+        for waiters in self._pending.values():
+            for fut in waiters:
+                fut.cancel()
+        self._pending.clear()
+        self._enqueue(None)
+
+    @property
+    def is_connected(self) -> bool:
+        """Status of the Skytraq serial interface."""
+        return self._ser is not None and self._ser.is_open
+
+    @property
+    def last_packet(self) -> bytes:
+        """bytes: The raw payload (message id and body) of the last message received."""
+        return self._decoder.last_packet
+
+    async def send_command(self, msg_id: int, body: bytes, timeout: float = 1) -> Ack | Nack:
+        """Send a command and wait for its ACK or NACK.
+
+        Messages that arrive in the meantime are still delivered to readers.
+
+        Parameters
+        ----------
+        msg_id
+            The command message ID.
+        body
+            The command message body.
+        timeout
+            How long to wait for the ACK or NACK, in seconds.
+
+        Returns
+        -------
+        Ack | Nack
+            The receiver's reply.
+
+        Raises
+        ------
+        SkyTraqError
+            Not connected, or no ACK or NACK arrived in time.
+        """
+        if self._ser is None:
+            raise SkyTraqError("Not connected")
+        fut: asyncio.Future[Ack | Nack] = asyncio.get_running_loop().create_future()
+        waiters = self._pending.setdefault(msg_id, deque())
+        waiters.append(fut)
+        try:
+            self._ser.write(SkyTraq.encode_binary(msg_id, body))
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError as e:
+            raise SkyTraqError(f"No ACK or NACK for {msg_id:#x}") from e
+        except SerialException as e:
+            raise SkyTraqError("Error writing GPS line") from e
+        finally:
+            if fut in waiters:
+                waiters.remove(fut)
+
+    async def read(self) -> Message:
+        """Wait for the next message that isn't a command reply.
+
+        Raises
+        ------
+        SkyTraqError
+            Disconnected while waiting.
+        """
+        msg = await self._messages.get()
+        if msg is None:
+            raise SkyTraqError("Disconnected")
+        return msg
+
+    def __aiter__(self) -> "AsyncSkyTraq":
+        """Iterate over messages until disconnected."""
+        return self
+
+    async def __anext__(self) -> Message:
+        """Wait for the next message."""
+        try:
+            return await self.read()
+        except SkyTraqError:
+            raise StopAsyncIteration from None
+
+    def _on_readable(self) -> None:
+        if self._ser is None:
+            return
+        try:
+            chunk = self._ser.read(self._ser.in_waiting or 1)
+        except SerialException as e:
+            logger.error(f"Error reading GPS line: {e}")
+            self.disconnect()
+            return
+        self._decoder.feed(chunk)
+        while True:
+            try:
+                msg = self._decoder.next_message()
+            except SkyTraqError as e:
+                logger.debug(e)
+                continue
+            if msg is None:
+                break
+            self._dispatch(msg)
+
+    def _dispatch(self, msg: Message) -> None:
+        if isinstance(msg, (Ack, Nack)):
+            waiters = self._pending.get(msg.ack_id)
+            while waiters:
+                fut = waiters.popleft()
+                if not fut.done():
+                    fut.set_result(msg)
+                    return
+        self._enqueue(msg)
+
+    def _enqueue(self, msg: Message | None) -> None:
+        if self._messages.full():
+            self._messages.get_nowait()
+            self.dropped += 1
+        self._messages.put_nowait(msg)
@@ -0,0 +1,147 @@
+"""Raw SkyTraq byte stream capture files.
+
+A capture file is a magic number followed by the chunks of bytes read from the serial port, each
+with a header of the Unix time it was read at and its length. Captures are rotated by size so a
+recorder can be left running on the card, and are read back memory-mapped for replay.
+"""
+
+import mmap
+import struct
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from time import gmtime, strftime, time
+from typing import BinaryIO
+
+from loguru import logger
+
+MAGIC = b"STQCAP\x00\x01"
+"""Start of every capture file, the last byte is the format version"""
+CHUNK_HEADER = struct.Struct(">dI")
+"""Unix time the chunk was read at and its length"""
+SUFFIX = ".cap"
+
+
+class CaptureRecorder:
+    """Appends timestamped raw chunks to size-rotated capture files in a directory."""
+
+    def __init__(
+        self, directory: Path, max_file_size: int = 16 * 1024 * 1024, max_files: int = 8
+    ) -> None:
+        """Create a recorder, the first file isn't opened until the first chunk.
+
+        Parameters
+        ----------
+        directory
+            Directory to put the capture files in, created if it doesn't exist.
+        max_file_size
+            Size in bytes after which a new file is started.
+        max_files
+            Most capture files to keep in the directory, the oldest are deleted on rotation. 0 to
+            keep them all.
+        """
+        if max_file_size <= len(MAGIC) + CHUNK_HEADER.size:
+            raise ValueError("max_file_size is too small to hold a chunk")
+        self._directory = directory
+        self._max_file_size = max_file_size
+        self._max_files = max_files
+        self._file: BinaryIO | None = None
+        self._size = 0
+        self._seq = 0
+        self.path: Path | None = None
+        """The capture file being written to"""
+
+    def write(self, chunk: bytes, timestamp: float | None = None) -> None:
+        """Append a chunk, rotating to a new file first if this one is full.
+
+        Parameters
+        ----------
+        chunk
+            The raw bytes.
+        timestamp
+            Unix time the chunk was read at, defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time()
+        size = CHUNK_HEADER.size + len(chunk)
+        f = self._file
+        if f is None or self._size + size > self._max_file_size:
+            f = self._rotate(timestamp)
+        f.write(CHUNK_HEADER.pack(timestamp, len(chunk)))
+        f.write(chunk)
+        self._size += size
+
+    def flush(self) -> None:
+        """Flush what's been written to the current file."""
+        if self._file is not None:
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the current file, the next write starts a new one."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _rotate(self, timestamp: float) -> BinaryIO:
+        self.close()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        stamp = strftime("%Y%m%dT%H%M%S", gmtime(timestamp))
+        self.path = self._directory / f"skytraq-{stamp}-{self._seq:04d}{SUFFIX}"
+        self._seq += 1
+        self._file = self.path.open("wb")
+        self._file.write(MAGIC)
+        self._size = len(MAGIC)
+        logger.info(f"capturing SkyTraq data to {self.path}")
+
+        if self._max_files > 0:
+            for old in capture_files(self._directory)[: -self._max_files]:
+                old.unlink()
+        return self._file
+
+
+def capture_files(path: Path) -> list[Path]:
+    """Get the capture files at a path, in the order they were recorded.
+
+    Parameters
+    ----------
+    path
+        A capture file, or a directory of them.
+    """
+    if path.is_dir():
+        return sorted(path.glob(f"*{SUFFIX}"))
+    return [path]
+
+
+def read_captures(paths: Iterable[Path]) -> Iterator[tuple[float, bytes]]:
+    """Read the chunks out of capture files, memory-mapped.
+
+    A partial chunk at the end of a file, e.g. from the card losing power mid-write, is ignored.
+
+    Parameters
+    ----------
+    paths
+        Capture files, read in order.
+
+    Yields
+    ------
+    tuple[float, bytes]
+        The Unix time each chunk was read at and the chunk.
+
+    Raises
+    ------
+    ValueError
+        A file isn't a capture file.
+    """
+    for path in paths:
+        with path.open("rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a capture file")
+            size = f.seek(0, 2)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                offset = len(MAGIC)
+                while offset + CHUNK_HEADER.size <= size:
+                    timestamp, length = CHUNK_HEADER.unpack_from(mm, offset)
+                    offset += CHUNK_HEADER.size
+                    if offset + length > size:
+                        break
+                    yield timestamp, mm[offset : offset + length]
+                    offset += length
@@ -0,0 +1,176 @@
+"""System clock discipline.
+
+The system clock is compared to the GPS time of each fix at the moment the fix's first byte arrived,
+so the serial transfer, decoding and queueing don't count against it. The offsets are filtered in
+windows: the serial port can only make a fix seem to arrive late, never early, so the smallest
+offset of a window is the least delayed one and the one used.
+
+The clock is stepped once, to the first fix, and from then on the filtered offset is handed to the
+kernel's PLL with `adjtimex()`, which slews the clock to it and learns the clock's drift, unless
+the offset has grown too big to slew, when the clock is stepped again.
+"""
+
+import ctypes
+import ctypes.util
+from collections.abc import Callable
+from math import sqrt
+from time import CLOCK_REALTIME, clock_gettime, clock_settime
+
+ADJ_OFFSET = 0x0001
+ADJ_MAXERROR = 0x0004
+ADJ_ESTERROR = 0x0008
+ADJ_STATUS = 0x0010
+ADJ_TIMECONST = 0x0020
+STA_PLL = 0x0001
+
+PLL_TIME_CONSTANT = 0
+"""The kernel PLL's time constant, the quickest, to follow offsets every few seconds"""
+MAX_SLEW = 0.128
+"""Largest offset to slew out, in seconds, a bigger one is stepped like ntpd does"""
+
+
+class _Timex(ctypes.Structure):
+    """The kernel's struct timex, see adjtimex(2)."""
+
+    _fields_ = (
+        ("modes", ctypes.c_uint),
+        ("offset", ctypes.c_long),
+        ("freq", ctypes.c_long),
+        ("maxerror", ctypes.c_long),
+        ("esterror", ctypes.c_long),
+        ("status", ctypes.c_int),
+        ("constant", ctypes.c_long),
+        ("precision", ctypes.c_long),
+        ("tolerance", ctypes.c_long),
+        ("time_sec", ctypes.c_long),
+        ("time_usec", ctypes.c_long),
+        ("tick", ctypes.c_long),
+        ("ppsfreq", ctypes.c_long),
+        ("jitter", ctypes.c_long),
+        ("shift", ctypes.c_int),
+        ("stabil", ctypes.c_long),
+        ("jitcnt", ctypes.c_long),
+        ("calcnt", ctypes.c_long),
+        ("errcnt", ctypes.c_long),
+        ("stbcnt", ctypes.c_long),
+        ("tai", ctypes.c_int),
+        ("_reserved", ctypes.c_int * 11),
+    )
+
+
+_libc: ctypes.CDLL | None = None
+
+
+def _adjtimex(timex: _Timex) -> None:
+    global _libc  # noqa: PLW0603
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    if _libc.adjtimex(ctypes.byref(timex)) < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, f"adjtimex failed: {errno}")
+
+
+def step_clock(offset: float) -> None:
+    """Step the system clock.
+
+    Parameters
+    ----------
+    offset
+        Seconds the clock is ahead by, negative if behind.
+    """
+    clock_settime(CLOCK_REALTIME, clock_gettime(CLOCK_REALTIME) - offset)
+
+
+def slew_clock(offset: float, jitter: float) -> None:
+    """Hand an offset to the kernel PLL, to slew the system clock by.
+
+    Parameters
+    ----------
+    offset
+        Seconds the clock is ahead by, negative if behind, at most `MAX_SLEW`.
+    jitter
+        Estimated error of the offset, in seconds.
+    """
+    us = round(offset * 1e6)
+    _adjtimex(
+        _Timex(
+            modes=ADJ_OFFSET | ADJ_STATUS | ADJ_TIMECONST | ADJ_MAXERROR | ADJ_ESTERROR,
+            offset=-us,
+            # also clears STA_UNSYNC, the clock is synchronized
+            status=STA_PLL,
+            constant=PLL_TIME_CONSTANT,
+            maxerror=abs(us) + round(jitter * 1e6),
+            esterror=round(jitter * 1e6),
+        )
+    )
+
+
+class ClockDiscipline:
+    """Keeps the system clock on GPS time."""
+
+    def __init__(
+        self,
+        step: Callable[[float], None] | None = None,
+        slew: Callable[[float, float], None] | None = None,
+        window: int = 8,
+    ) -> None:
+        """Create a clock discipline.
+
+        Parameters
+        ----------
+        step
+            Steps the clock by an offset, e.g. `step_clock()`. None to only measure the offset.
+        slew
+            Slews the clock by an offset with a jitter, e.g. `slew_clock()`. None to only step.
+        window
+            Offsets to filter down to one, the clock is adjusted once per window.
+        """
+        if window < 1:
+            raise ValueError("window must be at least 1")
+        self._step = step
+        self._slew = slew
+        self._window_size = window
+        self._window: list[float] = []
+        self.synced = False
+        """The clock has been stepped to GPS time"""
+        self.offset: float | None = None
+        """Last filtered offset of the clock from GPS time, in seconds, None until a window is in"""
+        self.jitter = 0.0
+        """RMS of the last window's offsets from the filtered one, in seconds"""
+        self.steps = 0
+        """Number of times the clock was stepped"""
+
+    def add(self, offset: float) -> None:
+        """Add an offset of the clock from GPS time, adjusting the clock if a window is in.
+
+        Parameters
+        ----------
+        offset
+            Seconds the clock was ahead of the GPS time of a fix, negative if behind.
+        """
+        step = self._step
+        if not self.synced and step is not None:
+            self._do_step(step, offset)
+            return
+
+        window = self._window
+        window.append(offset)
+        if len(window) < self._window_size:
+            return
+        best = min(window)
+        self.offset = best
+        self.jitter = sqrt(sum((o - best) ** 2 for o in window) / len(window))
+        window.clear()
+        if step is None:
+            return
+        if abs(best) > MAX_SLEW or self._slew is None:
+            self._do_step(step, best)
+        else:
+            self._slew(best, self.jitter)
+
+    def _do_step(self, step: Callable[[float], None], offset: float) -> None:
+        step(offset)
+        self._window.clear()
+        self.offset = offset
+        self.synced = True
+        self.steps += 1
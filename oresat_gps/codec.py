@@ -0,0 +1,687 @@
+"""SkyTraq binary protocol codec.
+
+Framing, checksum and message layouts of the SkyTraq binary protocol (AN0037), kept free of the
+serial port, GPIO and OLAF so captures can also be decoded off the card.
+"""
+
+import struct
+from array import array
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from enum import Enum, unique
+from functools import lru_cache
+from time import perf_counter_ns
+from typing import TYPE_CHECKING, Any, NamedTuple
+
+if TYPE_CHECKING:
+    from .metrics import Histogram
+
+BINARY_START = b'\xa0\xa1'
+"""SkyTraq binary message start bytes"""
+BINARY_END = b'\x0d\x0a'
+"""SkyTraq binary message end bytes"""
+
+
+class NavData(NamedTuple):
+    '''Raw Navigation data returned from a SkyTraq.'''
+
+    message_id: int
+    fix_mode: int
+    number_of_sv: int
+    gps_week: int
+    tow: int
+    latitude: int
+    longitude: int
+    ellipsoid_alt: int
+    mean_sea_lvl_alt: int
+    gdop: int
+    pdop: int
+    hdop: int
+    vdop: int
+    tdop: int
+    ecef_x: int
+    ecef_y: int
+    ecef_z: int
+    ecef_vx: int
+    ecef_vy: int
+    ecef_vz: int
+
+
+class SoftwareVersion(NamedTuple):
+    """Software version (0x80), reply to a version query."""
+
+    message_id: int
+    software_type: int
+    kernel_version: int
+    odm_version: int
+    revision: int
+
+
+class SoftwareCrc(NamedTuple):
+    """Software CRC (0x81), reply to a CRC query."""
+
+    message_id: int
+    software_type: int
+    crc: int
+
+
+class Ack(NamedTuple):
+    """ACK (0x83) for a previously sent command."""
+
+    message_id: int
+    ack_id: int
+
+
+class Nack(NamedTuple):
+    """NACK (0x84) for a previously sent command."""
+
+    message_id: int
+    ack_id: int
+
+
+class PositionUpdateRate(NamedTuple):
+    """Position update rate (0x86) in Hz, reply to a rate query."""
+
+    message_id: int
+    update_rate: int
+
+
+class GnssDatum(NamedTuple):
+    """GNSS datum (0xAE), reply to a datum query."""
+
+    message_id: int
+    datum_index: int
+
+
+class DopMask(NamedTuple):
+    """GNSS DOP mask (0xAF), reply to a DOP mask query."""
+
+    message_id: int
+    dop_mode: int
+    pdop: int
+    hdop: int
+    gdop: int
+
+
+class ElevationCnrMask(NamedTuple):
+    """GNSS elevation and CNR mask (0xB0), reply to a mask query."""
+
+    message_id: int
+    mode: int
+    elevation_mask: int
+    cnr_mask: int
+
+
+class GpsEphemeris(NamedTuple):
+    """GPS ephemeris (0xB1) for one SV, reply to an ephemeris query.
+
+    The subframes are kept as the raw 87 bytes (3 x subframe id + 28 bytes), which is also the
+    layout the receiver expects when the ephemeris is uploaded again.
+    """
+
+    message_id: int
+    sv_id: int
+    subframes: bytes
+
+
+class PositionPinningStatus(NamedTuple):
+    """GNSS position pinning status (0xB4), reply to a pinning query."""
+
+    message_id: int
+    status: int
+    pinning_speed: int
+    pinning_count: int
+    unpinning_speed: int
+    unpinning_count: int
+    unpinning_distance: int
+
+
+class PowerModeStatus(NamedTuple):
+    """GNSS power mode status (0xB9), reply to a power mode query."""
+
+    message_id: int
+    power_mode: int
+
+
+class PpsCableDelay(NamedTuple):
+    """1PPS cable delay (0xBB) in 0.01 ns, reply to a cable delay query."""
+
+    message_id: int
+    cable_delay: int
+
+
+class MeasTime(NamedTuple):
+    """Measurement time (0xDC), sent at the start of each raw measurement epoch."""
+
+    message_id: int
+    iod: int
+    week_number: int
+    tow: int
+    measurement_period: int
+
+
+class RcvState(NamedTuple):
+    """Receiver navigation state (0xDF), part of the raw measurement output."""
+
+    message_id: int
+    iod: int
+    navigation_state: int
+    week_number: int
+    tow: float
+    ecef_x: float
+    ecef_y: float
+    ecef_z: float
+    ecef_vx: float
+    ecef_vy: float
+    ecef_vz: float
+    clock_bias: float
+    clock_drift: float
+    gdop: float
+    pdop: float
+    hdop: float
+    vdop: float
+    tdop: float
+
+
+class GpsSubframe(NamedTuple):
+    """GPS subframe (0xE0), one raw navigation subframe as broadcast by an SV."""
+
+    message_id: int
+    sv_id: int
+    subframe_id: int
+    words: bytes
+
+
+class GpsTime(NamedTuple):
+    """GPS time (0x64 0x8E), reply to a GPS time query, carries the receiver's leap seconds."""
+
+    message_id: int
+    sub_id: int
+    tow_ms: int
+    tow_ns: int
+    week_number: int
+    default_leap_seconds: int
+    current_leap_seconds: int
+    valid: int
+    """Bitfield, bit 0 TOW valid, bit 1 week number valid, bit 2 current leap seconds valid"""
+
+
+class RawMeas(NamedTuple):
+    """Raw measurements (0xDD), part of the raw measurement output.
+
+    The per-channel fields are columns, one array entry per channel, in the order the receiver sent
+    them.
+    """
+
+    message_id: int
+    iod: int
+    """Issue of data, matches the `MeasTime` of the same epoch"""
+    nmeas: int
+    """Number of channels"""
+    sv_id: array
+    cn0: array
+    """Carrier to noise ratio in dBHz"""
+    pseudorange: array
+    """Pseudorange in meters"""
+    carrier_phase: array
+    """Accumulated carrier phase in cycles"""
+    doppler: array
+    """Doppler frequency in Hz"""
+    indicator: array
+    """Bitfield, bit 0 pseudorange valid, bit 1 doppler valid, bit 2 carrier phase valid, bit 3
+    cycle slip possible, bit 4 coherent integration time over 10 ms"""
+
+
+class SvChStatus(NamedTuple):
+    """SV and channel status (0xDE), part of the raw measurement output.
+
+    The per-channel fields are columns, one array entry per channel, in the order the receiver sent
+    them.
+    """
+
+    message_id: int
+    iod: int
+    """Issue of data, matches the `MeasTime` of the same epoch"""
+    nsvs: int
+    """Number of channels"""
+    channel_id: array
+    sv_id: array
+    sv_status: array
+    """Bitfield, bit 0 almanac received, bit 1 ephemeris received, bit 2 healthy"""
+    ura: array
+    """User range accuracy index"""
+    cn0: array
+    """Carrier to noise ratio in dBHz"""
+    elevation: array
+    """Elevation in degrees"""
+    azimuth: array
+    """Azimuth in degrees"""
+    channel_status: array
+    """Bitfield, bit 0 pull-in done, bit 1 bit sync done, bit 2 frame sync done, bit 3 ephemeris
+    received, bit 4 used in the fix"""
+
+
+Message = (
+    SoftwareVersion
+    | SoftwareCrc
+    | Ack
+    | Nack
+    | PositionUpdateRate
+    | NavData
+    | GnssDatum
+    | DopMask
+    | ElevationCnrMask
+    | GpsEphemeris
+    | PositionPinningStatus
+    | PowerModeStatus
+    | PpsCableDelay
+    | MeasTime
+    | RcvState
+    | GpsSubframe
+    | GpsTime
+    | RawMeas
+    | SvChStatus
+)
+"""Any decoded SkyTraq output message"""
+
+
+class MessageType(NamedTuple):
+    """How to decode one SkyTraq output message."""
+
+    fmt: struct.Struct
+    """Precompiled layout of the payload, message id included"""
+    make: Callable[[Iterable[Any]], Message]
+    """Builds the message from the unpacked fields"""
+    variable_len: bool = False
+    """Payload may be longer than fmt, e.g. an ACK with a sub-id, the extra bytes are ignored"""
+    channel: str = ""
+    """Layout of a block repeated once per channel after fmt, one struct character per field, the
+    last field of fmt is the number of blocks. Each field is decoded into an array column."""
+
+
+MESSAGE_TYPES: dict[int, MessageType] = {
+    0x80: MessageType(struct.Struct(">2B3I"), SoftwareVersion._make),
+    0x81: MessageType(struct.Struct(">2BH"), SoftwareCrc._make),
+    0x83: MessageType(struct.Struct(">2B"), Ack._make, variable_len=True),
+    0x84: MessageType(struct.Struct(">2B"), Nack._make, variable_len=True),
+    0x86: MessageType(struct.Struct(">2B"), PositionUpdateRate._make),
+    0xA8: MessageType(struct.Struct(">3BHI2i2I5H6i"), NavData._make),
+    0xAE: MessageType(struct.Struct(">BH"), GnssDatum._make),
+    0xAF: MessageType(struct.Struct(">2B3H"), DopMask._make),
+    0xB0: MessageType(struct.Struct(">4B"), ElevationCnrMask._make),
+    0xB1: MessageType(struct.Struct(">BH87s"), GpsEphemeris._make),
+    0xB4: MessageType(struct.Struct(">2B5H"), PositionPinningStatus._make),
+    0xB9: MessageType(struct.Struct(">2B"), PowerModeStatus._make),
+    0xBB: MessageType(struct.Struct(">Bi"), PpsCableDelay._make),
+    0xDC: MessageType(struct.Struct(">2BHIH"), MeasTime._make),
+    0xDF: MessageType(struct.Struct(">3BH4d3fdf5f"), RcvState._make),
+    0xE0: MessageType(struct.Struct(">3B30s"), GpsSubframe._make),
+    0xDD: MessageType(struct.Struct(">3B"), RawMeas._make, channel="BBddfB"),
+    0xDE: MessageType(struct.Struct(">3B"), SvChStatus._make, channel="BBBBbhhB"),
+    0x648E: MessageType(struct.Struct(">2B2IH2bB"), GpsTime._make),
+}
+"""Decoders for the AN0037 output messages, keyed on message id, or for the message ids in
+`SUB_ID_MESSAGES` on message id and sub-id as (id << 8) | sub-id"""
+
+SUB_ID_MESSAGES = frozenset({0x64})
+"""Message ids whose payload is told apart by a sub-id byte after the message id"""
+
+
+_HEADER = struct.Struct(">2sHB")
+"""Start of sequence, payload length and message id"""
+
+
+@lru_cache(maxsize=128)
+def _channel_struct(channel: str, count: int) -> struct.Struct:
+    """Get the precompiled layout of count repeated channel blocks."""
+    return struct.Struct(">" + channel * count)
+
+
+def unpack_channels(msg_type: MessageType, payload: bytes | bytearray | memoryview) -> Message:
+    """Decode a message with a block per channel into columns.
+
+    Every block is unpacked by a single struct call and the flat result is sliced into one array
+    per field, no tuple is made per channel.
+
+    Parameters
+    ----------
+    msg_type
+        The message type, with a channel layout.
+    payload
+        The payload, message id included.
+
+    Returns
+    -------
+    Message
+        The decoded message.
+
+    Raises
+    ------
+    SkyTraqError
+        The payload doesn't hold exactly the number of blocks in its header.
+    """
+    header = msg_type.fmt.unpack_from(payload)
+    channel = msg_type.channel
+    count = header[-1]
+    blocks = _channel_struct(channel, count)
+    if len(payload) != msg_type.fmt.size + blocks.size:
+        raise SkyTraqError(
+            f"Invalid length {len(payload)} for message {header[0]:#x} with {count} channels"
+        )
+    flat = blocks.unpack_from(payload, msg_type.fmt.size)
+    step = len(channel)
+    # the struct characters used for channel fields are also array typecodes
+    return msg_type.make((*header, *(array(c, flat[i::step]) for i, c in enumerate(channel))))
+
+
+_FOLD_MASKS = tuple((1 << (8 << i)) - 1 for i in range(17))
+"""Masks for the low 1, 2, 4, ... 65536 bytes of an int, used by the checksum"""
+
+
+class SkyTraqError(Exception):
+    """An error occurred with the SkyTraq."""
+
+
+@unique
+class FixMode(Enum):
+    """Quality of fix."""
+
+    NO_FIX = 0
+    FIX_2D = 1
+    FIX_3D = 2
+    FIX_3D_DGPS = 3
+
+
+def checksum(payload: bytes | bytearray | memoryview) -> int:
+    """XOR all payload bytes together.
+
+    Rather than a Python-level call per byte, the payload is turned into one big int and
+    folded in half until a single byte is left, so the work is done by a handful of wide
+    XORs in C.
+    """
+    n = int.from_bytes(payload, byteorder="little")
+    i = (len(payload) - 1).bit_length()
+    while i:
+        i -= 1
+        n = (n >> (8 << i)) ^ (n & _FOLD_MASKS[i])
+    return n
+
+
+def encode_binary_into(
+    buf: bytearray | memoryview, offset: int, message_id: int, body: bytes
+) -> int:
+    """Encode a message ID and body straight into a preallocated buffer.
+
+    Parameters
+    ----------
+    buf
+        The buffer to write to, must have len(body) + 8 bytes free from offset.
+    offset
+        Where in the buffer to start the message.
+    message_id
+        The message ID.
+    body
+        The message body.
+
+    Returns
+    -------
+    int
+        The number of bytes written.
+
+    Raises
+    ------
+    OverflowError
+        If message_id > 1 byte or body > 65534 bytes. SkyTraq limits total
+        payload size to 65535 bytes (id + body).
+    """
+    if not 0 <= message_id <= 0xFF:
+        raise OverflowError(f"message id {message_id} does not fit in 1 byte")
+    if len(body) > 0xFFFE:
+        raise OverflowError(f"message body of {len(body)} bytes is too long")
+    # <0xA0,0xA1><PL><Message ID><Message Body><CS><0x0D,0x0A>
+    end = offset + len(body) + 8
+    _HEADER.pack_into(buf, offset, BINARY_START, len(body) + 1, message_id)
+    buf[offset + 5 : end - 3] = body
+    buf[end - 3] = message_id ^ checksum(body)
+    buf[end - 2 : end] = BINARY_END
+    return end - offset
+
+
+def encode_binary(message_id: int, body: bytes) -> bytes:
+    """Encode a message ID and body into a SkyTraq binary message.
+
+    Parameters
+    ----------
+    message_id
+        The message ID.
+    body
+        The message body.
+
+    Returns
+    -------
+    bytes
+        The encoded message.
+
+    Raises
+    ------
+    OverflowError
+        If message_id > 1 byte or body > 65534 bytes. SkyTraq limits total
+        payload size to 65535 bytes (id + body).
+    """
+    buf = bytearray(len(body) + 8)
+    encode_binary_into(buf, 0, message_id, body)
+    return bytes(buf)
+
+
+class FrameDecoder:
+    """Incremental SkyTraq binary message decoder.
+
+    Bytes are fed in as arbitrary chunks, e.g. everything the serial port has waiting, and
+    complete messages are pulled back out one at a time. A frame with a bad length, terminator or
+    checksum is treated as a false start: only its start of sequence is discarded and the search
+    for the next one continues in the data already buffered, so a corrupt frame never costs the
+    frame behind it.
+
+    Messages are unpacked in place from the receive buffer. The raw payload of the last frame
+    stays in the buffer and is only copied out when `last_packet` is asked for.
+
+    Chunks can be fed with the time they were read at, to get the time the first byte of each
+    frame arrived at. The bytes of a chunk are taken to have arrived back to back at the line rate,
+    the last one just before the read, so the time doesn't depend on where a frame is split across
+    reads or on how long it is.
+    """
+
+    def __init__(self, max_payload_len: int = 0xFFFF) -> None:
+        """Create a decoder.
+
+        Parameters
+        ----------
+        max_payload_len
+            The longest payload to accept, a length field above this is treated as corrupt.
+        """
+        self._buf = bytearray()
+        self._pos = 0
+        self._max_payload_len = max_payload_len
+        # payload of the last valid frame, as offsets into _buf and/or as a copy once made
+        self._last_start = 0
+        self._last_end = 0
+        self._last_raw: bytes | None = None
+        # stream offset of the start of _buf, and the stream offset of the end of each timed chunk
+        # still buffered with the time it was read at
+        self._base = 0
+        self._marks: deque[tuple[int, float]] = deque()
+        self.byte_time = 0.0
+        """Seconds to receive a byte, to work back from the time a chunk was read at to its bytes"""
+        self.last_received: float | None = None
+        """Time the first byte of the last frame was received at, None if its chunk wasn't timed"""
+        self.resyncs = 0
+        """Number of false starts skipped over"""
+        self.bytes_discarded = 0
+        """Number of bytes thrown away outside of valid frames"""
+        self.checksum_failures = 0
+        """Number of otherwise complete frames with a bad checksum, also counted as resyncs"""
+        self.checksum_timer: Histogram | None = None
+        """Optional histogram to time the checksum of each complete frame in"""
+
+    def clear(self) -> None:
+        """Drop any buffered data."""
+        self._base += len(self._buf)
+        self._marks.clear()
+        self._buf.clear()
+        self._pos = 0
+        self._last_start = 0
+        self._last_end = 0
+        self._last_raw = None
+
+    def feed(self, data: bytes, received: float | None = None) -> None:
+        """Add received bytes to the decoder.
+
+        Parameters
+        ----------
+        data
+            Bytes in the order they were received, may start or end mid-frame.
+        received
+            Optional time the bytes were read at, in seconds on any clock, see `last_received`.
+        """
+        # compact once per chunk rather than once per frame, holding on to the last frame unless
+        # it has already been copied out or is so far behind that keeping it would grow the buffer
+        keep = self._pos
+        if self._last_end and self._last_raw is None:
+            if self._pos - self._last_end > self._max_payload_len:
+                self._last_raw = bytes(self._buf[self._last_start : self._last_end])
+            else:
+                keep = self._last_start
+        if keep:
+            del self._buf[:keep]
+            self._base += keep
+            self._pos -= keep
+            self._last_start = max(self._last_start - keep, 0)
+            self._last_end = max(self._last_end - keep, 0)
+        self._buf += data
+        if received is not None:
+            # the next frame starts at _pos or later, the chunks before it aren't needed
+            marks = self._marks
+            consumed = self._base + self._pos
+            while marks and marks[0][0] <= consumed:
+                marks.popleft()
+            marks.append((self._base + len(self._buf), received))
+
+    @property
+    def last_packet(self) -> bytes:
+        """bytes: The payload (message id and body) of the last valid frame."""
+        if self._last_raw is None:
+            self._last_raw = bytes(self._buf[self._last_start : self._last_end])
+        return self._last_raw
+
+    def _next_payload(self) -> int:
+        """Find the next complete, valid frame and make it the last frame.
+
+        Returns
+        -------
+        int
+            Offset of the payload in the buffer or -1 if no complete frame is buffered yet.
+        """
+        buf = self._buf
+        while True:
+            start = buf.find(BINARY_START, self._pos)
+            if start < 0:
+                # hold on to a trailing 0xa0, it may be the first half of a start of sequence
+                end = len(buf) - 1 if buf.endswith(BINARY_START[:1]) else len(buf)
+                if end > self._pos:
+                    self.bytes_discarded += end - self._pos
+                    self._pos = end
+                return -1
+            self.bytes_discarded += start - self._pos
+            self._pos = start
+
+            if len(buf) - start < 4:
+                return -1
+            payload_len = (buf[start + 2] << 8) | buf[start + 3]
+            if not 0 < payload_len <= self._max_payload_len:
+                self._skip_false_start()
+                continue
+            end = start + payload_len + 7
+            if len(buf) < end:
+                return -1
+            if buf[end - 2 : end] != BINARY_END:
+                self._skip_false_start()
+                continue
+            timer = self.checksum_timer
+            t0 = perf_counter_ns() if timer is not None else 0
+            with memoryview(buf) as view:
+                csum = checksum(view[start + 4 : end - 3])
+            if timer is not None:
+                timer.observe(perf_counter_ns() - t0)
+            if buf[end - 3] != csum:
+                self.checksum_failures += 1
+                self._skip_false_start()
+                continue
+            self._pos = end
+            self._last_start = start + 4
+            self._last_end = end - 3
+            self._last_raw = None
+            self.last_received = self._received_at(self._base + start) if self._marks else None
+            return start + 4
+
+    def _received_at(self, offset: int) -> float | None:
+        """Get the time the byte at a stream offset was received at."""
+        for end, received in self._marks:
+            if end > offset:
+                return received - (end - 1 - offset) * self.byte_time
+        return None
+
+    def _skip_false_start(self) -> None:
+        self.resyncs += 1
+        self.bytes_discarded += len(BINARY_START)
+        self._pos += len(BINARY_START)
+
+    def next_frame(self) -> bytes | None:
+        """Pull the next complete, valid message out of the buffered data, undecoded.
+
+        Returns
+        -------
+        bytes | None
+            The payload (message id and body) or None if no complete message is buffered yet.
+        """
+        if self._next_payload() < 0:
+            return None
+        return self.last_packet
+
+    def next_message(self) -> Message | None:
+        """Pull the next complete, valid and known message out of the buffered data.
+
+        Messages with an id that isn't in `MESSAGE_TYPES` are skipped.
+
+        Returns
+        -------
+        Message | None
+            The decoded message or None if no complete known message is buffered yet.
+
+        Raises
+        ------
+        SkyTraqError
+            A known message has the wrong length. The frame is consumed all the same.
+        """
+        while (start := self._next_payload()) >= 0:
+            msg_id = self._buf[start]
+            if msg_id in SUB_ID_MESSAGES and self._last_end - start > 1:
+                msg_id = (msg_id << 8) | self._buf[start + 1]
+            msg_type = MESSAGE_TYPES.get(msg_id)
+            if msg_type is None:
+                continue
+            fmt = msg_type.fmt
+            payload_len = self._last_end - start
+            fixed_len = not (msg_type.variable_len or msg_type.channel)
+            if payload_len < fmt.size or (payload_len > fmt.size and fixed_len):
+                raise SkyTraqError(f"Invalid length {payload_len} for message {msg_id:#x}")
+            with memoryview(self._buf) as view:
+                if msg_type.channel:
+                    with view[start : self._last_end] as payload:
+                        return unpack_channels(msg_type, payload)
+                return msg_type.make(fmt.unpack_from(view, start))
+        return None
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Iterate over every complete message currently buffered, undecoded."""
+        while (frame := self.next_frame()) is not None:
+            yield frame
@@ -0,0 +1,298 @@
+"""Offline bulk decoder for SkyTraq capture files.
+
+Decodes the capture files recorded with `--capture` to CSV or NumPy `.npz` on the ground, with no
+OLAF, CAN bus or card hardware libraries needed. Each file is streamed through the decoder a chunk
+at a time and files are decoded in parallel by a pool of processes.
+
+Every message type found gets its own table, written next to the other outputs as
+`<capture>.<message>.csv` or `<capture>.<message>.npz`, e.g. `skytraq-...-0000.nav_data.csv`. Each
+row has the Unix time the chunk that finished the message was read at, then the message's fields.
+Messages with a block per channel, like raw measurements, get a row per channel with the epoch's
+fields repeated. In `.npz` files each column is an array named after its field, in the same type
+as the message's payload, so no NumPy is needed to write them.
+
+Run with `oresat-gps-decode` or `python -m oresat_gps.decode`.
+"""
+
+import csv
+import re
+import struct
+import sys
+import zipfile
+from argparse import ArgumentParser
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import repeat
+from os import cpu_count
+from pathlib import Path
+from typing import Any, NamedTuple, TextIO, cast
+
+from .capture import capture_files, read_captures
+from .codec import MESSAGE_TYPES, FrameDecoder, Message, MessageType, SkyTraqError
+
+FORMATS = ("csv", "npz")
+
+
+class DecodeResult(NamedTuple):
+    """Outcome of decoding one capture file."""
+
+    path: Path
+    """The capture file"""
+    messages: dict[str, int]
+    """Number of messages decoded, by table name"""
+    invalid: int
+    """Known messages with a bad length"""
+    checksum_failures: int
+    bytes_discarded: int
+    outputs: list[Path]
+    """Files written"""
+
+
+def _table_name(cls: type) -> str:
+    """Get the table name of a message class, e.g. nav_data for NavData."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", cls.__name__).lower()
+
+
+def _field_codes(msg_type: MessageType) -> list[str]:
+    """Get the array typecode of each field of a message, or the struct code of a bytes field."""
+    codes = []
+    for count, code in re.findall(r"(\d*)([a-zA-Z])", msg_type.fmt.format):
+        if code == "s":
+            codes.append(f"{count}s")
+        else:
+            codes += [code] * int(count or 1)
+    return codes + list(msg_type.channel)
+
+
+class _Layout(NamedTuple):
+    name: str
+    fields: tuple[str, ...]
+    codes: list[str]
+    channel_fields: int
+    """Number of trailing fields that are per-channel columns"""
+
+
+def _layouts() -> dict[type, _Layout]:
+    layouts = {}
+    for msg_type in MESSAGE_TYPES.values():
+        # each message type's make is its NamedTuple's _make, so the class is what it's bound to
+        cls = msg_type.make.__self__  # type: ignore[attr-defined]
+        layouts[cls] = _Layout(
+            _table_name(cls), cls._fields, _field_codes(msg_type), len(msg_type.channel)
+        )
+    return layouts
+
+
+_LAYOUTS = _layouts()
+
+
+class _Table:
+    """Columns of one message type."""
+
+    def __init__(self, layout: _Layout) -> None:
+        self.layout = layout
+        self.columns: list[array | list[bytes]] = [array("d")]
+        self.columns += [[] if code.endswith("s") else array(code) for code in layout.codes]
+
+    def append(self, timestamp: float, msg: Message) -> None:
+        n_channel = self.layout.channel_fields
+        if not n_channel:
+            for column, value in zip(self.columns, (timestamp, *msg), strict=True):
+                column.append(value)
+            return
+        channels = cast("tuple[array, ...]", msg[-n_channel:])
+        rows = len(channels[0])
+        for column, value in zip(self.columns, (timestamp, *msg[:-n_channel]), strict=False):
+            column.extend(repeat(value, rows))
+        for column, values in zip(self.columns[-n_channel:], channels, strict=True):
+            column.extend(values)
+
+
+def _npy(column: array | list[bytes], code: str) -> bytes:
+    """Encode a column as a NumPy .npy file."""
+    if isinstance(column, list):
+        descr = f"|S{code[:-1]}"
+        data = b"".join(column)
+    else:
+        kind = "f" if code in "fd" else ("i" if code.islower() else "u")
+        order = "|" if column.itemsize == 1 else ("<" if sys.byteorder == "little" else ">")
+        descr = f"{order}{kind}{column.itemsize}"
+        data = column.tobytes()
+    header = f"{{'descr': '{descr}', 'fortran_order': False, 'shape': ({len(column)},), }}"
+    # magic, version 1.0 and the header length, then the header padded so the data is aligned
+    pad = -(10 + len(header) + 1) % 64
+    return (
+        b"\x93NUMPY\x01\x00"
+        + struct.pack("<H", len(header) + pad + 1)
+        + header.encode()
+        + b" " * pad
+        + b"\n"
+        + data
+    )
+
+
+class _NpzTables:
+    """A .npz file per message type, the columns are held until the capture is decoded.
+
+    Capture files are rotated by size, so this is bounded by how big a capture file can get.
+    """
+
+    def __init__(self, output: Path, stem: str) -> None:
+        self._output = output
+        self._stem = stem
+        self._tables: dict[type, _Table] = {}
+
+    def append(self, timestamp: float, msg: Message) -> None:
+        table = self._tables.get(type(msg))
+        if table is None:
+            table = self._tables[type(msg)] = _Table(_LAYOUTS[type(msg)])
+        table.append(timestamp, msg)
+
+    def close(self) -> list[Path]:
+        paths = []
+        for table in self._tables.values():
+            path = self._output / f"{self._stem}.{table.layout.name}.npz"
+            codes = ["d", *table.layout.codes]
+            fields = ("timestamp", *table.layout.fields)
+            with zipfile.ZipFile(path, "w") as npz:
+                for field, code, column in zip(fields, codes, table.columns, strict=True):
+                    npz.writestr(f"{field}.npy", _npy(column, code))
+            paths.append(path)
+        return paths
+
+
+class _CsvTables:
+    """A CSV file per message type, rows are written as messages are decoded."""
+
+    def __init__(self, output: Path, stem: str) -> None:
+        self._output = output
+        self._stem = stem
+        self._files: dict[type, tuple[TextIO, Any]] = {}
+        self._paths: list[Path] = []
+
+    def append(self, timestamp: float, msg: Message) -> None:
+        layout = _LAYOUTS[type(msg)]
+        entry = self._files.get(type(msg))
+        if entry is None:
+            path = self._output / f"{self._stem}.{layout.name}.csv"
+            f = path.open("w", newline="")
+            writer = csv.writer(f)
+            writer.writerow(("timestamp", *layout.fields))
+            entry = self._files[type(msg)] = (f, writer)
+            self._paths.append(path)
+        writer = entry[1]
+        n_channel = layout.channel_fields
+        if not n_channel:
+            writer.writerow((timestamp, *(v.hex() if isinstance(v, bytes) else v for v in msg)))
+            return
+        channels = cast("tuple[array, ...]", msg[-n_channel:])
+        header = (repeat(v, len(channels[0])) for v in (timestamp, *msg[:-n_channel]))
+        writer.writerows(zip(*header, *channels, strict=False))
+
+    def close(self) -> list[Path]:
+        for f, _ in self._files.values():
+            f.close()
+        return self._paths
+
+
+def decode_file(path: Path, output: Path, fmt: str = "csv") -> DecodeResult:
+    """Decode every known message in a capture file into tables.
+
+    Parameters
+    ----------
+    path
+        The capture file.
+    output
+        Directory to write the tables to.
+    fmt
+        "csv" or "npz".
+
+    Returns
+    -------
+    DecodeResult
+        What was decoded and written.
+
+    Raises
+    ------
+    ValueError
+        The file isn't a capture file, or fmt isn't known.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format {fmt}")
+    tables = (_CsvTables if fmt == "csv" else _NpzTables)(output, path.stem)
+    decoder = FrameDecoder()
+    counts: dict[str, int] = {}
+    invalid = 0
+    try:
+        for timestamp, chunk in read_captures([path]):
+            decoder.feed(chunk)
+            while True:
+                try:
+                    msg = decoder.next_message()
+                except SkyTraqError:
+                    invalid += 1
+                    continue
+                if msg is None:
+                    break
+                name = _LAYOUTS[type(msg)].name
+                counts[name] = counts.get(name, 0) + 1
+                tables.append(timestamp, msg)
+    finally:
+        outputs = tables.close()
+    return DecodeResult(
+        path, counts, invalid, decoder.checksum_failures, decoder.bytes_discarded, outputs
+    )
+
+
+def _decode_or_error(path: Path, output: Path, fmt: str) -> DecodeResult | str:
+    """Decode a capture file, or get why it couldn't be, so one bad file doesn't stop the rest."""
+    try:
+        return decode_file(path, output, fmt)
+    except (OSError, ValueError) as e:
+        return f"{path}: {e}"
+
+
+def main(argv: list[str] | None = None) -> None:
+    """Decode capture files from the command line."""
+    parser = ArgumentParser(description="Decode SkyTraq capture files to CSV or NumPy .npz.")
+    parser.add_argument("paths", nargs="+", type=Path, help="capture files or directories of them")
+    parser.add_argument(
+        "-o", "--output", type=Path, default=Path(), help="directory to write the tables to"
+    )
+    parser.add_argument("-f", "--format", choices=FORMATS, default="csv", help="output format")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=cpu_count() or 1,
+        help="files to decode in parallel, defaults to the number of CPUs",
+    )
+    args = parser.parse_args(argv)
+
+    paths = [p for path in args.paths for p in capture_files(path)]
+    args.output.mkdir(parents=True, exist_ok=True)
+    decode = partial(_decode_or_error, output=args.output, fmt=args.format)
+    failed = False
+    with ProcessPoolExecutor(max(min(args.jobs, len(paths)), 1)) as pool:
+        # decode in the process when there's nothing to parallelize, e.g. for a single file
+        results = (
+            pool.map(decode, paths) if args.jobs > 1 and len(paths) > 1 else map(decode, paths)
+        )
+        for result in results:
+            if isinstance(result, str):
+                failed = True
+                print(result, file=sys.stderr)  # noqa: T201
+                continue
+            messages = ", ".join(f"{n} {name}" for name, n in sorted(result.messages.items()))
+            print(  # noqa: T201
+                f"{result.path}: {messages or 'no messages'}, {result.invalid} invalid, "
+                f"{result.checksum_failures} checksum failures, "
+                f"{result.bytes_discarded} bytes discarded"
+            )
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Duty-cycled fix on demand.
+
+Instead of streaming, the receiver is powered up once an interval, left on until it has a fix good
+enough to use or the cycle times out, and powered down again. Only the accepted fix of each cycle
+is published. How long each cycle took to get its fix, the time to first fix (TTFF), is tracked to
+tune the interval against: the longer the receiver is off, the staler its almanac and ephemeris.
+"""
+
+from collections.abc import Callable
+from typing import NamedTuple
+
+from .codec import FixMode, NavData
+
+
+class DutyCycleStats(NamedTuple):
+    """Outcome of the cycles so far, times to first fix in milliseconds, 0 if none yet."""
+
+    cycles: int
+    """Cycles started"""
+    fixes: int
+    """Cycles that got a fix"""
+    timeouts: int
+    """Cycles that timed out without one"""
+    ttff_last: int
+    ttff_min: int
+    ttff_max: int
+    ttff_mean: int
+
+
+class DutyCycle:
+    """Powers the receiver up for a fix once an interval."""
+
+    def __init__(self, power_on: Callable[[], None], power_off: Callable[[], None]) -> None:
+        """Create a duty cycle, off until an interval is set.
+
+        Parameters
+        ----------
+        power_on
+            Powers up and connects to the receiver.
+        power_off
+            Powers down the receiver.
+        """
+        self._power_on = power_on
+        self._power_off = power_off
+        self._interval = 0
+        self.timeout = 120
+        """Seconds to wait for a fix before giving up on a cycle"""
+        self.min_sv = 4
+        """Fewest satellites in a fix to accept it"""
+        self.max_pdop = 500
+        """Largest PDOP of a fix to accept it, in the 0.01 units of the navigation data"""
+        self.min_fix_mode = FixMode.FIX_3D.value
+        """Lowest fix mode to accept, a `FixMode` value"""
+        self._next_start = 0.0
+        self._started: float | None = None
+        self._fixed = False
+        self._cycles = self._fixes = self._timeouts = 0
+        self._ttff_last = self._ttff_min = self._ttff_max = self._ttff_total = 0
+
+    @property
+    def interval(self) -> int:
+        """Seconds from the start of one cycle to the next, 0 if not duty cycling."""
+        return self._interval
+
+    def set_interval(self, interval: int, now: float) -> None:
+        """Start or stop duty cycling.
+
+        Parameters
+        ----------
+        interval
+            Seconds from the start of one cycle to the next, 0 to stop once the cycle in progress,
+            if any, is over. The receiver is then left off until powered up some other way.
+        now
+            `time.monotonic()` time, the first cycle starts straight away.
+        """
+        self._interval = interval
+        self._next_start = now
+
+    @property
+    def acquiring(self) -> bool:
+        """A cycle is in progress and has yet to get its fix."""
+        return self._started is not None and not self._fixed
+
+    def poll(self, now: float) -> None:
+        """Start or end a cycle when it's time, should be called from the service loop.
+
+        Parameters
+        ----------
+        now
+            `time.monotonic()` time.
+        """
+        if self._started is not None:
+            if not self._fixed and now - self._started < self.timeout:
+                return
+            if not self._fixed:
+                self._timeouts += 1
+            self._power_off()
+            # skip the cycles missed to a long timeout rather than running them back to back
+            self._next_start = max(self._started + self._interval, now)
+            self._started = None
+        elif self._interval and now >= self._next_start:
+            self._cycles += 1
+            self._started = now
+            self._fixed = False
+            self._power_on()
+
+    def on_fix(self, nav_data: NavData, now: float) -> bool:
+        """Check a fix against the thresholds, it ends the cycle if it passes.
+
+        Parameters
+        ----------
+        nav_data
+            The fix.
+        now
+            `time.monotonic()` time it arrived at.
+
+        Returns
+        -------
+        bool
+            Publish the fix, always when not duty cycling, otherwise if it's the cycle's fix.
+        """
+        started = self._started
+        if started is None:
+            return not self._interval
+        if self._fixed or not (
+            nav_data.number_of_sv >= self.min_sv
+            and nav_data.pdop <= self.max_pdop
+            and nav_data.fix_mode >= self.min_fix_mode
+        ):
+            return False
+        ttff = round((now - started) * 1000)
+        self._fixed = True
+        self._fixes += 1
+        self._ttff_last = ttff
+        self._ttff_min = min(self._ttff_min, ttff) if self._fixes > 1 else ttff
+        self._ttff_max = max(self._ttff_max, ttff)
+        self._ttff_total += ttff
+        return True
+
+    def stats(self) -> DutyCycleStats:
+        """Get the outcome of the cycles so far."""
+        return DutyCycleStats(
+            self._cycles,
+            self._fixes,
+            self._timeouts,
+            self._ttff_last,
+            self._ttff_min,
+            self._ttff_max,
+            self._ttff_total // self._fixes if self._fixes else 0,
+        )
@@ -3,16 +3,65 @@
 Reads the GPS data stream from SkyTraq and puts the data into the OD.
 """
 
-from datetime import datetime, timedelta, timezone
 from enum import Enum, unique
-from os import geteuid
-from time import CLOCK_REALTIME, clock_settime
-from typing import cast
+from functools import partial
+from pathlib import Path
+from threading import Event
+from time import monotonic, perf_counter_ns, time
+from typing import Any, cast
 
-from canopen.objectdictionary import ODRecord, ODVariable
-from olaf import NetworkError, Service, logger
+from canopen.objectdictionary import ODRecord, ODVariable, datatypes
+from olaf import Service, logger
 
-from .skytraq import FixMode, SkyTraq, SkyTraqError
+from ._od import Sub, add_record, add_tpdo
+from .aiding import (
+    EPHEMERIS_REFRESH_MS,
+    MSG_ID_RESTART,
+    MSG_ID_SET_EPHEMERIS,
+    AidingState,
+    ephemeris_body,
+    fresh_ephemeris,
+    load_state,
+    restart_body,
+    save_state,
+)
+from .archive import FixArchiveWriter
+from .clock import ClockDiscipline
+from .codec import Ack, FixMode, GpsTime, Message, NavData, SkyTraqError
+from .duty_cycle import DutyCycle, DutyCycleStats
+from .gps_time import MS_PER_WEEK, LeapSeconds, ms_since_midnight
+from .history import FixHistory, HistorySummary
+from .metrics import PipelineMetrics
+from .propagator import Propagator, Readout, State
+from .reader import SkyTraqReader
+from .skytraq import SkyTraq
+from .stream import FrameStream
+from .tpdo import TpdoScheduler
+
+FIX_TPDOS = (3, 4, 5, 6)
+"""TPDOs with the time and ECEF position and velocity of each fix"""
+STATUS_TPDO = 7
+"""TPDO with the status, number of SVs, fix mode and time syncd flag"""
+STATS_COUNTERS = ("checksum_failures", "resyncs", "bytes_discarded", "nacks")
+"""Link counters mirrored in the skytraq_stats record"""
+READER_COUNTERS = ("messages_dropped", "read_errors")
+"""Messages the reader's ring dropped and failed reads, in the skytraq_stats record"""
+PROPAGATED_FIELDS = ("ecef_x", "ecef_y", "ecef_z", "ecef_vx", "ecef_vy", "ecef_vz")
+"""Fields of the skytraq_propagated record, in the units of the skytraq record"""
+PROPAGATED_READ_FIELDS = (*PROPAGATED_FIELDS, "age", "time_since_midnight")
+"""Read-only fields of the skytraq_propagated record"""
+PROPAGATED_TPDOS = {
+    8: ("time_since_midnight", "age"),
+    9: ("ecef_x", "ecef_y"),
+    10: ("ecef_z", "ecef_vx"),
+    11: ("ecef_vy", "ecef_vz"),
+}
+"""TPDOs of the propagated state and the skytraq_propagated fields each maps, the fix TPDOs only
+carry fixes"""
+CLOCK_FIELDS = ("offset_us", "jitter_us", "steps")
+"""Read-only fields of the skytraq_clock record"""
+DUTY_CYCLE_CONFIG = ("timeout", "min_sv", "max_pdop", "min_fix_mode")
+"""Thresholds and timeout of the skytraq_duty_cycle record, set on the `DutyCycle` as is"""
 
 
 @unique
@@ -28,33 +77,394 @@ class GpsState(Enum):
 class GpsService(Service):
     """GPS SkyTraq Service."""
 
-    def __init__(self, gps: SkyTraq) -> None:
+    def __init__(
+        self,
+        gps: SkyTraq,
+        reader: SkyTraqReader | None = None,
+        archive: FixArchiveWriter | None = None,
+        aiding_path: Path | None = None,
+        clock: ClockDiscipline | None = None,
+    ) -> None:
+        """Create the service.
+
+        Parameters
+        ----------
+        gps
+            The SkyTraq to read from.
+        reader
+            Optional reader thread for the SkyTraq. Without one, the SkyTraq is read directly from
+            the service loop.
+        archive
+            Optional archive to log every fix to.
+        aiding_path
+            File to keep the receiver's aiding state in across power cycles, defaults to
+            skytraq_aiding in the app's work directory.
+        clock
+            Disciplines the system clock to the fixes. Defaults to one that only measures the
+            clock's offset, the clock is only ever set when given a discipline that sets it.
+        """
         super().__init__()
         self._skytraq = gps
+        self._reader = reader
+        self._archive = archive
+        self._aiding_path = aiding_path
+        self._aiding_state: AidingState | None = None
+        self._last_fix: NavData | None = None
         self._state = GpsState.OFF
+        self._reconfigure = Event()
+        self._receiver_rate = 1
+
+        self._leap_seconds = LeapSeconds()
+        self.history = FixHistory()
+        """Recent fixes"""
+        self.propagator = Propagator()
+        """Propagates the last fix to times between fixes"""
+        self._propagated_readout = Readout(self._propagate_readout)
+        self.stream = FrameStream()
+        """Live status and navigation data for the /skytraq page"""
+        self.duty_cycle = DutyCycle(self._skytraq_power_on, self._skytraq_power_off)
+        """Powers the SkyTraq up for a fix once an interval, when set"""
 
-        if geteuid() != 0:
-            logger.warning("not running as root, cannot set system time to time from skytraq")
+        self.clock = ClockDiscipline() if clock is None else clock
+        """Disciplines the system clock to the fixes, or only measures its offset"""
+        self._output_delay = 0.0
 
     def on_start(self) -> None:
         self.node.add_sdo_callbacks("status", None, self._on_read, self._on_write)
+        # the raw packet is only copied out of the receive buffer when someone reads it
+        self.node.add_sdo_callbacks("skytraq", "last_packet", self._on_last_packet_read, None)
 
         # Dealing with the ObjectDictionary type annotations is really quite annoying, there's
         # got to be a better way than casting my problems away.
         self._is_syncd = cast(ODVariable, self.node.od["time_syncd"])
         self._skytraq_rec = cast(ODRecord, self.node.od["skytraq"])
 
+        self._config_rec = add_record(
+            self.node.od,
+            0x4003,
+            "skytraq_config",
+            [
+                # 0 keeps whatever rate the receiver powers up with
+                Sub("update_rate", datatypes.UNSIGNED8, "rw", 0),
+                Sub("baud", datatypes.UNSIGNED32, "rw", SkyTraq.BAUD),
+            ],
+        )
+        self.node.add_sdo_callbacks("skytraq_config", "update_rate", None, self._on_config_write)
+        self.node.add_sdo_callbacks("skytraq_config", "baud", None, self._on_config_write)
+
+        # milliseconds from power on to each startup step of the last power cycle, 0 if not yet
+        self._startup_rec = add_record(
+            self.node.od,
+            0x4004,
+            "skytraq_startup",
+            [
+                Sub("uart_alive", datatypes.UNSIGNED32),
+                Sub("binary_mode", datatypes.UNSIGNED32),
+                Sub("first_fix", datatypes.UNSIGNED32),
+                Sub("binary_mode_attempts", datatypes.UNSIGNED8),
+            ],
+        )
+        self._first_fix_recorded = False
+
+        self._stats_rec = add_record(
+            self.node.od,
+            0x4005,
+            "skytraq_stats",
+            [
+                Sub("od_writes_per_sec", datatypes.UNSIGNED32),
+                Sub("tpdo_send_errors", datatypes.UNSIGNED32),
+                *(Sub(name, datatypes.UNSIGNED32) for name in STATS_COUNTERS),
+                *(Sub(name, datatypes.UNSIGNED32) for name in READER_COUNTERS),
+                # 95th percentile of each pipeline stage, in microseconds
+                *(Sub(f"{stage}_p95_us", datatypes.UNSIGNED32) for stage in PipelineMetrics.STAGES),
+            ],
+        )
+        self._metrics = self._skytraq.metrics
+        self._od_writes = 0
+        self._od_writes_since = monotonic()
+        # failed reads when there's no reader to count them
+        self._read_errors = 0
+
+        # resolve the OD variables once, as (NavData field index, variable), skipping message_id
+        self._nav_vars = tuple(
+            (i, cast(ODVariable, self._skytraq_rec[name]))
+            for i, name in enumerate(NavData._fields)
+            if name != "message_id"
+        )
+        self._fix_mode_index = NavData._fields.index("fix_mode")
+        self._time_since_midnight_var = cast(ODVariable, self._skytraq_rec["time_since_midnight"])
+        # last value written to each NavData field / time_since_midnight, to skip unchanged ones
+        self._written: list[int | None] = [None] * len(NavData._fields)
+        self._written_ms_since_midnight: int | None = None
+
+        # counted here, only copied into the OD when someone reads it
+        self._packet_count = 0
+        self.node.add_sdo_callbacks("skytraq", "packet_count", self._on_packet_count_read, None)
+
+        self._tpdos = TpdoScheduler(self.node.send_tpdo, self._is_bus_up)
+        # fixes per send of each fix TPDO, 0 sends about once a second whatever the update rate
+        tpdo_rec = add_record(
+            self.node.od,
+            0x4006,
+            "skytraq_tpdo",
+            [Sub(f"tpdo_{tpdo}_divisor", datatypes.UNSIGNED8, "rw", 0) for tpdo in FIX_TPDOS],
+        )
+        for tpdo in FIX_TPDOS:
+            name = f"tpdo_{tpdo}_divisor"
+            self._tpdos.set_divisor(tpdo, cast(int, tpdo_rec[name].value))
+            self.node.add_sdo_callbacks(
+                "skytraq_tpdo", name, None, partial(self._tpdos.set_divisor, tpdo)
+            )
+
+        # summary of the fixes in the history, worked out when read
+        add_record(
+            self.node.od,
+            0x4007,
+            "skytraq_history",
+            [
+                Sub("fixes", datatypes.UNSIGNED32),
+                Sub("first_time", datatypes.UNSIGNED32),
+                Sub("last_time", datatypes.UNSIGNED32),
+                Sub("fixes_3d", datatypes.UNSIGNED32),
+                Sub("min_sv", datatypes.UNSIGNED8),
+                Sub("max_sv", datatypes.UNSIGNED8),
+                Sub("mean_pdop", datatypes.UNSIGNED16),
+            ],
+        )
+        for i, name in enumerate(HistorySummary._fields):
+            self.node.add_sdo_callbacks(
+                "skytraq_history", name, partial(self._on_history_read, i), None
+            )
+
+        self._add_propagated_rec()
+        self._add_clock_rec()
+        duty_rec = self._add_duty_cycle_rec()
+        self._add_aiding_rec()
+
         # make sure the flag for the time has been syncd is set to false
         self._is_syncd.value = False
 
-        self._skytraq_power_on()
+        interval = cast(int, duty_rec["interval"].value)
+        if interval:
+            self.duty_cycle.set_interval(interval, monotonic())
+        else:
+            self._skytraq_power_on()
+
+    def _add_propagated_rec(self) -> None:
+        # state propagated from the last fix to the Unix time in ms written to time, 0 for the
+        # time each read is at, or 0s if the last fix is too far from it
+        self._propagated_rec = add_record(
+            self.node.od,
+            0x4008,
+            "skytraq_propagated",
+            [
+                Sub("time", datatypes.UNSIGNED64, "rw", 0),
+                *(Sub(name, datatypes.INTEGER32) for name in PROPAGATED_FIELDS),
+                # ms from the fix to the time, negative before the fix
+                Sub("age", datatypes.INTEGER32),
+                # rate to send the propagated TPDOs at, 0 for off
+                Sub("tpdo_rate", datatypes.UNSIGNED8, "rw", 0),
+                # ms since UTC midnight of the state, like the skytraq record's
+                Sub("time_since_midnight", datatypes.UNSIGNED32),
+            ],
+        )
+        for i, name in enumerate(PROPAGATED_READ_FIELDS):
+            self.node.add_sdo_callbacks(
+                "skytraq_propagated", name, partial(self._on_propagated_read, i), None
+            )
+        self.node.add_sdo_callbacks(
+            "skytraq_propagated", "tpdo_rate", None, self._on_propagated_rate_write
+        )
+        self._on_propagated_rate_write(cast(int, self._propagated_rec["tpdo_rate"].value))
+        for tpdo, names in PROPAGATED_TPDOS.items():
+            mapped = [cast(ODVariable, self._propagated_rec[name]) for name in names]
+            add_tpdo(self.node.od, tpdo, mapped)
+
+    def _add_clock_rec(self) -> None:
+        # offset of the system clock from GPS time, as of the last window of fixes
+        clock_rec = add_record(
+            self.node.od,
+            0x4009,
+            "skytraq_clock",
+            [
+                Sub("offset_us", datatypes.INTEGER32),
+                Sub("jitter_us", datatypes.UNSIGNED32),
+                Sub("steps", datatypes.UNSIGNED32),
+                # us from the receiver's measurement epoch to the first byte of its fix
+                Sub("output_delay_us", datatypes.INTEGER32, "rw", 0),
+            ],
+        )
+        for i, name in enumerate(CLOCK_FIELDS):
+            self.node.add_sdo_callbacks(
+                "skytraq_clock", name, partial(self._on_clock_read, i), None
+            )
+        self.node.add_sdo_callbacks(
+            "skytraq_clock", "output_delay_us", None, self._on_output_delay_write
+        )
+        self._on_output_delay_write(cast(int, clock_rec["output_delay_us"].value))
+
+    def _add_duty_cycle_rec(self) -> ODRecord:
+        # powers the receiver up for a fix every interval seconds, 0 streams continuously
+        duty = self.duty_cycle
+        duty_rec = add_record(
+            self.node.od,
+            0x400A,
+            "skytraq_duty_cycle",
+            [
+                Sub("interval", datatypes.UNSIGNED32, "rw", 0),
+                Sub("timeout", datatypes.UNSIGNED16, "rw", duty.timeout),
+                # a fix needs at least min_sv and min_fix_mode and at most max_pdop to be used
+                Sub("min_sv", datatypes.UNSIGNED8, "rw", duty.min_sv),
+                Sub("max_pdop", datatypes.UNSIGNED16, "rw", duty.max_pdop),
+                Sub("min_fix_mode", datatypes.UNSIGNED8, "rw", duty.min_fix_mode),
+                # times to first fix are from power up, in ms
+                *(Sub(name, datatypes.UNSIGNED32) for name in DutyCycleStats._fields),
+            ],
+        )
+        for name in DUTY_CYCLE_CONFIG:
+            setattr(duty, name, duty_rec[name].value)
+            self.node.add_sdo_callbacks(
+                "skytraq_duty_cycle", name, None, partial(setattr, duty, name)
+            )
+        for i, name in enumerate(DutyCycleStats._fields):
+            self.node.add_sdo_callbacks(
+                "skytraq_duty_cycle", name, partial(self._on_duty_cycle_read, i), None
+            )
+        self.node.add_sdo_callbacks(
+            "skytraq_duty_cycle", "interval", None, self._on_duty_cycle_interval_write
+        )
+        return duty_rec
+
+    def _add_aiding_rec(self) -> None:
+        # the last fix and ephemeris, saved on power down and used to hot start on power up
+        self._aiding_rec = add_record(
+            self.node.od,
+            0x400B,
+            "skytraq_aiding",
+            [
+                Sub("enabled", datatypes.BOOLEAN, "rw", default=True),
+                Sub("save_ephemeris", datatypes.BOOLEAN, "rw", default=True),
+                # aiding commands ACKed, and NACKed or not replied to, since the app started
+                Sub("acked", datatypes.UNSIGNED32),
+                Sub("rejected", datatypes.UNSIGNED32),
+                # SVs with an ephemeris in the saved state
+                Sub("ephemeris_svs", datatypes.UNSIGNED8),
+            ],
+        )
+        if self._aiding_path is None:
+            self._aiding_path = Path(self.node.work_base_dir) / "skytraq_aiding"
+        try:
+            self._aiding_state = load_state(self._aiding_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"ignoring SkyTraq aiding state: {e}")
+        if self._aiding_state is not None:
+            self._last_fix = self._aiding_state.nav_data
+            self._aiding_rec["ephemeris_svs"].value = len(self._aiding_state.ephemeris)
 
     def on_stop(self) -> None:
         self._skytraq_power_off()
+        self.stream.close()
+        if self._archive is not None:
+            self._archive.close()
 
     def _on_read(self) -> int:
         return self._state.value
 
+    def _on_packet_count_read(self) -> int:
+        return self._packet_count
+
+    def _on_history_read(self, field: int) -> int:
+        return self.history.summary()[field]
+
+    def _on_clock_read(self, field: int) -> int:
+        clock = self.clock
+        if field == 0:
+            offset_us = round((clock.offset or 0) * 1e6)
+            return max(min(offset_us, 0x7FFF_FFFF), -0x8000_0000)
+        if field == 1:
+            return min(round(clock.jitter * 1e6), 0xFFFF_FFFF)
+        return clock.steps
+
+    def _on_output_delay_write(self, value: int) -> None:
+        self._output_delay = value / 1e6
+
+    def _on_duty_cycle_read(self, field: int) -> int:
+        return self.duty_cycle.stats()[field]
+
+    def _on_duty_cycle_interval_write(self, value: int) -> None:
+        if value and not self.duty_cycle.interval and self._skytraq.is_connected:
+            # streaming until now, the first cycle starts from power off like the rest
+            self._skytraq_power_off()
+        self.duty_cycle.set_interval(value, monotonic())
+
+    def _propagate(self, unix_ms: int) -> State | None:
+        return self.propagator.state(self._leap_seconds.to_gps_ms(unix_ms))
+
+    def _propagate_readout(self, unix_ms: int) -> State | None:
+        return self._propagate(unix_ms or round(time() * 1000))
+
+    def _on_propagated_read(self, field: int) -> int:
+        # the subs of a read all come from one state, of the same instant
+        requested = cast(int, self._propagated_rec["time"].value)
+        state = self._propagated_readout.state(requested, field, monotonic())
+        if state is None:
+            return 0
+        unix_ms = self._leap_seconds.to_unix_ms(0, state.gps_ms)
+        return (*_state_values(state), ms_since_midnight(unix_ms))[field]
+
+    def _on_propagated_rate_write(self, value: int) -> None:
+        self._propagated_period = 1 / value if value else 0.0
+        self._next_propagated = monotonic()
+
+    def _send_propagated(self) -> None:
+        """Send the propagated TPDOs, their subs are all read from one propagated state."""
+        self._next_propagated = max(self._next_propagated + self._propagated_period, monotonic())
+        requested = cast(int, self._propagated_rec["time"].value)
+        # starts the read the subs the TPDOs map are then served from
+        state = self._propagated_readout.state(requested, -1, monotonic())
+        if state is None:
+            return
+        self._tpdos.send(PROPAGATED_TPDOS)
+
+    def _on_last_packet_read(self) -> bytes:
+        return self._skytraq.last_packet
+
+    def _is_bus_up(self) -> bool:
+        return self.node.bus_state == "NETWORK_UP"
+
+    def _on_config_write(self, _value: int) -> None:
+        # talking to the receiver can take a while, leave it to the service thread
+        self._reconfigure.set()
+
+    def _reconfigure_skytraq(self) -> None:
+        baud = cast(int, self._config_rec["baud"].value)
+        update_rate = cast(int, self._config_rec["update_rate"].value) or None
+        try:
+            if self._skytraq.is_connected:
+                self._skytraq.set_baud(baud)
+                if update_rate is not None:
+                    self._skytraq.set_update_rate(update_rate)
+            else:  # applied on the next connect
+                self._skytraq.configure(baud, update_rate)
+        except (SkyTraqError, ValueError) as e:
+            logger.error(f"Error reconfiguring SkyTraq: {e}")
+        self._update_config_rec()
+
+    def _update_config_rec(self) -> None:
+        # reflect what the receiver is actually running at
+        self._config_rec["update_rate"].value = self._skytraq.update_rate or 0
+        self._config_rec["baud"].value = self._skytraq.baud
+        self._tpdos.fix_rate = self._skytraq.update_rate or self._receiver_rate
+
+    def _update_startup_rec(self) -> None:
+        startup = self._skytraq.startup
+        for key in ("uart_alive", "binary_mode", "first_fix"):
+            timestamp = getattr(startup, key)
+            ms = 0 if timestamp is None else round((timestamp - startup.power_on) * 1000)
+            self._startup_rec[key].value = ms
+        self._startup_rec["binary_mode_attempts"].value = startup.binary_mode_attempts
+        self._first_fix_recorded = startup.first_fix is not None
+
     def _on_write(self, value: int) -> None:
         # turn skytraq on/off
         if value:
@@ -63,59 +473,82 @@ class GpsService(Service):
             self._skytraq_power_off()
 
     def on_loop(self) -> None:
+        if self._reconfigure.is_set():
+            self._reconfigure.clear()
+            self._reconfigure_skytraq()
+        self.duty_cycle.poll(monotonic())
+
         if not self._skytraq.is_connected:
             self.sleep(0.1)
             return  # do nothing
 
-        try:
-            nav_data, raw = self._skytraq.read()
-        except SkyTraqError as e:
-            logger.debug(e)
-            return
+        if self._reader is None:
+            try:
+                msgs = [self._skytraq.read()]
+            except SkyTraqError as e:
+                logger.debug(e)
+                self._read_errors += 1
+                return
+        else:
+            # only what the reader thread already has queued up, never blocks on the serial port
+            timeout = 0.1
+            if self._propagated_period:
+                timeout = min(max(self._next_propagated - monotonic(), 0), timeout)
+            msgs = self._reader.drain(timeout)
 
-        self._skytraq_rec["packet_count"].value += 1  # type: ignore[operator]
-        self._skytraq_rec["last_packet"].value = raw  # type: ignore[assignment]
+        for msg in msgs:
+            self._on_message(msg)
+        self._discipline_clock()
 
-        if nav_data.fix_mode == FixMode.NO_FIX.value:
-            self._skytraq_rec["fix_mode"].value = FixMode.NO_FIX.value
-        else:
-            # GPS time is weeks and seconds since midnight 1980-1-6 (with the skytraq tow field
-            # being centiseconds, see AN0037 Navigation Data Message), except that UTC suffers from
-            # leap seconds sporadically so we have to also add all of them that occurred since the
-            # epoch to the gps time.
-            gps_epoch = datetime(1980, 1, 6, tzinfo=timezone.utc)
-            # Leap seconds as of 2026-02-18, update as needed. FIXME: how to determine
-            # automatically?
-            leap_seconds = 18
-            dt = gps_epoch + timedelta(
-                weeks=nav_data.gps_week, seconds=leap_seconds, milliseconds=nav_data.tow * 10
-            )
+        now = monotonic()
+        if self._propagated_period and now >= self._next_propagated:
+            self._send_propagated()
+        if now - self._od_writes_since >= 1:
+            rate = round(self._od_writes / (now - self._od_writes_since))
+            self._stats_rec["od_writes_per_sec"].value = rate
+            self._update_stats_rec()
+            self._od_writes = 0
+            self._od_writes_since = now
 
-            # sync clock if it hasn't been syncd yet
-            if not self._is_syncd.value and geteuid() == 0:
-                clock_settime(CLOCK_REALTIME, dt.timestamp())
-                logger.info("set time based off of skytraq time")
-                self._is_syncd.value = True
+    def _on_message(self, msg: Message) -> None:
+        self._packet_count += 1
 
-            # add all skytraq data to OD
-            for key, value in nav_data._asdict().items():
-                if key == "message_id":
-                    continue
-                self._skytraq_rec[key].value = value
+        if isinstance(msg, GpsTime):
+            self._on_gps_time(msg)
+            return
+        if not isinstance(msg, NavData):
+            return  # only navigation data feeds the OD
+        nav_data = msg
 
-            ms_since_midnight = (((((dt.hour * 60) + dt.minute) * 60) + dt.second) * 1000) + (
-                dt.microsecond // 1000
+        if not self._first_fix_recorded and self._skytraq.startup.first_fix is not None:
+            self._update_startup_rec()
+            logger.info(
+                f"first SkyTraq fix {self._startup_rec['first_fix'].value} ms after power on"
             )
-            self._skytraq_rec["time_since_midnight"].value = ms_since_midnight
 
-            # send gps tpdos
-            try:
-                self.node.send_tpdo(3)
-                self.node.send_tpdo(4)
-                self.node.send_tpdo(5)
-                self.node.send_tpdo(6)
-            except NetworkError:
-                pass  # CAN network is down
+        if nav_data.fix_mode == FixMode.NO_FIX.value:
+            i = self._fix_mode_index
+            if self._written[i] != nav_data.fix_mode:
+                self._nav_vars[i - 1][1].value = nav_data.fix_mode
+                self._written[i] = nav_data.fix_mode
+                self._od_writes += 1
+        elif self.duty_cycle.on_fix(nav_data, monotonic()):
+            # the skytraq tow field is centiseconds, see AN0037 Navigation Data Message
+            unix_ms = self._leap_seconds.to_unix_ms(nav_data.gps_week, nav_data.tow * 10)
+
+            self._last_fix = nav_data
+            self.history.append(nav_data)
+            self.propagator.seed(nav_data)
+            if self._archive is not None:
+                self._archive.append(nav_data)
+
+            t0 = perf_counter_ns()
+            self._write_nav_data(nav_data, ms_since_midnight(unix_ms))
+            t1 = perf_counter_ns()
+            self._metrics.od_update.observe(t1 - t0)
+
+            self._tpdos.on_fix()
+            self._metrics.tpdo.observe(perf_counter_ns() - t1)
 
         # update status
         if nav_data.number_of_sv >= 4 and nav_data.fix_mode >= FixMode.FIX_2D.value:
@@ -123,9 +556,105 @@ class GpsService(Service):
         else:
             self._state = GpsState.SEARCHING
 
+        # the status TPDO also goes out on its event timer, this gets changes out straight away
+        self._tpdos.on_change(
+            STATUS_TPDO,
+            (self._state, nav_data.fix_mode, nav_data.number_of_sv, self._is_syncd.value),
+        )
+
+        if self.stream.clients:
+            self._publish_status(nav_data._asdict())
+
+    def _publish_status(self, changes: dict[str, Any] | None = None) -> None:
+        self.stream.publish(
+            {
+                **(changes or {}),
+                "status": self._state.value,
+                "time_syncd": bool(self._is_syncd.value),
+                "packet_count": self._packet_count,
+            }
+        )
+
+    def _discipline_clock(self) -> None:
+        """Compare the system clock to the GPS time of each fix read, as of when it arrived."""
+        marks = self._skytraq.time_marks()
+        if not marks:
+            return
+        t0 = perf_counter_ns()
+        for mark in marks:
+            fix_time = self._leap_seconds.to_unix_ms(0, mark.gps_ms) / 1000 + self._output_delay
+            # the system time the fix arrived at, worked out again each time as a step moves it
+            arrived = time() - (monotonic() - mark.received)
+            self.clock.add(arrived - fix_time)
+        self._metrics.clock_set.observe(perf_counter_ns() - t0)
+
+        if self.clock.synced and not self._is_syncd.value:
+            logger.info("set time based off of skytraq time")
+            self._is_syncd.value = True
+
+    def _on_gps_time(self, msg: GpsTime) -> None:
+        if not msg.valid & 0b100:
+            return  # the receiver hasn't got the UTC parameters from the almanac yet
+        gps_ms = msg.week_number * MS_PER_WEEK + msg.tow_ms
+        if self._leap_seconds.update(gps_ms, msg.current_leap_seconds):
+            logger.info(f"GPS-UTC offset is now {msg.current_leap_seconds} s")
+
+    def _update_stats_rec(self) -> None:
+        self._stats_rec["tpdo_send_errors"].value = self._tpdos.send_errors
+        for name, value in self._skytraq.counters().items():
+            if name in STATS_COUNTERS:
+                self._stats_rec[name].value = value
+        for name, value in self._reader_counters().items():
+            self._stats_rec[name].value = value
+        for stage, hist in self._metrics.stages().items():
+            self._stats_rec[f"{stage}_p95_us"].value = hist.percentile_us(95)
+
+    def _reader_counters(self) -> dict[str, int]:
+        reader = self._reader
+        if reader is None:
+            return {"messages_dropped": 0, "read_errors": self._read_errors}
+        return {"messages_dropped": reader.ring.dropped, "read_errors": reader.read_errors}
+
+    def metrics(self) -> dict[str, Any]:
+        """Get the pipeline metrics.
+
+        Returns
+        -------
+        dict[str, Any]
+            The latency histogram of each stage and the link and TPDO counters, JSON-able.
+        """
+        return {
+            "stages": {stage: hist.as_dict() for stage, hist in self._metrics.stages().items()},
+            "counters": {
+                **self._skytraq.counters(),
+                **self._reader_counters(),
+                "packet_count": self._packet_count,
+                "tpdo_sent": self._tpdos.sent,
+                "tpdo_send_errors": self._tpdos.send_errors,
+            },
+        }
+
+    def _write_nav_data(self, nav_data: NavData, ms_since_midnight: int) -> None:
+        """Write the fields that changed since the last write to the OD."""
+        written = self._written
+        writes = 0
+        for i, var in self._nav_vars:
+            value = nav_data[i]
+            if value != written[i]:
+                var.value = value
+                written[i] = value
+                writes += 1
+
+        if ms_since_midnight != self._written_ms_since_midnight:
+            self._time_since_midnight_var.value = ms_since_midnight
+            self._written_ms_since_midnight = ms_since_midnight
+            writes += 1
+        self._od_writes += writes
+
     def on_loop_error(self, error: Exception) -> None:
         self._skytraq_power_off()
         self._state = GpsState.ERROR
+        self._publish_status()
         logger.exception(error)
 
     def _skytraq_power_on(self) -> None:
@@ -136,9 +665,115 @@ class GpsService(Service):
             logger.exception(f"Error connecting to SkyTraq: {e}")
             self._skytraq.disconnect()
             return
+        finally:
+            self._update_startup_rec()
+        self._query_update_rate()
+        self._update_config_rec()
+        self._aid_skytraq()
+        # the reply carries the receiver's leap seconds, picked up in the loop like any message
+        try:
+            self._skytraq.send_command(0x64, b"\x20")
+        except SkyTraqError as e:
+            logger.warning(f"Error querying SkyTraq GPS time: {e}")
+        if self._reader is not None:
+            self._reader.start()
         self._state = GpsState.SEARCHING
+        self._publish_status()
+
+    def _query_update_rate(self) -> None:
+        """Find the rate the receiver runs at when none is set, for the TPDOs that follow it."""
+        if self._skytraq.update_rate is not None:
+            return
+        try:
+            self._receiver_rate = self._skytraq.query_update_rate() or 1
+        except SkyTraqError as e:
+            logger.warning(f"Error querying SkyTraq update rate: {e}")
 
     def _skytraq_power_off(self) -> None:
         logger.info("turning SkyTraq off")
+        if self._reader is not None:
+            self._reader.stop()
+        self._save_aiding_state()
         self._skytraq.disconnect()
+        if self._archive is not None:
+            self._archive.flush()
         self._state = GpsState.OFF
+        self._publish_status()
+
+    def _aid_skytraq(self) -> None:
+        """Upload the saved ephemeris and hot start the receiver with the saved fix."""
+        state = self._aiding_state
+        if state is None or not self._aiding_rec["enabled"].value:
+            return
+        unix_ms = round(time() * 1000)
+        gps_ms = self._leap_seconds.to_gps_ms(unix_ms)
+        if gps_ms < state.nav_data.gps_week * MS_PER_WEEK + state.nav_data.tow * 10:
+            logger.warning("system time is before the saved SkyTraq fix, not aiding the SkyTraq")
+            return
+
+        ephemeris = fresh_ephemeris(state, gps_ms)
+        # the ephemeris first, the restart may not take commands while it restarts
+        commands = [(MSG_ID_SET_EPHEMERIS, ephemeris_body(e)) for e in ephemeris]
+        commands.append((MSG_ID_RESTART, restart_body(state.nav_data, unix_ms, gps_ms)))
+        acked = sum(self._aiding_command(msg_id, body) for msg_id, body in commands)
+        rec = self._aiding_rec
+        rec["acked"].value = cast(int, rec["acked"].value) + acked
+        rec["rejected"].value = cast(int, rec["rejected"].value) + len(commands) - acked
+        logger.info(
+            f"aided SkyTraq with the saved fix and {len(ephemeris)} ephemerides, "
+            f"{acked} of {len(commands)} commands ACKed"
+        )
+
+    def _aiding_command(self, msg_id: int, body: bytes) -> bool:
+        """Send an aiding command, returns whether it was ACKed."""
+        try:
+            return isinstance(self._skytraq.command(msg_id, body), Ack)
+        except SkyTraqError as e:
+            logger.warning(e)
+            return False
+
+    def _save_aiding_state(self) -> None:
+        """Save the last fix and the receiver's ephemeris, if there's been a fix since."""
+        fix = self._last_fix
+        saved = self._aiding_state
+        if fix is None or (saved is not None and fix is saved.nav_data):
+            return
+        if not self._aiding_rec["enabled"].value or self._aiding_path is None:
+            return
+        state = AidingState(fix)
+        if self._aiding_rec["save_ephemeris"].value:
+            state = self._with_ephemeris(state)
+        try:
+            save_state(self._aiding_path, state)
+        except OSError as e:
+            logger.error(f"Error saving SkyTraq aiding state: {e}")
+            return
+        self._aiding_state = state
+        self._aiding_rec["ephemeris_svs"].value = len(state.ephemeris)
+
+    def _with_ephemeris(self, state: AidingState) -> AidingState:
+        """Add the ephemeris to a state, the saved one until it's due a refresh from the receiver.
+
+        The query waits on a reply for every SV, so it's only made once the saved one is old.
+        """
+        fix_ms = state.nav_data.gps_week * MS_PER_WEEK + state.nav_data.tow * 10
+        saved = self._aiding_state
+        kept = state
+        if saved is not None and fresh_ephemeris(saved, fix_ms):
+            saved_ms = saved.nav_data.gps_week * MS_PER_WEEK + saved.nav_data.tow * 10
+            age_ms = fix_ms - saved_ms + saved.ephemeris_age_ms
+            kept = state._replace(ephemeris=saved.ephemeris, ephemeris_age_ms=age_ms)
+            if fresh_ephemeris(saved, fix_ms, EPHEMERIS_REFRESH_MS):
+                return kept
+        if self._skytraq.is_connected:
+            try:
+                return state._replace(ephemeris=tuple(self._skytraq.query_ephemeris()))
+            except SkyTraqError as e:
+                logger.warning(f"Error querying SkyTraq ephemeris: {e}")
+        # the saved ephemeris is better than none while it's still good
+        return kept
+
+
+def _state_values(state: State) -> tuple[int, ...]:
+    """Get a propagated state in the units of the skytraq record, then its age."""
+    return (*(round(v * 100) for v in (*state.position, *state.velocity)), state.age_ms)
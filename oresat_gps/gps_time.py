@@ -0,0 +1,193 @@
+"""GPS time to UTC conversion.
+
+GPS time is weeks and milliseconds since midnight 1980-1-6, and unlike UTC it doesn't have leap
+seconds, so it runs ahead of UTC by every leap second inserted since the GPS epoch. Conversion is
+done in integer milliseconds against a precomputed epoch offset and a sorted table of leap seconds,
+without building a datetime per fix, so it's cheap enough for every fix and for post-processing
+logs in bulk.
+"""
+
+from array import array
+from bisect import bisect_right
+from calendar import timegm
+from collections.abc import Iterable, Sequence
+
+MS_PER_DAY = 86_400_000
+MS_PER_WEEK = 7 * MS_PER_DAY
+GPS_EPOCH_UNIX_MS = timegm((1980, 1, 6, 0, 0, 0)) * 1000
+"""The GPS epoch, 1980-1-6 00:00:00 UTC, in milliseconds since the Unix epoch"""
+
+_LEAP_SECOND_DATES = (
+    (1981, 7, 1),
+    (1982, 7, 1),
+    (1983, 7, 1),
+    (1985, 7, 1),
+    (1988, 1, 1),
+    (1990, 1, 1),
+    (1991, 1, 1),
+    (1992, 7, 1),
+    (1993, 7, 1),
+    (1994, 7, 1),
+    (1996, 1, 1),
+    (1997, 7, 1),
+    (1999, 1, 1),
+    (2006, 1, 1),
+    (2009, 1, 1),
+    (2012, 7, 1),
+    (2015, 7, 1),
+    (2017, 1, 1),
+)
+"""UTC dates each leap second since the GPS epoch took effect on, from IERS Bulletin C"""
+
+LEAP_SECONDS = (
+    (0, 0),
+    *(
+        ((timegm((*date, 0, 0, 0)) * 1000 - GPS_EPOCH_UNIX_MS) + offset * 1000, offset)
+        for offset, date in enumerate(_LEAP_SECOND_DATES, 1)
+    ),
+)
+"""GPS-UTC offset in seconds and the GPS time in milliseconds it applies from, as of 2026-02-18"""
+
+
+class LeapSeconds:
+    """GPS-UTC offset lookup, updatable from the receiver's own UTC parameters.
+
+    Lookups are a bisect of the table, short-circuited by the span of the last lookup since fixes
+    almost always fall in the same one.
+    """
+
+    def __init__(self, table: Iterable[tuple[int, int]] = LEAP_SECONDS) -> None:
+        """Create a lookup.
+
+        Parameters
+        ----------
+        table
+            (GPS time in milliseconds, GPS-UTC offset in seconds) pairs, sorted on time.
+        """
+        self._starts: list[int] = []
+        self._offsets: list[int] = []
+        for start, offset in table:
+            self._starts.append(start)
+            self._offsets.append(offset)
+        self._set_span(len(self._starts) - 1)
+
+    def _set_span(self, i: int) -> None:
+        self._span_start = self._starts[i] if i >= 0 else -(1 << 63)
+        self._span_end = self._starts[i + 1] if i + 1 < len(self._starts) else 1 << 63
+        self._span_offset_ms = self._offsets[i] * 1000 if i >= 0 else 0
+
+    def offset_ms(self, gps_ms: int) -> int:
+        """Get the GPS-UTC offset at a GPS time.
+
+        Parameters
+        ----------
+        gps_ms
+            Milliseconds since the GPS epoch.
+
+        Returns
+        -------
+        int
+            The offset in milliseconds.
+        """
+        if not self._span_start <= gps_ms < self._span_end:
+            self._set_span(bisect_right(self._starts, gps_ms) - 1)
+        return self._span_offset_ms
+
+    @property
+    def current(self) -> int:
+        """int: The latest GPS-UTC offset in the table, in seconds."""
+        return self._offsets[-1]
+
+    def update(self, gps_ms: int, offset: int) -> bool:
+        """Record the GPS-UTC offset reported by the receiver.
+
+        A new leap second is taken to apply from the time it was first reported, entries after that
+        time are dropped.
+
+        Parameters
+        ----------
+        gps_ms
+            The GPS time the receiver reported the offset at, in milliseconds since the GPS epoch.
+        offset
+            The GPS-UTC offset in seconds.
+
+        Returns
+        -------
+        bool
+            True if the table changed.
+        """
+        if self.offset_ms(gps_ms) == offset * 1000:
+            return False
+        i = bisect_right(self._starts, gps_ms)
+        del self._starts[i:], self._offsets[i:]
+        self._starts.append(gps_ms)
+        self._offsets.append(offset)
+        self._set_span(i)
+        return True
+
+    def to_unix_ms(self, week: int, tow_ms: int) -> int:
+        """Convert a GPS time to UTC.
+
+        Parameters
+        ----------
+        week
+            GPS week number, not rolled over at 1024.
+        tow_ms
+            Time of week in milliseconds.
+
+        Returns
+        -------
+        int
+            UTC in milliseconds since the Unix epoch.
+        """
+        gps_ms = week * MS_PER_WEEK + tow_ms
+        return GPS_EPOCH_UNIX_MS + gps_ms - self.offset_ms(gps_ms)
+
+    def to_gps_ms(self, unix_ms: int) -> int:
+        """Convert UTC to a GPS time, the inverse of `to_unix_ms()`.
+
+        Parameters
+        ----------
+        unix_ms
+            UTC in milliseconds since the Unix epoch.
+
+        Returns
+        -------
+        int
+            GPS time in milliseconds since the GPS epoch. UTC repeats a second over a leap second,
+            which maps to the earlier of its two GPS seconds.
+        """
+        gps_ms = unix_ms - GPS_EPOCH_UNIX_MS
+        return gps_ms + self.offset_ms(gps_ms + self.offset_ms(gps_ms))
+
+    def to_unix_ms_batch(self, weeks: Sequence[int], tows_ms: Sequence[int]) -> array:
+        """Convert many GPS times to UTC, see `to_unix_ms()`.
+
+        Parameters
+        ----------
+        weeks
+            GPS week numbers.
+        tows_ms
+            Times of week in milliseconds, same length as weeks.
+
+        Returns
+        -------
+        array
+            UTC in milliseconds since the Unix epoch, as an array of signed 64-bit ints.
+
+        Raises
+        ------
+        ValueError
+            weeks and tows_ms aren't the same length.
+        """
+        offset_ms = self.offset_ms
+        out = array("q", bytes(8 * len(weeks)))
+        for i, (week, tow_ms) in enumerate(zip(weeks, tows_ms, strict=True)):
+            gps_ms = week * MS_PER_WEEK + tow_ms
+            out[i] = GPS_EPOCH_UNIX_MS + gps_ms - offset_ms(gps_ms)
+        return out
+
+
+def ms_since_midnight(unix_ms: int) -> int:
+    """Get the milliseconds since UTC midnight of a Unix time in milliseconds."""
+    return unix_ms % MS_PER_DAY
@@ -0,0 +1,224 @@
+"""In-memory history of navigation data.
+
+Fixes are kept column by column in fixed-size typed arrays used as a ring, one per `NavData` field
+plus the GPS time, so a full orbit of fixes is a few hundred KiB of plain numbers rather than
+thousands of Python objects. GPS time only goes forward, so the ring is sorted on it and range
+queries are a binary search.
+"""
+
+import re
+from array import array
+from threading import Lock
+from typing import NamedTuple
+
+from .codec import MESSAGE_TYPES, FixMode, NavData
+from .gps_time import MS_PER_WEEK
+
+
+def _typecodes(fmt: str) -> list[str]:
+    """Expand a struct format of ints into the array typecode of each field."""
+    codes = []
+    for count, code in re.findall(r"(\d*)([bBhHiI])", fmt):
+        codes += [code] * int(count or 1)
+    return codes
+
+
+_NAV_TYPECODES = _typecodes(MESSAGE_TYPES[0xA8].fmt.format)
+
+
+class HistorySummary(NamedTuple):
+    """Summary of the fixes in a history."""
+
+    fixes: int
+    """Number of fixes"""
+    first_time: int
+    """GPS time of the oldest fix, in seconds since the GPS epoch, 0 if there are none"""
+    last_time: int
+    """GPS time of the newest fix, in seconds since the GPS epoch, 0 if there are none"""
+    fixes_3d: int
+    """Number of fixes with a 3D fix mode or better"""
+    min_sv: int
+    """Fewest SVs in a fix"""
+    max_sv: int
+    """Most SVs in a fix"""
+    mean_pdop: int
+    """Mean PDOP, in the same units as `NavData.pdop`"""
+
+
+class FixHistory:
+    """Fixed-capacity, time-ordered ring of navigation data, stored column by column."""
+
+    def __init__(self, capacity: int = 6000) -> None:
+        """Create a history.
+
+        Parameters
+        ----------
+        capacity
+            Most fixes to keep, the oldest is overwritten once full. The default is about an orbit
+            at 1 Hz.
+        """
+        if capacity < 1:
+            raise ValueError("history capacity must be at least 1")
+        self._capacity = capacity
+        self._gps_ms = array("q", bytes(8 * capacity))
+        self._columns = tuple(array(code, [0]) * capacity for code in _NAV_TYPECODES)
+        self._start = 0
+        self._len = 0
+        self._summary: HistorySummary | None = None
+        # appended to by the service, queried from the REST API and SDO callbacks
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        """Return the number of fixes held."""
+        return self._len
+
+    @property
+    def capacity(self) -> int:
+        """int: Most fixes held."""
+        return self._capacity
+
+    def clear(self) -> None:
+        """Drop all fixes."""
+        with self._lock:
+            self._clear()
+
+    def _clear(self) -> None:
+        self._start = self._len = 0
+        self._summary = None
+
+    def append(self, nav_data: NavData) -> None:
+        """Add a fix.
+
+        A fix older than the newest one held means the receiver's time jumped back, e.g. after a
+        reset, and the history is cleared first to keep it sorted.
+        """
+        gps_ms = nav_data.gps_week * MS_PER_WEEK + nav_data.tow * 10
+        with self._lock:
+            if self._len and gps_ms < self._gps_ms[self._physical(self._len - 1)]:
+                self._clear()
+            if self._len < self._capacity:
+                i = self._physical(self._len)
+                self._len += 1
+            else:
+                i = self._start
+                self._start = (self._start + 1) % self._capacity
+            self._gps_ms[i] = gps_ms
+            for column, value in zip(self._columns, nav_data, strict=True):
+                column[i] = value
+            self._summary = None
+
+    def _physical(self, i: int) -> int:
+        return (self._start + i) % self._capacity
+
+    def _bisect(self, gps_ms: int) -> int:
+        """Find the first fix at or after a GPS time, as an index from the oldest fix."""
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._gps_ms[self._physical(mid)] < gps_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _span(self, lo: int, hi: int) -> list[slice]:
+        """Get the physical slices of the fixes from index lo up to hi, oldest first."""
+        if lo >= hi:
+            return []
+        start, end = self._physical(lo), self._physical(hi - 1) + 1
+        if start < end:
+            return [slice(start, end)]
+        return [slice(start, self._capacity), slice(0, end)]
+
+    def _select(self, lo: int, hi: int) -> list[NavData]:
+        fixes: list[NavData] = []
+        for span in self._span(lo, hi):
+            fixes.extend(map(NavData._make, zip(*(c[span] for c in self._columns), strict=True)))
+        return fixes
+
+    def _columns_of(self, lo: int, hi: int) -> dict[str, list[int]]:
+        spans = self._span(lo, hi)
+
+        def gather(column: array) -> list[int]:
+            values: list[int] = []
+            for span in spans:
+                values += column[span].tolist()
+            return values
+
+        out = {"gps_ms": gather(self._gps_ms)}
+        for name, column in zip(NavData._fields, self._columns, strict=True):
+            out[name] = gather(column)
+        return out
+
+    def _range(self, start_ms: int | None, end_ms: int | None) -> tuple[int, int]:
+        lo = 0 if start_ms is None else self._bisect(start_ms)
+        hi = self._len if end_ms is None else self._bisect(end_ms)
+        return lo, hi
+
+    def between(self, start_ms: int | None = None, end_ms: int | None = None) -> list[NavData]:
+        """Get the fixes in a GPS time range, oldest first.
+
+        Parameters
+        ----------
+        start_ms
+            Start of the range, inclusive, in milliseconds since the GPS epoch. None for the oldest.
+        end_ms
+            End of the range, exclusive, in milliseconds since the GPS epoch. None for the newest.
+        """
+        with self._lock:
+            return self._select(*self._range(start_ms, end_ms))
+
+    def last(self, n: int) -> list[NavData]:
+        """Get the newest n fixes, oldest first."""
+        with self._lock:
+            return self._select(max(self._len - n, 0), self._len)
+
+    def columns(
+        self, start_ms: int | None = None, end_ms: int | None = None, last: int | None = None
+    ) -> dict[str, list[int]]:
+        """Get fixes as a list per field, e.g. for JSON, without making a `NavData` per fix.
+
+        Parameters
+        ----------
+        start_ms
+            Start of the GPS time range, see `between()`.
+        end_ms
+            End of the GPS time range, see `between()`.
+        last
+            Only the newest this many fixes in the range.
+
+        Returns
+        -------
+        dict[str, list[int]]
+            The GPS time in milliseconds as "gps_ms" and every `NavData` field, oldest first.
+        """
+        with self._lock:
+            lo, hi = self._range(start_ms, end_ms)
+            if last is not None:
+                lo = max(lo, hi - last)
+            return self._columns_of(lo, hi)
+
+    def summary(self) -> HistorySummary:
+        """Summarize the fixes held, worked out again only after a new fix."""
+        with self._lock:
+            if self._summary is None:
+                self._summary = self._summarize()
+            return self._summary
+
+    def _summarize(self) -> HistorySummary:
+        if not self._len:
+            return HistorySummary(0, 0, 0, 0, 0, 0, 0)
+        spans = self._span(0, self._len)
+        fields = NavData._fields
+        fix_mode = self._columns[fields.index("fix_mode")]
+        number_of_sv = self._columns[fields.index("number_of_sv")]
+        pdop = self._columns[fields.index("pdop")]
+        return HistorySummary(
+            self._len,
+            self._gps_ms[self._physical(0)] // 1000,
+            self._gps_ms[self._physical(self._len - 1)] // 1000,
+            sum(1 for s in spans for m in fix_mode[s] if m >= FixMode.FIX_3D.value),
+            min(min(number_of_sv[s]) for s in spans),
+            max(max(number_of_sv[s]) for s in spans),
+            sum(sum(pdop[s]) for s in spans) // self._len,
+        )
@@ -0,0 +1,134 @@
+"""Pipeline latency metrics.
+
+Each stage of getting a fix from the serial port into the OD and onto the CAN bus is timed with
+`perf_counter_ns()` into a fixed-bucket histogram. Recording a sample is a bisect and a few integer
+adds, cheap enough to leave on in flight.
+"""
+
+from bisect import bisect_left
+from typing import Any
+
+BUCKETS_US = (
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1_000,
+    2_000,
+    5_000,
+    10_000,
+    20_000,
+    50_000,
+    100_000,
+    200_000,
+    500_000,
+    1_000_000,
+)
+"""Upper bounds of the histogram buckets in microseconds, a last bucket takes anything over"""
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations."""
+
+    __slots__ = ("_bounds_ns", "count", "counts", "max_ns", "total_ns")
+
+    def __init__(self, buckets_us: tuple[int, ...] = BUCKETS_US) -> None:
+        """Create a histogram.
+
+        Parameters
+        ----------
+        buckets_us
+            Sorted upper bounds of the buckets, in microseconds.
+        """
+        self._bounds_ns = tuple(b * 1000 for b in buckets_us)
+        self.counts = [0] * (len(buckets_us) + 1)
+        """Samples in each bucket, the last one is for samples over the last bound"""
+        self.count = 0
+        """Number of samples"""
+        self.total_ns = 0
+        """Sum of the samples, in nanoseconds"""
+        self.max_ns = 0
+        """Largest sample, in nanoseconds"""
+
+    def observe(self, ns: int) -> None:
+        """Record a duration, in nanoseconds."""
+        self.counts[bisect_left(self._bounds_ns, ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        self.max_ns = max(self.max_ns, ns)
+
+    def percentile_us(self, q: float) -> int:
+        """Get the upper bound of the bucket a percentile falls in.
+
+        Parameters
+        ----------
+        q
+            The percentile, from 0 to 100.
+
+        Returns
+        -------
+        int
+            The bucket bound in microseconds, the largest sample if it's past the last bucket, or 0
+            if there are no samples.
+        """
+        if self.count == 0:
+            return 0
+        rank = self.count * q / 100
+        seen = 0
+        for bound_ns, n in zip(self._bounds_ns, self.counts, strict=False):
+            seen += n
+            if seen >= rank:
+                return bound_ns // 1000
+        return self.max_ns // 1000
+
+    def reset(self) -> None:
+        """Drop all samples."""
+        self.counts = [0] * len(self.counts)
+        self.count = self.total_ns = self.max_ns = 0
+
+    def as_dict(self) -> dict[str, Any]:
+        """Get the histogram as a JSON-able dict, durations in microseconds."""
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns // self.count // 1000 if self.count else 0,
+            "max_us": self.max_ns // 1000,
+            "p50_us": self.percentile_us(50),
+            "p95_us": self.percentile_us(95),
+            "p99_us": self.percentile_us(99),
+            "buckets_us": [b // 1000 for b in self._bounds_ns],
+            "counts": list(self.counts),
+        }
+
+
+class PipelineMetrics:
+    """Latency histograms for each stage from the serial port to the CAN bus."""
+
+    STAGES = ("read", "decode", "checksum", "od_update", "tpdo", "clock_set", "arrival")
+    """Stage names, the attribute each histogram is under"""
+
+    def __init__(self) -> None:
+        self.read = Histogram()
+        """Serial reads, including the wait for data"""
+        self.decode = Histogram()
+        """Pulling each message out of the receive buffer, checksum included"""
+        self.checksum = Histogram()
+        """Checksums of complete frames"""
+        self.od_update = Histogram()
+        """Writing a fix to the OD"""
+        self.tpdo = Histogram()
+        """Sending the TPDOs for a fix"""
+        self.clock_set = Histogram()
+        """Disciplining the system clock to a fix"""
+        self.arrival = Histogram()
+        """From the first byte of a fix arriving to it being decoded, the serial and decode time"""
+
+    def stages(self) -> dict[str, Histogram]:
+        """Get the histograms by stage name."""
+        return {stage: getattr(self, stage) for stage in self.STAGES}
+
+    def reset(self) -> None:
+        """Drop all samples."""
+        for hist in self.stages().values():
+            hist.reset()
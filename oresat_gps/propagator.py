@@ -0,0 +1,306 @@
+"""Orbit propagation between fixes.
+
+The ECEF position and velocity of the last fix are propagated with a two-body plus J2 gravity
+model, so the state can be given at any time between fixes, or for a while after the last one,
+without running the receiver any faster. Propagation is a fixed-step RK4 in an inertial frame lined
+up with ECEF at the fix, which J2 is the same in since it's symmetric about the earth's axis.
+
+Each fix reseeds the propagator. The difference between what was predicted for the fix and the fix
+itself is blended out over a short time rather than jumped, so the state stays continuous.
+"""
+
+from collections.abc import Callable
+from math import ceil, cos, sin, sqrt
+from threading import Lock, local
+from typing import NamedTuple
+
+from .codec import NavData
+from .gps_time import MS_PER_WEEK
+
+EARTH_RADIUS = 6_378_137.0
+"""WGS 84 equatorial radius, in meters"""
+EARTH_MU = 3.986004418e14
+"""Earth's standard gravitational parameter, in m^3/s^2"""
+EARTH_ROTATION = 7.2921151467e-5
+"""Earth's rotation rate, in rad/s"""
+EARTH_J2 = 1.08262668e-3
+"""Earth's second zonal harmonic, the oblateness"""
+
+_J2_COEF = 1.5 * EARTH_J2 * EARTH_MU * EARTH_RADIUS**2
+
+_Vector = tuple[float, float, float, float, float, float]
+"""Position and velocity, x, y, z, vx, vy, vz"""
+
+
+class State(NamedTuple):
+    """Propagated state."""
+
+    gps_ms: int
+    """GPS time of the state, in milliseconds since the GPS epoch"""
+    position: tuple[float, float, float]
+    """ECEF position, in meters"""
+    velocity: tuple[float, float, float]
+    """ECEF velocity, in m/s"""
+    age_ms: int
+    """Time from the fix the state was propagated from, in milliseconds"""
+
+
+def _derivative(s: _Vector) -> _Vector:
+    """Get the velocity and the two-body plus J2 acceleration of an inertial state."""
+    x, y, z, vx, vy, vz = s
+    r2 = x * x + y * y + z * z
+    r = sqrt(r2)
+    two_body = EARTH_MU / (r2 * r)
+    j2 = _J2_COEF / (r2 * r2 * r)
+    f = 5 * z * z / r2
+    k_xy = -two_body - j2 * (1 - f)
+    k_z = -two_body - j2 * (3 - f)
+    return (vx, vy, vz, k_xy * x, k_xy * y, k_z * z)
+
+
+def _step(s: _Vector, h: float) -> _Vector:
+    """Take one RK4 step of h seconds."""
+    x, y, z, vx, vy, vz = s
+    k1 = _derivative(s)
+    h2 = h / 2
+    k2 = _derivative(
+        (
+            x + h2 * k1[0],
+            y + h2 * k1[1],
+            z + h2 * k1[2],
+            vx + h2 * k1[3],
+            vy + h2 * k1[4],
+            vz + h2 * k1[5],
+        )
+    )
+    k3 = _derivative(
+        (
+            x + h2 * k2[0],
+            y + h2 * k2[1],
+            z + h2 * k2[2],
+            vx + h2 * k2[3],
+            vy + h2 * k2[4],
+            vz + h2 * k2[5],
+        )
+    )
+    k4 = _derivative(
+        (
+            x + h * k3[0],
+            y + h * k3[1],
+            z + h * k3[2],
+            vx + h * k3[3],
+            vy + h * k3[4],
+            vz + h * k3[5],
+        )
+    )
+    h6 = h / 6
+    return (
+        x + h6 * (k1[0] + 2 * k2[0] + 2 * k3[0] + k4[0]),
+        y + h6 * (k1[1] + 2 * k2[1] + 2 * k3[1] + k4[1]),
+        z + h6 * (k1[2] + 2 * k2[2] + 2 * k3[2] + k4[2]),
+        vx + h6 * (k1[3] + 2 * k2[3] + 2 * k3[3] + k4[3]),
+        vy + h6 * (k1[4] + 2 * k2[4] + 2 * k3[4] + k4[4]),
+        vz + h6 * (k1[5] + 2 * k2[5] + 2 * k3[5] + k4[5]),
+    )
+
+
+def _add(a: _Vector, b: _Vector, w: float) -> _Vector:
+    """Get a + w * b."""
+    return (
+        a[0] + w * b[0],
+        a[1] + w * b[1],
+        a[2] + w * b[2],
+        a[3] + w * b[3],
+        a[4] + w * b[4],
+        a[5] + w * b[5],
+    )
+
+
+def _to_ecef(s: _Vector, dt: float) -> _Vector:
+    """Rotate an inertial state, lined up with ECEF dt seconds earlier, into ECEF."""
+    x, y, z, vx, vy, vz = s
+    theta = EARTH_ROTATION * dt
+    c, sn = cos(theta), sin(theta)
+    ex, ey = x * c + y * sn, -x * sn + y * c
+    return (
+        ex,
+        ey,
+        z,
+        vx * c + vy * sn + EARTH_ROTATION * ey,
+        -vx * sn + vy * c - EARTH_ROTATION * ex,
+        vz,
+    )
+
+
+class Propagator:
+    """Propagates the state of the last fix to any time near it."""
+
+    def __init__(self, step: float = 1.0, blend: float = 1.0, max_age: float = 300.0) -> None:
+        """Create a propagator.
+
+        Parameters
+        ----------
+        step
+            Longest RK4 step, in seconds.
+        blend
+            Seconds to blend the jump between the prediction and a new fix out over, 0 to jump.
+        max_age
+            Furthest from the last fix to give a state for, in seconds.
+        """
+        if step <= 0:
+            raise ValueError("step must be positive")
+        self._step = step
+        self._blend_ms = blend * 1000
+        self._max_age_ms = max_age * 1000
+        self._epoch_ms: int | None = None
+        self._seed: _Vector = (0.0,) * 6
+        # last state propagated to, as seconds from the epoch and inertial state, to step on from
+        self._cache_dt = 0.0
+        self._cache: _Vector = self._seed
+        self._offset: _Vector = self._seed
+        # seeded by the service, queried from SDO callbacks too, and a query moves the cache on
+        self._lock = Lock()
+
+    @property
+    def epoch_ms(self) -> int | None:
+        """GPS time of the fix propagated from, in milliseconds, None if there's no fix yet."""
+        return self._epoch_ms
+
+    def reset(self) -> None:
+        """Forget the last fix."""
+        with self._lock:
+            self._epoch_ms = None
+
+    def seed(self, nav_data: NavData) -> None:
+        """Propagate from a new fix.
+
+        Parameters
+        ----------
+        nav_data
+            The fix, with its ECEF position and velocity.
+        """
+        gps_ms = nav_data.gps_week * MS_PER_WEEK + nav_data.tow * 10
+        fix = (
+            nav_data.ecef_x / 100,
+            nav_data.ecef_y / 100,
+            nav_data.ecef_z / 100,
+            nav_data.ecef_vx / 100,
+            nav_data.ecef_vy / 100,
+            nav_data.ecef_vz / 100,
+        )
+        offset: _Vector = (0.0,) * 6
+        if self._blend_ms > 0:
+            predicted = self.state(gps_ms)
+            if predicted is not None:
+                offset = _add((*predicted.position, *predicted.velocity), fix, -1)
+
+        x, y, z, vx, vy, vz = fix
+        # queries in between only move the cache on from the old seed, which is replaced here
+        with self._lock:
+            # the inertial velocity picks up the earth's rotation
+            self._seed = (x, y, z, vx - EARTH_ROTATION * y, vy + EARTH_ROTATION * x, vz)
+            self._epoch_ms = gps_ms
+            self._cache_dt = 0.0
+            self._cache = self._seed
+            self._offset = offset
+
+    def state(self, gps_ms: int) -> State | None:
+        """Get the state at a time.
+
+        Parameters
+        ----------
+        gps_ms
+            GPS time in milliseconds since the GPS epoch, before or after the last fix.
+
+        Returns
+        -------
+        State | None
+            The state, or None if there's no fix or it's more than max_age from the time.
+        """
+        with self._lock:
+            if self._epoch_ms is None:
+                return None
+            age_ms = gps_ms - self._epoch_ms
+            if abs(age_ms) > self._max_age_ms:
+                return None
+            dt = age_ms / 1000
+
+            # step on from the last state asked for when it's on the way, usually the case
+            start_dt, s = self._cache_dt, self._cache
+            if not (0 <= start_dt <= dt or dt <= start_dt <= 0):
+                start_dt, s = 0.0, self._seed
+            if dt != start_dt:
+                n = ceil(abs(dt - start_dt) / self._step)
+                h = (dt - start_dt) / n
+                for _ in range(n):
+                    s = _step(s, h)
+                self._cache_dt, self._cache = dt, s
+            offset = self._offset
+
+        e = _to_ecef(s, dt)
+        if 0 <= age_ms < self._blend_ms:
+            e = _add(e, offset, 1 - age_ms / self._blend_ms)
+        return State(gps_ms, e[:3], e[3:], age_ms)
+
+
+class _Read(NamedTuple):
+    """A read of the propagated state in progress."""
+
+    time: int
+    started: float
+    state: State | None
+    fields: set[int]
+    """Fields served so far"""
+
+
+class Readout:
+    """Serves every field of one read of the propagated state from the same state.
+
+    Readers get the fields one at a time, e.g. a sub per SDO transfer, and a state for each would
+    mix instants. A reader is served one state until it asks for a field again, asks for another
+    time or `window` seconds pass, when the field starts a new read with a new state. Each thread
+    reads on its own, so the SDO server and TPDOs built on the service thread don't mix either.
+    """
+
+    def __init__(self, propagate: Callable[[int], State | None], window: float = 0.5) -> None:
+        """Create a readout.
+
+        Parameters
+        ----------
+        propagate
+            Gets the state at a time, as the reader gives it, e.g. 0 for now.
+        window
+            Most seconds to serve one state for.
+        """
+        self._propagate = propagate
+        self._window = window
+        self._local = local()
+
+    def state(self, time: int, field: int, now: float) -> State | None:
+        """Get the state to serve a field from.
+
+        Parameters
+        ----------
+        time
+            Time asked for, as `propagate` takes it.
+        field
+            Index of the field, any number unique to it.
+        now
+            `time.monotonic()` time.
+
+        Returns
+        -------
+        State | None
+            The state of the read, None if there was nothing to propagate.
+        """
+        read: _Read | None = getattr(self._local, "read", None)
+        if (
+            read is None
+            or read.time != time
+            or now - read.started > self._window
+            or field in read.fields
+        ):
+            read = _Read(time, now, self._propagate(time), set())
+            self._local.read = read
+        read.fields.add(field)
+        return read.state
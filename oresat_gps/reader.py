@@ -0,0 +1,162 @@
+"""Background SkyTraq reader.
+
+Drains the SkyTraq serial interface on a dedicated thread into a bounded ring of decoded messages,
+so the UART keeps being emptied while the service loop is busy with the OD or a congested CAN bus.
+"""
+
+from collections import deque
+from enum import Enum, unique
+from threading import Condition, Event, Thread
+
+from loguru import logger
+
+from .codec import Message, SkyTraqError
+from .skytraq import SkyTraq
+
+
+@unique
+class OverflowPolicy(Enum):
+    """What a full ring does with a new message."""
+
+    DROP_OLDEST = 0
+    """Evict the oldest queued message to make room, the consumer sees the last N messages"""
+    KEEP_LATEST = 1
+    """Drop everything queued and keep only the new message, the consumer skips to fresh data"""
+
+
+class MessageRing:
+    """Bounded, thread-safe FIFO of decoded SkyTraq messages."""
+
+    def __init__(self, capacity: int, policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST) -> None:
+        """Create a ring.
+
+        Parameters
+        ----------
+        capacity
+            The most messages held before the overflow policy kicks in.
+        policy
+            What to do with a new message when the ring is full.
+        """
+        if capacity < 1:
+            raise ValueError("ring capacity must be at least 1")
+        self._queue: deque[Message] = deque()
+        self._capacity = capacity
+        self._policy = policy
+        self._ready = Condition()
+        self.dropped = 0
+        """Number of messages dropped due to overflow"""
+
+    def put(self, msg: Message) -> None:
+        """Add a message, applying the overflow policy if the ring is full."""
+        with self._ready:
+            if len(self._queue) >= self._capacity:
+                if self._policy == OverflowPolicy.DROP_OLDEST:
+                    self._queue.popleft()
+                    self.dropped += 1
+                else:
+                    self.dropped += len(self._queue)
+                    self._queue.clear()
+            self._queue.append(msg)
+            self._ready.notify()
+
+    def drain(self, timeout: float = 0) -> list[Message]:
+        """Take every message that is ready.
+
+        Parameters
+        ----------
+        timeout
+            How long to wait for a message if none are ready, in seconds.
+
+        Returns
+        -------
+        list[Message]
+            The messages in the order they were received, empty if none arrived in time.
+        """
+        with self._ready:
+            if not self._queue and timeout > 0:
+                self._ready.wait(timeout)
+            msgs = list(self._queue)
+            self._queue.clear()
+        return msgs
+
+    def __len__(self) -> int:
+        """Return the number of messages ready."""
+        return len(self._queue)
+
+
+class SkyTraqReader:
+    """Reads a connected SkyTraq on a dedicated thread into a `MessageRing`."""
+
+    def __init__(
+        self,
+        skytraq: SkyTraq,
+        capacity: int = 32,
+        policy: OverflowPolicy = OverflowPolicy.DROP_OLDEST,
+    ) -> None:
+        """Create a reader, the thread isn't started until `start()`.
+
+        Parameters
+        ----------
+        skytraq
+            The SkyTraq to read from.
+        capacity
+            The most messages to hold for the consumer.
+        policy
+            What to do with a new message when the consumer has fallen behind.
+        """
+        self._skytraq = skytraq
+        self.ring = MessageRing(capacity, policy)
+        self._event = Event()
+        self._thread: Thread | None = None
+        self._error: Exception | None = None
+        self.read_errors = 0
+        """Number of failed reads, e.g. timeouts or undecodable messages"""
+
+    def start(self) -> None:
+        """Start reading, should be called once the SkyTraq is connected."""
+        if self.is_running:
+            return
+        self._event.clear()
+        self._thread = Thread(target=self._run, name="skytraq-reader", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop reading, should be called before the SkyTraq is disconnected.
+
+        Waits for the read in progress to finish, at most the serial timeout.
+        """
+        self._event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def is_running(self) -> bool:
+        """bool: The reader thread is running."""
+        return self._thread is not None and self._thread.is_alive()
+
+    def drain(self, timeout: float = 0) -> list[Message]:
+        """Take every message that is ready, see `MessageRing.drain()`.
+
+        Raises
+        ------
+        Exception
+            Whatever unexpected error stopped the reader thread, re-raised in the consumer.
+        """
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+        return self.ring.drain(timeout)
+
+    def _run(self) -> None:
+        while not self._event.is_set():
+            try:
+                msg = self._skytraq.read()
+            except SkyTraqError as e:
+                logger.debug(e)
+                self.read_errors += 1
+                continue
+            except Exception as e:  # noqa: BLE001
+                self._error = e
+                return
+            self.ring.put(msg)
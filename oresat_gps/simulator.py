@@ -0,0 +1,178 @@
+"""Synthetic SkyTraq receiver for load testing.
+
+Generates valid navigation data messages from a circular orbit, as fast as they're read and
+timestamped on a virtual clock, so the decoder and the service loop can be driven at any update
+rate without hardware. Corrupt, truncated and non-navigation frames can be mixed in at set rates,
+from a seeded generator so a run can be repeated exactly.
+"""
+
+import math
+from random import Random
+from typing import NamedTuple
+
+from .codec import MESSAGE_TYPES, FixMode, NavData
+from .propagator import EARTH_MU, EARTH_RADIUS, EARTH_ROTATION
+from .skytraq import MockSkyTraq, SkyTraq
+
+_NAV_FMT = MESSAGE_TYPES[0xA8].fmt
+_NON_NAV_FRAMES = (
+    SkyTraq.encode_binary(0xB9, b"\x00"),  # power mode status
+    SkyTraq.encode_binary(0xDC, bytes(9)),  # measurement time
+    SkyTraq.encode_binary(0x01, b"\x00"),  # not a known output message
+)
+
+
+class Orbit(NamedTuple):
+    """Circular orbit the simulated receiver flies."""
+
+    altitude: float = 500e3
+    """Altitude in meters above the equatorial radius"""
+    inclination: float = 97.4
+    """Inclination in degrees"""
+    gps_week: int = 2400
+    """GPS week of the start of the simulation, at the ascending node"""
+    tow: float = 0.0
+    """GPS time of week of the start of the simulation, in seconds"""
+
+
+class Faults(NamedTuple):
+    """How often the simulated receiver sends something other than a good navigation frame."""
+
+    corrupt_rate: float = 0.0
+    """Fraction of navigation frames sent with a bad checksum"""
+    truncate_rate: float = 0.0
+    """Fraction of navigation frames cut short"""
+    non_nav_rate: float = 0.0
+    """Fraction of navigation frames followed by a non-navigation frame"""
+
+
+class SimulatedSkyTraq(MockSkyTraq):
+    """A simulated SkyTraq driver that generates navigation data from a propagated orbit.
+
+    Every read returns the next frame straight away, the receiver's time only moves on a virtual
+    clock by one update period per navigation message. ACKs every command like `MockSkyTraq`.
+    """
+
+    def __init__(
+        self,
+        rate: int = 10,
+        *,
+        seed: int = 0,
+        orbit: Orbit = Orbit(),  # noqa: B008
+        faults: Faults = Faults(),  # noqa: B008
+        frames_per_read: int = 1,
+    ) -> None:
+        """Create a SimulatedSkyTraq.
+
+        Parameters
+        ----------
+        rate
+            Navigation messages per second of virtual time.
+        seed
+            Seed for the noise and the injected frames.
+        orbit
+            The orbit to fly.
+        faults
+            The rates to inject bad and non-navigation frames at.
+        frames_per_read
+            Navigation frames returned per serial read, to model the UART buffering up.
+        """
+        super().__init__()
+        if rate < 1:
+            raise ValueError("rate must be at least 1")
+        self._period = 1 / rate
+        self.mock_update_rate = rate
+        self._random = Random(seed)  # noqa: S311
+        self._radius = EARTH_RADIUS + orbit.altitude
+        self._mean_motion = math.sqrt(EARTH_MU / self._radius**3)
+        self._inclination = math.radians(orbit.inclination)
+        self._start = orbit.gps_week * 604_800 + orbit.tow
+        self._faults = faults
+        self._frames_per_read = frames_per_read
+        self.clock = 0.0
+        """Virtual seconds since the simulation started"""
+        self.nav_frames = 0
+        """Navigation frames generated, including the corrupt and truncated ones"""
+        self.corrupted = 0
+        """Navigation frames sent with a bad checksum"""
+        self.truncated = 0
+        """Navigation frames cut short"""
+        self.non_nav_frames = 0
+        """Non-navigation frames sent"""
+
+    def nav_data(self, t: float) -> NavData:
+        """Get the navigation data the receiver reports at a time.
+
+        Parameters
+        ----------
+        t
+            Virtual seconds since the simulation started.
+        """
+        # circular orbit with the ascending node on the x axis at t = 0, in an inertial frame
+        u = self._mean_motion * t
+        cos_u, sin_u = math.cos(u), math.sin(u)
+        cos_i, sin_i = math.cos(self._inclination), math.sin(self._inclination)
+        speed = self._radius * self._mean_motion
+        x, y, z = self._radius * cos_u, self._radius * sin_u * cos_i, self._radius * sin_u * sin_i
+        vx, vy, vz = -speed * sin_u, speed * cos_u * cos_i, speed * cos_u * sin_i
+
+        # rotate into the earth fixed frame, the velocity picks up the earth's rotation
+        theta = EARTH_ROTATION * t
+        cos_t, sin_t = math.cos(theta), math.sin(theta)
+        ex, ey = x * cos_t + y * sin_t, -x * sin_t + y * cos_t
+        evx = vx * cos_t + vy * sin_t + EARTH_ROTATION * ey
+        evy = -vx * sin_t + vy * cos_t - EARTH_ROTATION * ex
+
+        # spherical earth is close enough for load testing
+        latitude = math.degrees(math.atan2(z, math.hypot(ex, ey)))
+        longitude = math.degrees(math.atan2(ey, ex))
+        altitude = self._radius - EARTH_RADIUS
+
+        gps_time = self._start + t
+        week, tow = divmod(gps_time, 604_800)
+        pdop = 120 + self._random.randrange(60)
+        return NavData(
+            0xA8,
+            FixMode.FIX_3D.value,
+            6 + self._random.randrange(6),
+            int(week),
+            round(tow * 100),
+            round(latitude * 1e7),
+            round(longitude * 1e7),
+            round(altitude * 100),
+            round(altitude * 100),
+            pdop + 40,
+            pdop,
+            pdop * 2 // 3,
+            pdop * 3 // 4,
+            pdop // 2,
+            round(ex * 100),
+            round(ey * 100),
+            round(z * 100),
+            round(evx * 100),
+            round(evy * 100),
+            round(vz * 100),
+        )
+
+    def _mock_chunk(self) -> bytes:
+        chunk = bytearray()
+        for _ in range(self._frames_per_read):
+            chunk += self._next_frames()
+        return bytes(chunk)
+
+    def _next_frames(self) -> bytes:
+        frame = bytearray(self.encode_binary(0xA8, _NAV_FMT.pack(*self.nav_data(self.clock))[1:]))
+        self.nav_frames += 1
+        self.clock = self.nav_frames * self._period
+
+        rand = self._random.random
+        if rand() < self._faults.corrupt_rate:
+            frame[5 + self._random.randrange(len(frame) - 8)] ^= 0xFF
+            self.corrupted += 1
+        elif rand() < self._faults.truncate_rate:
+            del frame[self._random.randrange(4, len(frame) - 1) :]
+            self.truncated += 1
+        if rand() < self._faults.non_nav_rate:
+            frame += self._random.choice(_NON_NAV_FRAMES)
+            self.non_nav_frames += 1
+        return bytes(frame)
@@ -1,61 +1,207 @@
-"""SkyTraq serial driver."""
+"""SkyTraq serial driver.
 
-import struct
-from collections.abc import Iterable
-from enum import Enum, unique
-from functools import reduce
-from operator import xor
+The serial port and GPIO libraries are only imported by the methods that use the hardware, so
+`MockSkyTraq` and the replay and simulated SkyTraqs work without them and start quicker.
+"""
+
+from collections import deque
 from pathlib import Path
-from time import sleep
+from threading import Event, Lock
+from time import monotonic, perf_counter_ns, sleep
 from typing import TYPE_CHECKING, NamedTuple
 
 if TYPE_CHECKING:
+    from collections.abc import Iterator
+
     import gpiod
 
-from gpiod.line import Value
-from olaf import logger
-from serial import Serial, SerialException
+from loguru import logger
+
+from oresat_gps.capture import CaptureRecorder, capture_files, read_captures
+from oresat_gps.codec import (
+    BINARY_END,
+    BINARY_START,
+    Ack,
+    FixMode,
+    FrameDecoder,
+    GpsEphemeris,
+    Message,
+    Nack,
+    NavData,
+    PositionUpdateRate,
+    SkyTraqError,
+    checksum,
+    encode_binary,
+    encode_binary_into,
+)
+from oresat_gps.gps_time import MS_PER_WEEK
+from oresat_gps.metrics import PipelineMetrics
+
+
+class StartupTiming(NamedTuple):
+    """When the SkyTraq reached each step of its startup, as `time.monotonic()` timestamps."""
+
+    power_on: float
+    uart_alive: float | None = None
+    """First bytes received after power on"""
+    binary_mode: float | None = None
+    """Swap to binary mode ACKed"""
+    first_fix: float | None = None
+    """First navigation data with a fix"""
+    binary_mode_attempts: int = 0
+
+
+class TimeMark(NamedTuple):
+    """When a fix started arriving, to discipline the system clock to."""
+
+    gps_ms: int
+    """GPS time of the fix, in milliseconds since the GPS epoch"""
+    received: float
+    """`time.monotonic()` time the first byte of the fix was received at"""
+
+
+class PendingCommand:
+    """A command waiting on its ACK or NACK."""
+
+    def __init__(self, msg_id: int, timeout: float) -> None:
+        """Create a pending command.
+
+        Parameters
+        ----------
+        msg_id
+            The command message ID, ACKs and NACKs refer back to it.
+        timeout
+            How long to wait for the reply, in seconds.
+        """
+        self.msg_id = msg_id
+        self.deadline = monotonic() + timeout
+        self.reply: Ack | Nack | None = None
+        """The ACK or NACK, None until it arrives or if the command timed out"""
+        self._done = Event()
 
-from oresat_gps._gpio import request_gpio_output
+    def done(self) -> bool:
+        """Return True once the command has been answered or has timed out."""
+        return self._done.is_set()
 
+    def wait(self, timeout: float | None = None) -> bool:
+        """Wait for the command to be answered or time out.
+
+        Parameters
+        ----------
+        timeout
+            How long to wait, in seconds, or None to wait until done.
+
+        Returns
+        -------
+        bool
+            True if the command is done.
+        """
+        return self._done.wait(timeout)
 
-class NavData(NamedTuple):
-    '''Raw Navigation data returned from a SkyTraq.'''
+    def _finish(self, reply: Ack | Nack | None) -> None:
+        self.reply = reply
+        self._done.set()
 
-    message_id: int
-    fix_mode: int
-    number_of_sv: int
-    gps_week: int
-    tow: int
-    latitude: int
-    longitude: int
-    ellipsoid_alt: int
-    mean_sea_lvl_alt: int
-    gdop: int
-    pdop: int
-    hdop: int
-    vdop: int
-    tdop: int
-    ecef_x: int
-    ecef_y: int
-    ecef_z: int
-    ecef_vx: int
-    ecef_vy: int
-    ecef_vz: int
 
+class CommandEngine:
+    """Tracks in-flight SkyTraq commands and routes ACK and NACK replies to them.
 
-class SkyTraqError(Exception):
-    """An error occurred with the SkyTraq."""
+    Commands are answered with an ACK or NACK that arrives in the same stream as the navigation
+    data, so the replies are picked out of the stream and handed to the command waiting for them
+    while everything else carries on to the normal consumer. Any number of commands may be in
+    flight at once, commands with the same message ID are answered in the order they were sent.
+    """
 
+    def __init__(self) -> None:
+        self._pending: dict[int, deque[PendingCommand]] = {}
+        self._lock = Lock()
+        self.acks = 0
+        """Number of commands ACKed"""
+        self.nacks = 0
+        """Number of commands NACKed"""
+        self.timeouts = 0
+        """Number of commands that timed out"""
+
+    def track(self, msg_id: int, timeout: float) -> PendingCommand:
+        """Start tracking a command, call this before sending it.
 
-@unique
-class FixMode(Enum):
-    """Quality of fix."""
+        Parameters
+        ----------
+        msg_id
+            The command message ID.
+        timeout
+            How long to wait for the reply, in seconds.
 
-    NO_FIX = 0
-    FIX_2D = 1
-    FIX_3D = 2
-    FIX_3D_DGPS = 3
+        Returns
+        -------
+        PendingCommand
+            The command, done once its reply is routed or it times out.
+        """
+        cmd = PendingCommand(msg_id, timeout)
+        with self._lock:
+            self._pending.setdefault(msg_id, deque()).append(cmd)
+        return cmd
+
+    def route(self, msg: Message) -> bool:
+        """Hand a received message to the command waiting for it, if there is one.
+
+        Parameters
+        ----------
+        msg
+            A message received from the SkyTraq.
+
+        Returns
+        -------
+        bool
+            True if the message was a reply to an in-flight command, False if it should carry on to
+            the normal consumer.
+        """
+        if not isinstance(msg, (Ack, Nack)):
+            return False
+        with self._lock:
+            waiters = self._pending.get(msg.ack_id)
+            if not waiters:
+                return False
+            cmd = waiters.popleft()
+            if isinstance(msg, Ack):
+                self.acks += 1
+            else:
+                self.nacks += 1
+        cmd._finish(msg)  # noqa: SLF001
+        return True
+
+    def expire(self) -> None:
+        """Time out every command past its deadline."""
+        now = monotonic()
+        with self._lock:
+            expired = [cmd for w in self._pending.values() for cmd in w if cmd.deadline <= now]
+            for cmd in expired:
+                self._pending[cmd.msg_id].remove(cmd)
+            self.timeouts += len(expired)
+        for cmd in expired:
+            cmd._finish(None)  # noqa: SLF001
+
+    def cancel(self, cmd: PendingCommand) -> None:
+        """Give up on a command, e.g. when it couldn't be sent."""
+        with self._lock:
+            waiters = self._pending.get(cmd.msg_id)
+            if waiters and cmd in waiters:
+                waiters.remove(cmd)
+        cmd._finish(None)  # noqa: SLF001
+
+    def cancel_all(self) -> None:
+        """Give up on every in-flight command, e.g. when the SkyTraq is disconnected."""
+        with self._lock:
+            cmds = [cmd for waiters in self._pending.values() for cmd in waiters]
+            self._pending.clear()
+        for cmd in cmds:
+            cmd._finish(None)  # noqa: SLF001
+
+    @property
+    def in_flight(self) -> int:
+        """int: Number of commands waiting on a reply."""
+        with self._lock:
+            return sum(len(waiters) for waiters in self._pending.values())
 
 
 class SkyTraq:
@@ -79,14 +225,31 @@ class SkyTraq:
     CS := 0x0b ^ 0x00 = 0x0b
     """
 
-    BINARY_START: bytes = b'\xa0\xa1'
+    BINARY_START: bytes = BINARY_START
     """SkyTraq binary message start bytes"""
-    BINARY_END: bytes = b'\x0d\x0a'
+    BINARY_END: bytes = BINARY_END
     """SkyTraq binary message end bytes"""
     MSG_ID_ACK = 0x83
     MSG_ID_NACK = 0x84
 
     BAUD = 115200
+    """Baud rate the receiver powers up with"""
+    BAUD_RATES = (4800, 9600, 19200, 38400, 57600, 115200, 230400, 460800, 921600)
+    """Baud rates the receiver supports, indexed by their code in the configure serial command"""
+    UPDATE_RATES = (1, 2, 4, 5, 8, 10, 20, 25, 40, 50)
+    """Position update rates the receiver supports, in Hz"""
+    READ_TIMEOUT = 1.0
+    """Longest a read of the serial port blocks for, in seconds, unless a command is due sooner"""
+    UART_ALIVE_TIMEOUT = 3.0
+    """How long to wait for the receiver to start talking after power on, in seconds"""
+    BINARY_MODE_ATTEMPTS = 6
+    """How many times to try the swap to binary mode"""
+    BINARY_MODE_TIMEOUT = 0.1
+    """ACK timeout of the first swap to binary mode, doubled on each retry up to 1 s"""
+    GPS_SVS = 32
+    """Number of GPS SVs, the ephemeris query is replied to once for each"""
+    MAX_PAYLOAD_LEN = 2048
+    """Longest payload accepted from the receiver, anything longer is treated as a false start"""
 
     def __init__(self, port: Path) -> None:
         """Create a SkyTraq instance associated with a specific serial interface.
@@ -97,170 +260,539 @@ class SkyTraq:
                 Serial port to use.
         """
         self._port = port
-
-    def _check_for_ack(self, expected_msg_id: int, read_count: int = 10) -> bool:
-        """Read and check for ACK/NACK.
-
-        This is called after sending a command.
+        self._decoder = FrameDecoder(self.MAX_PAYLOAD_LEN)
+        # last_packet may be read from another thread than the one reading the serial interface
+        self._lock = Lock()
+        # only one thread reads the serial interface at a time, see command()
+        self._read_lock = Lock()
+        self._commands = CommandEngine()
+        self._backlog: deque[Message] = deque(maxlen=32)
+        self._time_marks: deque[TimeMark] = deque(maxlen=16)
+        self.baud = self.BAUD
+        """Current baud rate of the serial link"""
+        self.target_baud = self.BAUD
+        """Baud rate to negotiate on connect"""
+        self.update_rate: int | None = None
+        """Position update rate to set on connect, in Hz, None to keep the receiver's own"""
+        self.startup = StartupTiming(monotonic())
+        """When each startup step of the current power cycle happened"""
+        self.recorder: CaptureRecorder | None = None
+        """Optional recorder every chunk read from the serial interface is written to"""
+        self.metrics = PipelineMetrics()
+        """Latency of each stage of the pipeline, the driver fills in read, decode and checksum"""
+        self._decoder.checksum_timer = self.metrics.checksum
+        self._decoder.byte_time = self._byte_time(self.baud)
+
+    def send_command(self, msg_id: int, body: bytes, timeout: float = 1) -> PendingCommand:
+        """Send a command without waiting for its ACK or NACK.
+
+        The reply is picked out of the message stream by whichever thread is reading, every other
+        message still goes to the normal consumer.
 
         Parameters
         ----------
-        expected_msg_id
-            The expected message ID for the previously sent message.
-        read_count
-            The number of attempts to look for ACK/NACK.
+        msg_id
+            The command message ID.
+        body
+            The command message body.
+        timeout
+            How long to wait for the ACK or NACK, in seconds.
 
         Returns
         -------
-        bool
-            True for ACK, False for NACK.
+        PendingCommand
+            The command, done once its reply arrives or it times out.
 
         Raises
         ------
         SkyTraqError
-            Incorrect or missing ACK or NACK
+            Error writing the command.
         """
-        for _ in range(read_count):
-            try:
-                raw = self._read()
-            except SkyTraqError as e:
-                logger.error(f"Error reading ACK: {e}")
-                continue
-            csum = raw[-1]
-            payload = raw[:-1]
-            if csum != self.checksum(payload):
-                continue
-            msg_id = payload[0]
-            if msg_id == self.MSG_ID_ACK:
-                if payload[1] != expected_msg_id:
-                    raise SkyTraqError(f"ACK for wrong message: {payload[1]:#x}")
-                return True
-            if msg_id == self.MSG_ID_NACK:
-                logger.warning(f"NACK for {expected_msg_id:#x}")
-                return False
-        raise SkyTraqError("No ACK or NACK received")
+        cmd = self._commands.track(msg_id, timeout)
+        try:
+            self._write(self.encode_binary(msg_id, body))
+        except SkyTraqError:
+            self._commands.cancel(cmd)
+            raise
+        return cmd
 
-    def _read(self) -> bytes:
-        r"""Read from skytraq serial interface.
+    def command(self, msg_id: int, body: bytes, timeout: float = 1) -> Ack | Nack:
+        """Send a command and wait for its ACK or NACK.
 
-        format:
-            [0xA0A1][PL][ID][P][CS][\r\n]
-            PL = payload length
-            ID = unique id
-            P = payload
-            CS = checksum
+        If no other thread is reading the SkyTraq, the calling thread reads until the reply
+        arrives. Messages read in the meantime are kept for the next `read()`.
+
+        Parameters
+        ----------
+        msg_id
+            The command message ID.
+        body
+            The command message body.
+        timeout
+            How long to wait for the ACK or NACK, in seconds.
+
+        Returns
+        -------
+        Ack | Nack
+            The receiver's reply.
 
         Raises
         ------
         SkyTraqError
-            An error occurred.
+            Error writing the command or no ACK or NACK arrived in time.
+        """
+        cmd = self.send_command(msg_id, body, timeout)
+        while not cmd.done():
+            if self._read_lock.acquire(blocking=False):
+                try:
+                    msg = self._read_message(cmd)
+                    if msg is not None:
+                        self._backlog.append(msg)
+                except SkyTraqError as e:
+                    logger.debug(e)
+                finally:
+                    self._read_lock.release()
+            else:
+                cmd.wait(0.01)
+            self._commands.expire()
+        if cmd.reply is None:
+            raise SkyTraqError(f"No ACK or NACK for {msg_id:#x}")
+        if isinstance(cmd.reply, Nack):
+            logger.warning(f"NACK for {msg_id:#x}")
+        return cmd.reply
+
+    def _write(self, data: bytes) -> None:
+        """Write to the serial interface.
+
+        Raises
+        ------
+        SkyTraqError
+            An error occurred on the serial write.
+        """
+        try:
+            self._ser.write(data)
+        except OSError as e:  # SerialException is an OSError
+            raise SkyTraqError("Error writing GPS line") from e
+
+    def _read_chunk(self, timeout: float | None = None) -> bytes:
+        """Read everything waiting on the serial interface, blocking for at least one byte.
+
+        Parameters
+        ----------
+        timeout
+            Longest to block for, in seconds, if shorter than the port's read timeout.
 
         Returns
         -------
         bytes
-            The payload bytes and checksum byte.
+            The bytes read, empty if the read timed out.
 
         Raises
         ------
         SkyTraqError
-            An error occurred on the serial read or the packet is invalid.
+            An error occurred on the serial read.
         """
+        ser = self._ser
         try:
-            self._ser.read_until(self.BINARY_START)
-            payload_len_raw = self._ser.read(2)
-            payload_len = int.from_bytes(payload_len_raw, byteorder="big")
-            remaining = self._ser.read(payload_len + 3)
-            if remaining[-2:] != self.BINARY_END:
-                raise SkyTraqError("Invalid binary message")
-            return remaining[:-2]
-        except SerialException as e:
+            waiting = ser.in_waiting
+            port_timeout = ser.timeout
+            if waiting or timeout is None or port_timeout is None or timeout >= port_timeout:
+                return ser.read(waiting or 1)
+            # nothing to read yet, wait no longer than asked
+            ser.timeout = timeout
+            try:
+                return ser.read(1)
+            finally:
+                ser.timeout = port_timeout
+        except OSError as e:  # SerialException is an OSError
             raise SkyTraqError("Error reading GPS line") from e
 
-    def read(self) -> tuple[NavData, bytes]:
-        """Read a message from the SkyTraq.
+    def read(self) -> Message:
+        """Read the next known message from the SkyTraq.
+
+        Messages with an id that isn't in `MESSAGE_TYPES` are skipped, as are ACKs and NACKs for
+        commands in flight. The raw payload of the last message received is available from
+        `last_packet`.
 
         Returns
         -------
-        tuple[NavData, bytes]
-            The Navigation Data and the raw data.
+        Message
+            The decoded message.
 
         Raises
         ------
         SkyTraqError
-            Invalid checksum or error unpacking.
+            An error occurred on the serial read, no message arrived before the timeout or the
+            message couldn't be unpacked.
         """
-        msg = self._read()
-        csum = msg[-1]
-        payload = msg[:-1]
-        if csum != self.checksum(payload):
-            raise SkyTraqError("Invalid checksum")
-
-        try:
-            nav_data = NavData(*struct.unpack(">3BHI2i2I5H6i", payload))
-        except (struct.error, TypeError) as e:
-            raise SkyTraqError("Error unpacking payload") from e
+        with self._read_lock:
+            if self._backlog:
+                return self._backlog.popleft()
+            msg = None
+            while msg is None:
+                msg = self._read_message()
+            return msg
+
+    def _read_message(self, cmd: PendingCommand | None = None) -> Message | None:
+        """Read until a message for the consumer arrives or cmd is done.
+
+        Must be called with the read lock held.
+        """
+        metrics = self.metrics
+        while True:
+            t0 = perf_counter_ns()
+            with self._lock:
+                msg = self._decoder.next_message()
+            if msg is not None:
+                metrics.decode.observe(perf_counter_ns() - t0)
+                if isinstance(msg, NavData) and msg.fix_mode != FixMode.NO_FIX.value:
+                    self._on_fix(msg)
+                if not self._commands.route(msg):
+                    return msg
+                if cmd is not None and cmd.done():
+                    return None
+                continue
+            if cmd is not None and cmd.done():
+                return None
+            t0 = perf_counter_ns()
+            # a command's ACK timeout is often shorter than a read's, don't block past it
+            chunk = self._read_chunk(None if cmd is None else max(cmd.deadline - monotonic(), 0))
+            received = monotonic()
+            metrics.read.observe(perf_counter_ns() - t0)
+            self._commands.expire()
+            if not chunk:
+                if cmd is not None and cmd.done():
+                    return None
+                raise SkyTraqError("Timed out reading GPS line")
+            if self.recorder is not None:
+                self.recorder.write(chunk)
+            with self._lock:
+                self._decoder.feed(chunk, received)
+
+    def _on_fix(self, nav_data: NavData) -> None:
+        """Note when a fix arrived, must be called straight after it's decoded."""
+        now = monotonic()
+        if self.startup.first_fix is None:
+            self.startup = self.startup._replace(first_fix=now)
+        received = self._decoder.last_received
+        if received is not None:
+            self.metrics.arrival.observe(round((now - received) * 1e9))
+            # the skytraq tow field is centiseconds, see AN0037 Navigation Data Message
+            gps_ms = nav_data.gps_week * MS_PER_WEEK + nav_data.tow * 10
+            self._time_marks.append(TimeMark(gps_ms, received))
+
+    def time_marks(self) -> list[TimeMark]:
+        """Take the time marks of the fixes read since the last call.
 
-        return nav_data, payload
+        Returns
+        -------
+        list[TimeMark]
+            The time marks, oldest first. Only the last 16 are kept.
+        """
+        marks = []
+        while self._time_marks:
+            marks.append(self._time_marks.popleft())
+        return marks
 
     @staticmethod
-    def checksum(payload: Iterable[int]) -> int:
-        return reduce(xor, payload, 0)
+    def _byte_time(baud: int) -> float:
+        """Get the seconds a byte takes on the line, 8N1 is 10 bits a byte."""
+        return 10 / baud
 
-    @classmethod
-    def encode_binary(cls, message_id: int, body: bytes) -> bytes:
-        """Encode a message ID and body into a SkyTraq binary message.
+    @property
+    def last_packet(self) -> bytes:
+        """bytes: The raw payload (message id and body) of the last message read."""
+        with self._lock:
+            return self._decoder.last_packet
+
+    def counters(self) -> dict[str, int]:
+        """Get the error and reply counters of the link.
+
+        Returns
+        -------
+        dict[str, int]
+            Checksum failures, resyncs and bytes discarded by the decoder, and the ACKs, NACKs and
+            timeouts of commands.
+        """
+        decoder = self._decoder
+        commands = self._commands
+        return {
+            "checksum_failures": decoder.checksum_failures,
+            "resyncs": decoder.resyncs,
+            "bytes_discarded": decoder.bytes_discarded,
+            "acks": commands.acks,
+            "nacks": commands.nacks,
+            "timeouts": commands.timeouts,
+        }
+
+    checksum = staticmethod(checksum)
+    encode_binary_into = staticmethod(encode_binary_into)
+    encode_binary = staticmethod(encode_binary)
+
+    def connect(self) -> None:
+        """Power on and connect to the Skytraq receiver serial interface.
+
+        Rather than fixed delays, the connect waits for the receiver to start talking on the UART
+        after power on, then retries the swap to binary mode with a growing ACK timeout. When
+        each step happened is recorded in `startup`.
+
+        Raises
+        ------
+        SkyTraqError
+            Error initializing the SkyTraq
+        """
+        from serial import Serial  # noqa: PLC0415
+
+        # open the port first so nothing the receiver sends after power on is missed
+        self._ser = Serial(str(self._port), self.BAUD, timeout=self.READ_TIMEOUT)
+        self.baud = self.BAUD
+        with self._lock:
+            self._decoder.clear()
+        self._backlog.clear()
+        self.startup = StartupTiming(monotonic())
+        self._power_on()
+
+        self._wait_for_uart()
+        self._binary_mode()
+
+        # the faster link first, high update rates need it
+        if self.target_baud != self.BAUD:
+            self.set_baud(self.target_baud)
+        if self.update_rate is not None:
+            try:
+                self.set_update_rate(self.update_rate)
+            except SkyTraqError as e:
+                logger.error(e)
+
+    def _power_on(self) -> None:
+        """Power on the receiver, for boards that can."""
+
+    def _power_off(self) -> None:
+        """Power off the receiver, for boards that can."""
+
+    def _wait_for_uart(self) -> None:
+        """Wait for the first bytes from the receiver after power on."""
+        deadline = self.startup.power_on + self.UART_ALIVE_TIMEOUT
+        while monotonic() < deadline:
+            # whatever arrives is boot or NMEA output from before the swap to binary mode
+            if self._read_chunk():
+                self.startup = self.startup._replace(uart_alive=monotonic())
+                return
+        logger.warning(f"no UART activity from SkyTraq {self.UART_ALIVE_TIMEOUT} s after power on")
+
+    def _binary_mode(self) -> None:
+        """Swap the receiver to binary mode, retrying with a growing ACK timeout.
+
+        Raises
+        ------
+        SkyTraqError
+            No ACK for binary mode on any attempt.
+        """
+        timeout = self.BINARY_MODE_TIMEOUT
+        for attempt in range(1, self.BINARY_MODE_ATTEMPTS + 1):
+            self.startup = self.startup._replace(binary_mode_attempts=attempt)
+            try:
+                reply = self.command(0x09, b"\x02\x00", timeout)
+            except SkyTraqError as e:
+                logger.debug(f"binary mode attempt {attempt}: {e}")
+            else:
+                if isinstance(reply, Ack):
+                    self.startup = self.startup._replace(binary_mode=monotonic())
+                    return
+            timeout = min(timeout * 2, 1)
+        logger.error("No ACK for Binary mode")
+        raise SkyTraqError("Binary mode not acknowledged")
+
+    def configure(self, baud: int, update_rate: int | None) -> None:
+        """Set the baud rate and position update rate to negotiate on the next connect.
 
         Parameters
         ----------
-        message_id
-            The message ID.
-        body
-            The message body.
+        baud
+            The baud rate, one of `BAUD_RATES`.
+        update_rate
+            The update rate in Hz, one of `UPDATE_RATES`, or None to keep the receiver's own.
+
+        Raises
+        ------
+        ValueError
+            Unsupported baud rate or update rate.
+        """
+        if baud not in self.BAUD_RATES:
+            raise ValueError(f"unsupported baud rate {baud}")
+        if update_rate is not None and update_rate not in self.UPDATE_RATES:
+            raise ValueError(f"unsupported update rate {update_rate} Hz")
+        self.target_baud = baud
+        self.update_rate = update_rate
+
+    def set_update_rate(self, rate: int) -> None:
+        """Set the receiver's position update rate, until it is power cycled.
+
+        Parameters
+        ----------
+        rate
+            The update rate in Hz, one of `UPDATE_RATES`.
+
+        Raises
+        ------
+        ValueError
+            Unsupported update rate.
+        SkyTraqError
+            The receiver didn't ACK the new rate.
+        """
+        if rate not in self.UPDATE_RATES:
+            raise ValueError(f"unsupported update rate {rate} Hz")
+        # configure position update rate, attributes: SRAM only
+        if not isinstance(self.command(0x0E, bytes([rate, 0])), Ack):
+            raise SkyTraqError(f"Update rate {rate} Hz not acknowledged")
+        self.update_rate = rate
+        logger.info(f"SkyTraq update rate is now {rate} Hz")
+
+    def query_update_rate(self, timeout: float = 1.0) -> int:
+        """Query the receiver's position update rate.
+
+        Reads the reply itself, so must not be called while a `SkyTraqReader` is reading. Other
+        messages read while waiting for it are kept for the next `read()`.
+
+        Parameters
+        ----------
+        timeout
+            Seconds to wait for the reply after the ACK.
 
         Returns
         -------
-        bytes
-            The encoded message.
+        int
+            The update rate in Hz.
 
         Raises
         ------
-        OverflowError
-            If message_id > 1 byte or body > 65534 bytes. SkyTraq limits total
-            payload size to 65535 bytes (id + body).
+        SkyTraqError
+            The receiver didn't ACK the query or reply in time.
         """
-        msg_bytes: bytes = message_id.to_bytes(1, byteorder="big")
-        payload_length: bytes = (1 + len(body)).to_bytes(2, byteorder="big")
-        payload_bytes: bytearray = bytearray(msg_bytes)
-        payload_bytes += body
-        cs: bytes = cls.checksum(payload_bytes).to_bytes(1, byteorder="big")
-        # <0xA0,0xA1><PL><Message ID><Message Body><CS><0x0D,0x0A>
-        payload_bytes[0:0] = cls.BINARY_START + payload_length
-        payload_bytes += cs + cls.BINARY_END
-        return bytes(payload_bytes)
+        # query position update rate
+        if not isinstance(self.command(0x10, b""), Ack):
+            raise SkyTraqError("Update rate query not acknowledged")
+        skipped: list[Message] = []
+        deadline = monotonic() + timeout
+        try:
+            while monotonic() < deadline:
+                msg = self.read()
+                if isinstance(msg, PositionUpdateRate):
+                    return msg.update_rate
+                skipped.append(msg)
+        finally:
+            self._backlog.extend(skipped)
+        raise SkyTraqError("No reply to the update rate query")
 
-    def connect(self) -> None:
-        """Connect to the Skytraq receiver serial interface.
+    def query_ephemeris(self, timeout: float = 1.0) -> list[GpsEphemeris]:
+        """Query the receiver's GPS ephemeris of every SV.
+
+        Reads the replies itself, so must not be called while a `SkyTraqReader` is reading. Other
+        messages read while waiting for them are dropped.
+
+        Parameters
+        ----------
+        timeout
+            Seconds to wait for the replies after the ACK.
+
+        Returns
+        -------
+        list[GpsEphemeris]
+            The ephemeris of each SV the receiver has one for.
 
         Raises
         ------
         SkyTraqError
-            Error initializing the SkyTraq
+            The receiver didn't ACK the query.
         """
-        self._ser = Serial(str(self._port), self.BAUD, timeout=1)
-        # swap to binary mode
-        # for mysterious reasons this only seems to work by clearing the buffer,
-        # sending it, waiting, and then doing that a second time
-        for _ in range(2):
-            self._ser.read(self._ser.in_waiting)
-            self._ser.write(SkyTraq.encode_binary(0x09, b"\x02\x00"))
-            sleep(0.1)
-        if not self._check_for_ack(0x09):
-            logger.error("No ACK for Binary mode")
-            raise SkyTraqError("Binary mode not acknowledged")
+        # get GPS ephemeris, SV 0 for all of them
+        if not isinstance(self.command(0x30, b"\x00"), Ack):
+            raise SkyTraqError("Ephemeris query not acknowledged")
+        ephemeris: dict[int, GpsEphemeris] = {}
+        replies = 0
+        deadline = monotonic() + timeout
+        while replies < self.GPS_SVS and monotonic() < deadline:
+            try:
+                msg = self.read()
+            except SkyTraqError:
+                break
+            if isinstance(msg, GpsEphemeris):
+                replies += 1
+                if any(msg.subframes):
+                    ephemeris[msg.sv_id] = msg
+        return list(ephemeris.values())
+
+    def set_baud(self, baud: int) -> bool:
+        """Switch the serial link to a new baud rate, until the receiver is power cycled.
+
+        The receiver ACKs the configure serial command at the old baud rate, then both ends
+        switch and the new link is verified by a query that has to be ACKed. If anything fails,
+        the link falls back to `BAUD`.
+
+        Parameters
+        ----------
+        baud
+            The new baud rate, one of `BAUD_RATES`.
+
+        Returns
+        -------
+        bool
+            True if the link is at the new baud rate, False if it fell back to `BAUD`.
+
+        Raises
+        ------
+        ValueError
+            Unsupported baud rate.
+        """
+        if baud not in self.BAUD_RATES:
+            raise ValueError(f"unsupported baud rate {baud}")
+        self.target_baud = baud
+        if baud == self.baud:
+            return True
+
+        # configure serial port: COM1, baud rate code, attributes: SRAM only
+        body = bytes([0, self.BAUD_RATES.index(baud), 0])
+        try:
+            switched = isinstance(self.command(0x05, body), Ack)
+        except SkyTraqError:
+            switched = False
+        if switched:
+            self._set_host_baud(baud)
+            switched = self._verify_link()
+        if switched:
+            logger.info(f"SkyTraq link switched to {baud} baud")
+            return True
+
+        logger.error(f"could not switch SkyTraq link to {baud} baud, falling back to {self.BAUD}")
+        self._set_host_baud(self.BAUD)
+        if not self._verify_link():
+            logger.error(f"SkyTraq link not responding at {self.BAUD} baud either")
+        return False
+
+    def _verify_link(self) -> bool:
+        """Check the receiver answers a query over the link."""
+        try:
+            # query position update rate
+            return isinstance(self.command(0x10, b""), Ack)
+        except SkyTraqError:
+            return False
+
+    def _set_host_baud(self, baud: int) -> None:
+        """Switch the host end of the serial link."""
+        self._ser.baudrate = baud
+        self._ser.reset_input_buffer()
+        with self._lock:
+            self._decoder.clear()
+            self._decoder.byte_time = self._byte_time(baud)
+        self.baud = baud
 
     def disconnect(self) -> None:
-        """Disconnect from the Skytraq receiver serial interface."""
+        """Disconnect from the Skytraq receiver serial interface and power it off."""
+        self._commands.cancel_all()
         self._ser.close()
+        self._power_off()
+        if self.recorder is not None:
+            self.recorder.flush()
 
     @property
     def is_connected(self) -> bool:
@@ -273,6 +805,8 @@ class SkyTraq10(SkyTraq):
 
     def __init__(self, path: Path) -> None:
         super().__init__(path)
+        from oresat_gps._gpio import request_gpio_output  # noqa: PLC0415
+
         self._enable: gpiod.LineRequest = request_gpio_output(
             chip_path="/dev/gpiochip2",
             offset=2,
@@ -284,17 +818,19 @@ class SkyTraq10(SkyTraq):
             line_name="MAX_EN",
         )
 
-    def connect(self) -> None:
-        """Enable GPS power domain, then connect to Skytraq receiver serial interface."""
-        self._enable.set_value(self._enable.offsets[0], Value.ACTIVE)
-        self._lna.set_value(self._lna.offsets[0], Value.ACTIVE)
-        super().connect()
+    def _power_on(self) -> None:
+        """Enable GPS power domain."""
+        from oresat_gps._gpio import set_gpio_output  # noqa: PLC0415
 
-    def disconnect(self) -> None:
-        """Diconnect from Skytraq receiver, disable GPS power domain."""
-        super().disconnect()
-        self._lna.set_value(self._lna.offsets[0], Value.INACTIVE)
-        self._enable.set_value(self._enable.offsets[0], Value.INACTIVE)
+        set_gpio_output(self._enable, active=True)
+        set_gpio_output(self._lna, active=True)
+
+    def _power_off(self) -> None:
+        """Disable GPS power domain."""
+        from oresat_gps._gpio import set_gpio_output  # noqa: PLC0415
+
+        set_gpio_output(self._lna, active=False)
+        set_gpio_output(self._enable, active=False)
 
 
 class SkyTraq11(SkyTraq):
@@ -302,27 +838,32 @@ class SkyTraq11(SkyTraq):
 
     def __init__(self, path: Path) -> None:
         super().__init__(path)
+        from oresat_gps._gpio import request_gpio_output  # noqa: PLC0415
+
         self._enable: gpiod.LineRequest = request_gpio_output(
             chip_path="/dev/gpiochip2",
             offset=4,
             line_name="GPS_EN",
         )
 
-    def connect(self) -> None:
-        """Enable GPS power domain, then connect to Skytraq receiver serial interface."""
-        self._enable.set_value(self._enable.offsets[0], Value.ACTIVE)
-        super().connect()
+    def _power_on(self) -> None:
+        """Enable GPS power domain."""
+        from oresat_gps._gpio import set_gpio_output  # noqa: PLC0415
 
-    def disconnect(self) -> None:
-        """Diconnect from Skytraq receiver, disable GPS power domain."""
-        super().disconnect()
-        self._enable.set_value(self._enable.offsets[0], Value.INACTIVE)
+        set_gpio_output(self._enable, active=True)
+
+    def _power_off(self) -> None:
+        """Disable GPS power domain."""
+        from oresat_gps._gpio import set_gpio_output  # noqa: PLC0415
+
+        set_gpio_output(self._enable, active=False)
 
 
 class MockSkyTraq(SkyTraq):
     """A simulated SkyTraq driver that doesn't touch any physical hardware.
 
-    Returns only a message of type 0xA8 - Navigation Data Message.
+    Returns only a message of type 0xA8 - Navigation Data Message, ACKs every command and replies
+    to the update rate query.
     """
 
     MOCK_DATA = (
@@ -333,18 +874,100 @@ class MockSkyTraq(SkyTraq):
     )
 
     def __init__(self) -> None:
+        super().__init__(Path("/dev/null"))
         self._connected = False
-
-    def _read(self) -> bytes:
+        self._replies = bytearray()
+        self.mock_update_rate = 1
+        """Update rate in Hz reported until one is set"""
+
+    def _write(self, data: bytes) -> None:
+        # ACK every command
+        self._replies += self.encode_binary(self.MSG_ID_ACK, data[4:5])
+        if data[4] == 0x10:  # position update rate query
+            rate = self.update_rate or self.mock_update_rate
+            self._replies += self.encode_binary(0x86, bytes([rate]))
+
+    def _read_chunk(self, timeout: float | None = None) -> bytes:  # noqa: ARG002
+        if self._replies:
+            replies = bytes(self._replies)
+            self._replies.clear()
+            return replies
+        return self._mock_chunk()
+
+    def _mock_chunk(self) -> bytes:
+        """Get the next chunk of receiver output, replies to commands are sent ahead of it."""
         sleep(0.5)
         return self.MOCK_DATA
 
+    def _set_host_baud(self, baud: int) -> None:
+        self._decoder.byte_time = self._byte_time(baud)
+        self.baud = baud
+
     def connect(self) -> None:
+        now = monotonic()
+        self.startup = StartupTiming(now, uart_alive=now, binary_mode=now, binary_mode_attempts=1)
         self._connected = True
 
     def disconnect(self) -> None:
         self._connected = False
+        if self.recorder is not None:
+            self.recorder.flush()
 
     @property
     def is_connected(self) -> bool:
         return self._connected
+
+
+class ReplaySkyTraq(MockSkyTraq):
+    """A simulated SkyTraq driver that replays capture files made with a `CaptureRecorder`.
+
+    Replays either at the timing the capture was made with or as fast as the consumer reads, and
+    ACKs every command like `MockSkyTraq`. Once the capture runs out, reads time out like a silent
+    receiver would.
+    """
+
+    def __init__(self, path: Path, *, realtime: bool = True, loop: bool = False) -> None:
+        """Create a ReplaySkyTraq.
+
+        Parameters
+        ----------
+        path
+            A capture file, or a directory of them to replay in the order they were recorded.
+        realtime
+            Replay at the original timing, otherwise as fast as possible.
+        loop
+            Start over from the beginning when the capture runs out.
+        """
+        super().__init__()
+        self._paths = capture_files(path)
+        if not self._paths:
+            raise SkyTraqError(f"No capture files in {path}")
+        self._realtime = realtime
+        self._loop = loop
+        self._chunks: Iterator[tuple[float, bytes]] = iter(())
+        self._offset: float | None = None
+
+    def connect(self) -> None:
+        super().connect()
+        self._chunks = read_captures(self._paths)
+        self._offset = None
+
+    def _mock_chunk(self) -> bytes:
+        item = next(self._chunks, None)
+        if item is None and self._loop:
+            self._chunks = read_captures(self._paths)
+            self._offset = None
+            item = next(self._chunks, None)
+        if item is None:
+            sleep(1)  # like a silent receiver, the read times out
+            return b""
+        timestamp, chunk = item
+
+        if self._realtime:
+            # monotonic time to capture time, set on the first chunk
+            if self._offset is None:
+                self._offset = timestamp - monotonic()
+            delay = timestamp - self._offset - monotonic()
+            if delay > 0:
+                sleep(delay)
+        return chunk
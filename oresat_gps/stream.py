@@ -0,0 +1,208 @@
+"""Live streaming of fixes as server-sent events.
+
+The service publishes into a `FrameStream` as it goes and each client is sent the latest frame at
+the rate it asked for. Only the latest frame is kept, so frames published between two sends, or
+while a slow client is still being written to, are dropped instead of queued, and publishing costs
+the same however many clients are connected. Frames are encoded once, when first sent.
+
+OLAF's REST API serves one request at a time, so a client holding a stream open on it would block
+every other request. The events are served by a small server of their own, with a thread per
+client, and the REST API redirects to it.
+"""
+
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+
+class FrameStream:
+    """Broadcasts the latest frame to any number of event stream clients."""
+
+    def __init__(self, max_clients: int = 8, max_rate: float = 20, keepalive: float = 15) -> None:
+        """Create a stream.
+
+        Parameters
+        ----------
+        max_clients
+            Most clients at once, so watching the card can't starve it.
+        max_rate
+            Most frames per second to send a client, whatever it asks for.
+        keepalive
+            Seconds without a new frame before a comment is sent to keep the connection open.
+        """
+        self._max_clients = max_clients
+        self._max_rate = max_rate
+        self._keepalive = keepalive
+        self._cond = Condition()
+        self._frame: dict[str, Any] = {}
+        self._seq = 0
+        self._encoded: str | None = None
+        self._clients = 0
+        self._closed = False
+
+    @property
+    def clients(self) -> int:
+        """Number of clients connected, the service skips building frames while it's 0."""
+        return self._clients
+
+    def publish(self, changes: dict[str, Any]) -> None:
+        """Update the latest frame and wake the clients.
+
+        Parameters
+        ----------
+        changes
+            Values to set, the rest of the frame keeps the values last published.
+        """
+        with self._cond:
+            self._frame.update(changes)
+            self._seq += 1
+            self._encoded = None
+            self._cond.notify_all()
+
+    def close(self) -> None:
+        """End every client's stream, e.g. when the service stops."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def subscribe(self, rate: float) -> "Subscription | None":
+        """Connect a client.
+
+        Parameters
+        ----------
+        rate
+            Most frames per second to send, capped at max_rate.
+
+        Returns
+        -------
+        Subscription | None
+            The client's events, or None if there are already max_clients.
+        """
+        with self._cond:
+            if self._clients >= self._max_clients or self._closed:
+                return None
+            self._clients += 1
+        return Subscription(self, 1 / min(max(rate, 1e-3), self._max_rate))
+
+    def _next(self, seq: int) -> tuple[int, str] | None:
+        """Wait for a frame newer than seq, see `Subscription.__next__()`."""
+        deadline = monotonic() + self._keepalive
+        with self._cond:
+            while not self._closed and self._seq == seq:
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    return seq, ": keepalive\n\n"
+                self._cond.wait(remaining)
+            if self._closed:
+                return None
+            if self._encoded is None:
+                self._encoded = f"id: {self._seq}\ndata: {json.dumps(self._frame)}\n\n"
+            return self._seq, self._encoded
+
+    def _release(self) -> None:
+        with self._cond:
+            self._clients -= 1
+
+
+class Subscription:
+    """One client's server-sent events, an iterable for a streamed response."""
+
+    def __init__(self, stream: FrameStream, period: float) -> None:
+        self._stream = stream
+        self._period = period
+        self._seq = 0
+        self._next_at = 0.0
+        self._open = True
+
+    def __iter__(self) -> "Subscription":
+        """Return the events."""
+        return self
+
+    def __next__(self) -> str:
+        """Wait for the next event.
+
+        Returns
+        -------
+        str
+            The latest frame as an event, or a keepalive comment.
+
+        Raises
+        ------
+        StopIteration
+            The stream was closed.
+        """
+        delay = self._next_at - monotonic()
+        if delay > 0:
+            sleep(delay)
+        event = self._stream._next(self._seq) if self._open else None  # noqa: SLF001
+        if event is None:
+            self.close()
+            raise StopIteration
+        self._seq, data = event
+        self._next_at = max(self._next_at + self._period, monotonic())
+        return data
+
+    def close(self) -> None:
+        """Disconnect, called by the server when the client goes away."""
+        if self._open:
+            self._open = False
+            self._stream._release()  # noqa: SLF001
+
+
+def serve(stream: FrameStream, address: str, port: int) -> ThreadingHTTPServer:
+    """Serve a stream's events over HTTP, from a background thread.
+
+    Any path is served, with the optional query arg rate, see `FrameStream.subscribe()`.
+
+    Parameters
+    ----------
+    stream
+        The stream to serve.
+    address
+        Address to listen on.
+    port
+        Port to listen on, 0 for any free one.
+
+    Returns
+    -------
+    ThreadingHTTPServer
+        The running server, `shutdown()` it to stop.
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            query = parse_qs(urlsplit(self.path).query)
+            try:
+                rate = float(query.get("rate", ["1"])[0])
+            except ValueError:
+                self.send_error(400, "rate must be a number")
+                return
+            events = stream.subscribe(rate)
+            if events is None:
+                self.send_error(503, "too many clients")
+                return
+            try:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                # the page comes from the REST API, which is another origin
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.end_headers()
+                for event in events:
+                    self.wfile.write(event.encode())
+                    self.wfile.flush()
+            except OSError:
+                pass  # the client went away
+            finally:
+                events.close()
+
+        def log_message(self, format: str, *args: object) -> None:  # noqa: A002
+            pass  # a line per client isn't worth it
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    server.daemon_threads = True
+    Thread(target=server.serve_forever, name="skytraq-stream", daemon=True).start()
+    return server
@@ -0,0 +1,129 @@
+"""TPDO scheduling.
+
+Decides which of the GPS TPDOs go out for each fix, so the CAN bus load is set by the configured
+rates rather than by the receiver's update rate, and stops trying to send while the bus is down.
+"""
+
+from collections.abc import Callable, Hashable, Iterable
+from time import monotonic
+
+from olaf import NetworkError, logger
+
+
+class TpdoScheduler:
+    """Sends TPDOs every Nth fix or when their contents change, backing off while the bus is down.
+
+    Periodic TPDOs have a rate divisor, the number of fixes per send. A divisor of 0 follows the
+    receiver's update rate so the TPDO goes out about once a second whatever the rate is.
+    """
+
+    BACKOFF_MIN = 1.0
+    """Seconds to hold off sending after the first failed send"""
+    BACKOFF_MAX = 32.0
+    """Most seconds to hold off sending, the hold off doubles on each failure up to this"""
+
+    def __init__(self, send: Callable[[int], None], bus_up: Callable[[], bool]) -> None:
+        """Create a scheduler.
+
+        Parameters
+        ----------
+        send
+            Sends a TPDO by number, raises NetworkError on failure, e.g. `Node.send_tpdo`.
+        bus_up
+            Cheap check that the bus is up, nothing is sent while it's False.
+        """
+        self._send = send
+        self._bus_up = bus_up
+        self._divisors: dict[int, int] = {}
+        self._counts: dict[int, int] = {}
+        self._last: dict[int, Hashable] = {}
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self.fix_rate = 1
+        """Fixes per second from the receiver, the divisor used for periodic TPDOs set to 0"""
+        self.sent = 0
+        """Number of TPDOs sent"""
+        self.send_errors = 0
+        """Number of TPDO sends that failed"""
+
+    def set_divisor(self, tpdo: int, divisor: int) -> None:
+        """Send a TPDO every divisor fixes, see `on_fix()`.
+
+        Parameters
+        ----------
+        tpdo
+            TPDO number.
+        divisor
+            Fixes per send, 0 to follow the receiver's update rate.
+        """
+        if divisor < 0:
+            raise ValueError("divisor must not be negative")
+        self._divisors[tpdo] = divisor
+        self._counts[tpdo] = 0
+
+    def divisor(self, tpdo: int) -> int:
+        """Get the configured divisor of a periodic TPDO."""
+        return self._divisors[tpdo]
+
+    @property
+    def can_send(self) -> bool:
+        """bool: The bus is up and not being backed off from."""
+        if not self._bus_up():
+            return False
+        return self._backoff == 0 or monotonic() >= self._retry_at
+
+    def on_fix(self) -> None:
+        """Count a fix and send the periodic TPDOs that are due."""
+        due = []
+        for tpdo, divisor in self._divisors.items():
+            count = self._counts[tpdo] + 1
+            if count >= (divisor or self.fix_rate):
+                count = 0
+                due.append(tpdo)
+            self._counts[tpdo] = count
+        if due and self.can_send:
+            for tpdo in due:
+                if not self._try_send(tpdo):
+                    break
+
+    def send(self, tpdos: Iterable[int]) -> None:
+        """Send TPDOs straight away, outside of the fix schedule.
+
+        Parameters
+        ----------
+        tpdos
+            TPDO numbers, in the order to send them.
+        """
+        if not self.can_send:
+            return
+        for tpdo in tpdos:
+            if not self._try_send(tpdo):
+                break
+
+    def on_change(self, tpdo: int, contents: Hashable) -> None:
+        """Send a TPDO if its contents changed since it was last sent.
+
+        Parameters
+        ----------
+        tpdo
+            TPDO number.
+        contents
+            The values the TPDO maps, or anything that changes with them.
+        """
+        if self._last.get(tpdo) == contents or not self.can_send:
+            return
+        if self._try_send(tpdo):
+            self._last[tpdo] = contents
+
+    def _try_send(self, tpdo: int) -> bool:
+        try:
+            self._send(tpdo)
+        except NetworkError as e:
+            self.send_errors += 1
+            self._backoff = min(self._backoff * 2, self.BACKOFF_MAX) or self.BACKOFF_MIN
+            self._retry_at = monotonic() + self._backoff
+            logger.debug(f"TPDO {tpdo} not sent, holding off for {self._backoff} s: {e}")
+            return False
+        self._backoff = 0.0
+        self.sent += 1
+        return True
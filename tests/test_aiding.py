@@ -0,0 +1,133 @@
+"""Unit tests for the receiver aiding state."""
+
+import struct
+from datetime import datetime, timezone
+from math import cos, degrees, pi, radians, sin, sqrt
+from pathlib import Path
+
+import pytest
+
+from oresat_gps.aiding import (
+    EPHEMERIS_MAX_AGE_MS,
+    HOT_START,
+    AidingState,
+    _geodetic,
+    ephemeris_body,
+    fresh_ephemeris,
+    load_state,
+    restart_body,
+    save_state,
+)
+from oresat_gps.codec import GpsEphemeris, NavData
+from oresat_gps.gps_time import MS_PER_WEEK, LeapSeconds
+from oresat_gps.propagator import EARTH_MU, EARTH_RADIUS, EARTH_ROTATION
+from oresat_gps.skytraq import MockSkyTraq
+
+ALTITUDE = 500e3
+RADIUS = EARTH_RADIUS + ALTITUDE
+SPEED = sqrt(EARTH_MU / RADIUS)
+# over the equator and prime meridian, heading east
+FIX = NavData._make(
+    [
+        *(0xA8, 2, 8, 2400, 0, 0, 0, round(ALTITUDE * 100), 0, 0, 150, 0, 0, 0),
+        *(round(RADIUS * 100), 0, 0, 0, round((SPEED - EARTH_ROTATION * RADIUS) * 100), 0),
+    ]
+)
+FIX_MS = FIX.gps_week * MS_PER_WEEK
+EPHEMERIS = tuple(GpsEphemeris(0xB1, sv, bytes([sv]) * 87) for sv in (3, 17))
+
+RESTART = struct.Struct(">BHBBBBBhhh")
+
+
+def test_save_load(tmp_path: Path) -> None:
+    """Test the state comes back as saved and bad files are caught."""
+    path = tmp_path / "state" / "aiding"
+    assert load_state(path) is None
+    save_state(path, AidingState(FIX, EPHEMERIS, 3_600_000))
+    assert load_state(path) == AidingState(FIX, EPHEMERIS, 3_600_000)
+    assert not path.with_name("aiding.tmp").exists()
+
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="cut short"):
+        load_state(path)
+    path.write_bytes(b"not a state file")
+    with pytest.raises(ValueError, match="not an aiding state file"):
+        load_state(path)
+
+
+def test_geodetic() -> None:
+    """Test ECEF positions convert back to the latitude, longitude and altitude they came from."""
+    e2 = 6.69437999014e-3
+    for lat, lon, alt in [(45.0, -122.7, 0.0), (-82.6, 10.0, ALTITUDE), (0.0, 180.0, 1000.0)]:
+        n = EARTH_RADIUS / sqrt(1 - e2 * sin(radians(lat)) ** 2)
+        x = (n + alt) * cos(radians(lat)) * cos(radians(lon))
+        y = (n + alt) * cos(radians(lat)) * sin(radians(lon))
+        z = (n * (1 - e2) + alt) * sin(radians(lat))
+        got = _geodetic(x, y, z)
+        assert got[0] == pytest.approx(lat, abs=1e-6)
+        assert got[1] == pytest.approx(lon, abs=1e-6)
+        assert got[2] == pytest.approx(alt, abs=0.01)
+
+
+def test_restart_body() -> None:
+    """Test the restart carries the time now and the fix propagated to now."""
+    leap_seconds = LeapSeconds()
+    # a quarter of an orbit later, a circular equatorial orbit is a quarter of the way around
+    quarter_ms = round(pi * RADIUS / SPEED / 2 * 1000)
+    gps_ms = FIX_MS + quarter_ms
+    unix_ms = leap_seconds.to_unix_ms(0, gps_ms)
+    mode, year, month, day, hour, minute, second, lat, lon, alt = RESTART.unpack(
+        restart_body(FIX, unix_ms, gps_ms)
+    )
+    now = datetime.fromtimestamp(unix_ms // 1000, timezone.utc)
+    assert mode == HOT_START
+    assert (year, month, day, hour, minute, second) == (
+        now.year,
+        now.month,
+        now.day,
+        now.hour,
+        now.minute,
+        now.second,
+    )
+    assert abs(lat) <= 5
+    # the earth turns under the orbit, so the longitude falls short of 90 degrees
+    expected_lon = 90 - degrees(EARTH_ROTATION * quarter_ms / 1000)
+    assert lon / 100 == pytest.approx(expected_lon, abs=1)
+    assert alt == 18_300
+
+    # too long since the fix to propagate, its own position is used
+    day_ms = 86_400_000
+    body = restart_body(FIX._replace(latitude=451234567), unix_ms + day_ms, gps_ms + day_ms)
+    assert RESTART.unpack(body)[7:] == (4512, 0, 18_300)
+
+
+def test_fresh_ephemeris() -> None:
+    """Test the ephemeris is only uploaded while it's still good."""
+    state = AidingState(FIX, EPHEMERIS)
+    assert fresh_ephemeris(state, FIX_MS + 1000) == EPHEMERIS
+    assert fresh_ephemeris(state, FIX_MS + EPHEMERIS_MAX_AGE_MS + 1) == ()
+    assert fresh_ephemeris(state, FIX_MS - 1) == ()
+    # queried an hour before the fix
+    state = AidingState(FIX, EPHEMERIS, 3_600_000)
+    assert fresh_ephemeris(state, FIX_MS + EPHEMERIS_MAX_AGE_MS - 3_600_000) == EPHEMERIS
+    assert fresh_ephemeris(state, FIX_MS + EPHEMERIS_MAX_AGE_MS - 3_600_000 + 1) == ()
+    assert fresh_ephemeris(state, FIX_MS + 1000, 3_600_000) == ()
+    assert ephemeris_body(EPHEMERIS[0]) == b"\x00\x03" + bytes([3]) * 87
+
+
+class EphemerisSkyTraq(MockSkyTraq):
+    """Replies to the ephemeris query for every SV, with an ephemeris for some."""
+
+    def _mock_chunk(self) -> bytes:
+        have = {e.sv_id: e.subframes for e in EPHEMERIS}
+        return b"".join(
+            self.encode_binary(0xB1, struct.pack(">H87s", sv, have.get(sv, bytes(87))))
+            for sv in range(1, self.GPS_SVS + 1)
+        )
+
+
+def test_query_ephemeris() -> None:
+    """Test the ephemeris query collects the SVs that have one."""
+    gps = EphemerisSkyTraq()
+    gps.connect()
+    assert sorted(gps.query_ephemeris()) == sorted(EPHEMERIS)
@@ -0,0 +1,91 @@
+"""Tests for the fix archive."""
+
+from pathlib import Path
+
+import pytest
+
+from oresat_gps.archive import BLOCK_HEADER, INDEX_SUFFIX, MAGIC, FixArchiveReader, FixArchiveWriter
+from oresat_gps.gps_time import MS_PER_WEEK
+from oresat_gps.simulator import SimulatedSkyTraq
+from oresat_gps.skytraq import MockSkyTraq
+
+FIXES = [SimulatedSkyTraq(1).nav_data(i) for i in range(250)]
+START_MS = 2400 * MS_PER_WEEK
+
+
+def write(path: Path, fixes: list, block_size: int = 60) -> None:
+    """Write fixes to an archive."""
+    writer = FixArchiveWriter(path, block_size)
+    for nav_data in fixes:
+        writer.append(nav_data)
+    writer.close()
+
+
+def test_round_trip(tmp_path: Path) -> None:
+    """Test fixes read back the same, take much less space than raw and can be read by range."""
+    path = tmp_path / "fixes.arc"
+    write(path, FIXES)
+    reader = FixArchiveReader(path)
+    assert len(reader) == 5
+    assert list(reader) == FIXES
+    raw_size = len(FIXES) * (len(MockSkyTraq.MOCK_DATA) - 7)
+    assert path.stat().st_size < raw_size / 2
+
+    assert list(reader.read(START_MS + 100_000, START_MS + 130_000)) == FIXES[100:130]
+    assert list(reader.read(START_MS + 240_000)) == FIXES[240:]
+    assert list(reader.read(end_ms=START_MS)) == []
+
+
+def test_recovery(tmp_path: Path) -> None:
+    """Test a lost index is rebuilt and a block cut short is dropped before appending."""
+    path = tmp_path / "fixes.arc"
+    write(path, FIXES[:100], block_size=30)
+    Path(str(path) + INDEX_SUFFIX).unlink()
+    with path.open("ab") as f:
+        f.write(BLOCK_HEADER.pack(START_MS + 100_000, START_MS + 129_000, 30, 500) + bytes(20))
+
+    assert list(FixArchiveReader(path)) == FIXES[:100]
+    write(path, FIXES[100:], block_size=30)
+    reader = FixArchiveReader(path)
+    assert list(reader) == FIXES
+    assert list(reader.read(START_MS + 95_000, START_MS + 97_000)) == FIXES[95:97]
+
+
+def test_time_goes_back(tmp_path: Path) -> None:
+    """Test a time range is still read in full after the receiver's time went back."""
+    path = tmp_path / "fixes.arc"
+    # reset 30 s back in the middle of a block, then again to before the first fix
+    fixes = FIXES[:45] + FIXES[15:100] + FIXES[:20]
+    write(path, fixes, block_size=30)
+    reader = FixArchiveReader(path)
+    assert list(reader) == fixes
+    assert list(reader.read(START_MS + 20_000, START_MS + 40_000)) == FIXES[20:40] + FIXES[20:40]
+    assert list(reader.read(START_MS + 10_000, START_MS + 16_000)) == (
+        FIXES[10:16] + FIXES[15:16] + FIXES[10:16]
+    )
+
+
+def test_stale_index(tmp_path: Path) -> None:
+    """Test an index pointing past the archive is rebuilt rather than trusted."""
+    path = tmp_path / "fixes.arc"
+    write(path, FIXES, block_size=30)
+    index = Path(str(path) + INDEX_SUFFIX).read_bytes()
+    write(path.with_name("other.arc"), FIXES[:50], block_size=30)
+    path.write_bytes(path.with_name("other.arc").read_bytes())
+    Path(str(path) + INDEX_SUFFIX).write_bytes(index)
+
+    reader = FixArchiveReader(path)
+    assert len(reader) == 2
+    assert list(reader) == FIXES[:50]
+    assert list(reader.read(START_MS + 40_000)) == FIXES[40:50]
+
+
+@pytest.mark.parametrize("data", [b"not an archive, leave me be", MAGIC[:-1] + b"\x01" + bytes(40)])
+def test_not_an_archive(tmp_path: Path, data: bytes) -> None:
+    """Test a writer won't append to a file that isn't an archive of this format, or touch it."""
+    path = tmp_path / "fixes.arc"
+    path.write_bytes(data)
+    with pytest.raises(ValueError, match="not a fix archive"):
+        FixArchiveWriter(path)
+    assert path.read_bytes() == data
+    assert not Path(str(path) + INDEX_SUFFIX).exists()
@@ -0,0 +1,40 @@
+"""Tests for the asyncio SkyTraq driver."""
+
+import asyncio
+import os
+from pathlib import Path
+
+from oresat_gps.async_skytraq import AsyncSkyTraq
+from oresat_gps.codec import Nack, NavData
+from oresat_gps.skytraq import MockSkyTraq, SkyTraq
+
+
+async def fake_receiver(fd: int) -> None:
+    """ACK the binary mode command, then NACK the next command with nav data in between."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, os.read, fd, 64)
+    os.write(fd, b"$GPGGA,garbage\r\n" + SkyTraq.encode_binary(0x83, b"\x09"))
+    await loop.run_in_executor(None, os.read, fd, 64)
+    os.write(fd, MockSkyTraq.MOCK_DATA + SkyTraq.encode_binary(0x84, b"\x0e"))
+
+
+def test_send_command_and_read() -> None:
+    """Test command replies are routed to the command while other messages are passed on."""
+    controller, peripheral = os.openpty()
+
+    async def run() -> None:
+        gps = AsyncSkyTraq(Path(os.ttyname(peripheral)))
+        receiver = asyncio.create_task(fake_receiver(controller))
+        await gps.connect()
+        assert await gps.send_command(0x0E, b"\x01\x00") == Nack(0x84, 0x0E)
+        assert isinstance(await gps.read(), NavData)
+        await receiver
+        gps.disconnect()
+        assert [msg async for msg in gps] == []
+        assert not gps.is_connected
+
+    try:
+        asyncio.run(asyncio.wait_for(run(), 5))
+    finally:
+        os.close(controller)
+        os.close(peripheral)
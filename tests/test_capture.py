@@ -0,0 +1,73 @@
+"""Tests for the capture recorder and replay."""
+
+from pathlib import Path
+from time import monotonic
+
+from oresat_gps.capture import CHUNK_HEADER, MAGIC, CaptureRecorder, capture_files, read_captures
+from oresat_gps.codec import Ack, NavData
+from oresat_gps.skytraq import MockSkyTraq, ReplaySkyTraq
+
+
+def test_rotation(tmp_path: Path) -> None:
+    """Test chunks are rotated into new files and the oldest files are deleted."""
+    chunk = MockSkyTraq.MOCK_DATA
+    per_file = 2
+    recorder = CaptureRecorder(
+        tmp_path,
+        max_file_size=len(MAGIC) + per_file * (CHUNK_HEADER.size + len(chunk)),
+        max_files=2,
+    )
+    for i in range(5):
+        recorder.write(chunk, timestamp=1000.0 + i)
+    recorder.close()
+
+    files = capture_files(tmp_path)
+    assert len(files) == 2
+    assert files[-1] == recorder.path
+    assert [t for t, _ in read_captures(files)] == [1002.0, 1003.0, 1004.0]
+    assert all(c == chunk for _, c in read_captures(files))
+
+
+def test_partial_chunk(tmp_path: Path) -> None:
+    """Test a chunk cut short by a power loss is ignored."""
+    recorder = CaptureRecorder(tmp_path)
+    recorder.write(b"abc", timestamp=1.0)
+    recorder.write(b"defgh", timestamp=2.0)
+    recorder.close()
+    assert recorder.path is not None
+    recorder.path.write_bytes(recorder.path.read_bytes()[:-1])
+    assert list(read_captures([recorder.path])) == [(1.0, b"abc")]
+
+
+def test_replay(tmp_path: Path) -> None:
+    """Test a recorded stream replays as fast as possible and at the original timing."""
+    mock = MockSkyTraq()
+    mock.recorder = CaptureRecorder(tmp_path)
+    mock._mock_chunk = lambda: MockSkyTraq.MOCK_DATA  # type: ignore[method-assign]  # noqa: SLF001
+    mock.connect()
+    for _ in range(4):
+        assert isinstance(mock.read(), NavData)
+    mock.disconnect()
+
+    chunks = list(read_captures(capture_files(tmp_path)))
+    assert len(chunks) == 4
+    # respace the capture 50 ms apart for the timed replay
+    recorder = CaptureRecorder(tmp_path / "timed")
+    for i, (_, chunk) in enumerate(chunks):
+        recorder.write(chunk, timestamp=i * 0.05)
+    recorder.close()
+
+    fast = ReplaySkyTraq(tmp_path, realtime=False)
+    fast.connect()
+    assert fast.command(0x09, b"\x02\x00") == Ack(0x83, 0x09)
+    start = monotonic()
+    for _ in range(4):
+        assert isinstance(fast.read(), NavData)
+    assert monotonic() - start < 0.05
+
+    timed = ReplaySkyTraq(tmp_path / "timed", loop=True)
+    timed.connect()
+    start = monotonic()
+    for _ in range(6):
+        assert isinstance(timed.read(), NavData)
+    assert monotonic() - start >= 0.15 - 0.01
@@ -0,0 +1,42 @@
+"""Unit tests for the system clock discipline."""
+
+import pytest
+
+from oresat_gps.clock import MAX_SLEW, ClockDiscipline
+
+
+def test_discipline() -> None:
+    """Test the clock is stepped to the first fix, then slewed by the least delayed offsets."""
+    steps: list[float] = []
+    slews: list[tuple[float, float]] = []
+    clock = ClockDiscipline(steps.append, lambda offset, jitter: slews.append((offset, jitter)), 4)
+
+    clock.add(12.5)
+    assert steps == [12.5]
+    assert clock.synced
+
+    for offset in (0.004, 0.001, 0.003):
+        clock.add(offset)
+    assert not slews
+    clock.add(0.002)
+    assert slews == [(0.001, pytest.approx(((9 + 0 + 4 + 1) / 4) ** 0.5 / 1000))]
+    assert clock.offset == 0.001
+
+    # too far off to slew
+    for _ in range(4):
+        clock.add(MAX_SLEW * 2)
+    assert steps == [12.5, MAX_SLEW * 2]
+    assert clock.steps == 2
+    assert len(slews) == 1
+
+
+def test_measure_only() -> None:
+    """Test without a way to set the clock the offset is still measured."""
+    clock = ClockDiscipline(window=2)
+    clock.add(1.0)
+    assert clock.offset is None
+    clock.add(1.5)
+    assert clock.offset == 1.0
+    assert clock.jitter == pytest.approx(0.5 / 2**0.5)
+    assert not clock.synced
+    assert clock.steps == 0
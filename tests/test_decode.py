@@ -0,0 +1,94 @@
+"""Tests for the offline capture decoder."""
+
+import csv
+import struct
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from oresat_gps.capture import CaptureRecorder
+from oresat_gps.codec import encode_binary
+from oresat_gps.decode import decode_file, main
+from oresat_gps.simulator import SimulatedSkyTraq
+
+RAW_MEAS = encode_binary(
+    0xDD,
+    bytes([1, 2]) + b"".join(struct.pack(">BBddfB", sv, 40, 2e7, 1.5, -3.0, 7) for sv in (5, 8)),
+)
+
+
+def record(directory: Path, fixes: int) -> Path:
+    """Record a capture of simulated fixes with raw measurements and a corrupt frame mixed in."""
+    sim = SimulatedSkyTraq(1)
+    recorder = CaptureRecorder(directory)
+    for i in range(fixes):
+        recorder.write(sim._mock_chunk() + RAW_MEAS, timestamp=1000.0 + i)  # noqa: SLF001
+    recorder.write(RAW_MEAS[:-4] + b"\x00" + RAW_MEAS[-3:], timestamp=2000.0)
+    recorder.close()
+    assert recorder.path is not None
+    return recorder.path
+
+
+def test_decode_csv(tmp_path: Path) -> None:
+    """Test every message type gets a CSV, with a row per channel for raw measurements."""
+    capture = record(tmp_path, 3)
+    result = decode_file(capture, tmp_path)
+    assert result.messages == {"nav_data": 3, "raw_meas": 3}
+    assert result.checksum_failures == 1
+    assert sorted(p.name for p in result.outputs) == [
+        f"{capture.stem}.nav_data.csv",
+        f"{capture.stem}.raw_meas.csv",
+    ]
+
+    with (tmp_path / f"{capture.stem}.raw_meas.csv").open() as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 6
+    assert [r["sv_id"] for r in rows[:2]] == ["5", "8"]
+    assert rows[2]["timestamp"] == "1001.0"
+    assert rows[2]["iod"] == "1"
+    assert float(rows[0]["pseudorange"]) == 2e7
+
+
+def test_decode_npz(tmp_path: Path) -> None:
+    """Test the .npz columns load in NumPy with the message's types."""
+    np = pytest.importorskip("numpy")
+    capture = record(tmp_path, 4)
+    decode_file(capture, tmp_path, "npz")
+    with np.load(tmp_path / f"{capture.stem}.nav_data.npz") as nav:
+        assert nav["timestamp"].tolist() == [1000.0, 1001.0, 1002.0, 1003.0]
+        assert nav["gps_week"].dtype == np.uint16
+        assert nav["latitude"].dtype == np.int32
+        assert nav["tow"].tolist() == [0, 100, 200, 300]
+    with np.load(tmp_path / f"{capture.stem}.raw_meas.npz") as raw:
+        assert raw["sv_id"].tolist() == [5, 8] * 4
+        assert raw["doppler"].dtype == np.float32
+
+
+def test_main(tmp_path: Path, capsys: pytest.CaptureFixture[str]) -> None:
+    """Test decoding a directory of captures in parallel, a bad file doesn't stop the rest."""
+    captures = tmp_path / "captures"
+    first = record(captures, 2)
+    second = first.with_name(first.stem + "-b.cap")
+    first.rename(second)
+    record(captures, 1)
+    (captures / "zz.cap").write_bytes(b"not a capture")
+    out = tmp_path / "out"
+    with pytest.raises(SystemExit):
+        main([str(captures), "-o", str(out), "-j", "2"])
+    assert len(list(out.glob("*.csv"))) == 4
+    stdout, stderr = capsys.readouterr()
+    assert "2 nav_data" in stdout
+    assert "1 nav_data" in stdout
+    assert "not a capture file" in stderr
+
+
+def test_import_without_olaf() -> None:
+    """Test the decoder doesn't need OLAF or the card's hardware libraries."""
+    blocked = (
+        "import sys; sys.modules.update(dict.fromkeys(['olaf', 'gpiod', 'serial', 'canopen']))"
+    )
+    subprocess.run(  # noqa: S603
+        [sys.executable, "-c", f"{blocked}; import oresat_gps.decode"], check=True
+    )
@@ -0,0 +1,86 @@
+"""Unit tests for the duty-cycled fix on demand."""
+
+from oresat_gps.codec import FixMode, NavData
+from oresat_gps.duty_cycle import DutyCycle
+
+FIX = NavData._make([0xA8, FixMode.FIX_3D.value, 8, 2400, 0, *[0] * 5, 150, *[0] * 9])
+
+
+class FakeReceiver:
+    """Records the power ups and downs."""
+
+    def __init__(self) -> None:
+        self.on = False
+        self.power_ups = 0
+
+    def power_on(self) -> None:
+        """Power up."""
+        self.on = True
+        self.power_ups += 1
+
+    def power_off(self) -> None:
+        """Power down."""
+        self.on = False
+
+
+def test_cycle() -> None:
+    """Test the receiver is up from each interval until a fix good enough, then down."""
+    receiver = FakeReceiver()
+    duty = DutyCycle(receiver.power_on, receiver.power_off)
+    assert duty.on_fix(FIX, 0.0)  # streaming while not duty cycling
+
+    duty.set_interval(60, 100.0)
+    duty.poll(100.0)
+    assert receiver.on
+    assert duty.acquiring
+    assert not duty.on_fix(FIX._replace(number_of_sv=3), 105.0)
+    assert not duty.on_fix(FIX._replace(pdop=501), 106.0)
+    assert not duty.on_fix(FIX._replace(fix_mode=FixMode.FIX_2D.value), 107.0)
+    assert duty.on_fix(FIX, 112.5)
+    assert not duty.on_fix(FIX, 113.0)  # only one fix a cycle
+    duty.poll(113.0)
+    assert not receiver.on
+
+    duty.poll(159.0)
+    assert not receiver.on
+    duty.poll(160.0)
+    assert receiver.on
+    assert duty.on_fix(FIX, 167.5)
+    duty.poll(168.0)
+
+    stats = duty.stats()
+    assert (stats.cycles, stats.fixes, stats.timeouts) == (2, 2, 0)
+    assert (stats.ttff_last, stats.ttff_min, stats.ttff_max, stats.ttff_mean) == (
+        7500,
+        7500,
+        12500,
+        10000,
+    )
+
+
+def test_timeout() -> None:
+    """Test a cycle without a fix gives up at the timeout and the next starts on schedule."""
+    receiver = FakeReceiver()
+    duty = DutyCycle(receiver.power_on, receiver.power_off)
+    duty.timeout = 90
+    duty.set_interval(60, 0.0)
+    duty.poll(0.0)
+    duty.poll(89.0)
+    assert receiver.on
+    duty.poll(90.0)
+    assert not receiver.on
+    assert duty.stats().timeouts == 1
+
+    # the cycle due at 60 was missed to the timeout, the next one starts straight away
+    duty.poll(90.5)
+    assert receiver.on
+    assert receiver.power_ups == 2
+
+    duty.set_interval(0, 91.0)
+    assert not duty.on_fix(FIX._replace(number_of_sv=0), 92.0)
+    assert duty.on_fix(FIX, 93.0)
+    duty.poll(93.0)
+    duty.poll(200.0)
+    assert not receiver.on
+    assert receiver.power_ups == 2
+    assert duty.on_fix(FIX, 201.0)
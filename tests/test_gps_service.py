@@ -0,0 +1,532 @@
+"""Unit tests for the GPS service, run on a fake node rather than a CAN bus.
+
+The service's thread is never started, each test calls `on_start()` and `on_loop()` itself.
+"""
+
+import json
+import struct
+from collections.abc import Callable
+from copy import deepcopy
+from functools import cache
+from itertools import pairwise
+from pathlib import Path
+from time import monotonic, sleep, time
+from typing import Any
+
+import pytest
+from canopen import ObjectDictionary
+from canopen.objectdictionary import ODVariable
+from olaf import NetworkError
+from oresat_configs import Mission, OreSatConfig
+
+from oresat_gps.aiding import AidingState, load_state
+from oresat_gps.clock import ClockDiscipline
+from oresat_gps.codec import MESSAGE_TYPES, FixMode, GpsEphemeris, NavData
+from oresat_gps.duty_cycle import DutyCycleStats
+from oresat_gps.gps_service import PROPAGATED_READ_FIELDS, PROPAGATED_TPDOS, GpsService, GpsState
+from oresat_gps.gps_time import MS_PER_WEEK, LeapSeconds, ms_since_midnight
+from oresat_gps.propagator import Propagator
+from oresat_gps.reader import SkyTraqReader
+from oresat_gps.simulator import Orbit, SimulatedSkyTraq
+from oresat_gps.stream import FrameStream, Subscription
+
+Value = int | float | str | bytes | bool
+"""Value of an OD variable"""
+
+
+@cache
+def _gps_od() -> ObjectDictionary:
+    return OreSatConfig(Mission.ORESAT0_5).od_db["gps"]
+
+
+class FakeNode:
+    """Just enough of an OLAF node to run the service on, recording the TPDOs it sends."""
+
+    def __init__(self, work_base_dir: Path) -> None:
+        self.od = deepcopy(_gps_od())
+        self.work_base_dir = str(work_base_dir)
+        self.bus_state = "NETWORK_UP"
+        self.sent: list[tuple[int, list[Value]]] = []
+        """Number and mapped values of each TPDO sent"""
+        self._read_cbs: dict[tuple[str, str | None], Callable[[], Any]] = {}
+        self._write_cbs: dict[tuple[str, str | None], Callable[[Any], None]] = {}
+
+    def add_sdo_callbacks(
+        self,
+        index: str,
+        subindex: str | None,
+        read_cb: Callable[[], Any] | None,
+        write_cb: Callable[[Any], None] | None,
+    ) -> None:
+        """Add the SDO callbacks of a variable."""
+        if read_cb is not None:
+            self._read_cbs[index, subindex] = read_cb
+        if write_cb is not None:
+            self._write_cbs[index, subindex] = write_cb
+
+    def _var(self, index: str, subindex: str | None) -> ODVariable:
+        return self.od[index] if subindex is None else self.od[index][subindex]
+
+    def sdo_read(self, index: str, subindex: str | None = None) -> Value:
+        """Read a variable like an SDO upload does, through its read callback."""
+        read_cb = self._read_cbs.get((index, subindex))
+        value = None if read_cb is None else read_cb()
+        return self._var(index, subindex).value if value is None else value
+
+    def sdo_write(self, index: str, subindex: str | None, value: Value) -> None:
+        """Write a variable like an SDO download does, the OD first and then its callback."""
+        var = self._var(index, subindex)
+        var.value = value
+        write_cb = self._write_cbs.get((index, subindex))
+        if write_cb is not None:
+            write_cb(var.value)
+
+    def send_tpdo(self, tpdo: int) -> None:
+        """Send a TPDO, reading each variable it maps through the SDO callbacks."""
+        if self.bus_state != "NETWORK_UP":
+            raise NetworkError("can network is down")
+        mapping = self.od[0x1A00 + tpdo - 1]
+        values = []
+        for i in range(mapping[0].value):
+            index, subindex, _ = struct.unpack(">HBB", mapping[i + 1].value.to_bytes(4, "big"))
+            obj = self.od[index]
+            if isinstance(obj, ODVariable):
+                values.append(self.sdo_read(obj.name))
+            else:
+                values.append(self.sdo_read(obj.name, obj[subindex].name))
+        self.sent.append((tpdo, values))
+
+    def tpdos(self, tpdo: int) -> list[list[Value]]:
+        """Get the values of each send of a TPDO."""
+        return [values for n, values in self.sent if n == tpdo]
+
+
+class FlakySkyTraq(SimulatedSkyTraq):
+    """Simulated receiver that times out every other read."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.reads = 0
+
+    def _mock_chunk(self) -> bytes:
+        self.reads += 1
+        return super()._mock_chunk() if self.reads % 2 else b""
+
+
+class StillSkyTraq(SimulatedSkyTraq):
+    """Simulated receiver that reports the same fix until it's changed."""
+
+    def __init__(self, orbit: Orbit | None = None) -> None:
+        super().__init__(1, orbit=orbit or Orbit())
+        self.fix = super().nav_data(0)
+
+    def nav_data(self, t: float) -> NavData:  # noqa: ARG002
+        """Get the fix to report."""
+        return self.fix
+
+
+def orbit_now() -> Orbit:
+    """Get an orbit starting at the time now, e.g. for fixes the service aids the receiver with."""
+    week, tow_ms = divmod(LeapSeconds().to_gps_ms(round(time() * 1000)), MS_PER_WEEK)
+    # whole seconds, so the fixes' times in centiseconds are exact
+    return Orbit(gps_week=week, tow=tow_ms // 1000)
+
+
+class AidingSkyTraq(StillSkyTraq):
+    """Still receiver that keeps the ids of the commands sent to it and has an ephemeris."""
+
+    def __init__(self, orbit: Orbit) -> None:
+        super().__init__(orbit)
+        self.commands: list[int] = []
+
+    def _write(self, data: bytes) -> None:
+        super()._write(data)
+        self.commands.append(data[4])
+        if data[4] == 0x30:  # ephemeris query, replied to for every SV
+            have = {e.sv_id: e.subframes for e in EPHEMERIS}
+            for sv in range(1, self.GPS_SVS + 1):
+                body = struct.pack(">H87s", sv, have.get(sv, bytes(87)))
+                self._replies += self.encode_binary(0xB1, body)
+
+    def aiding(self) -> list[int]:
+        """Get the aiding commands sent, ephemeris uploads and restarts."""
+        return [msg_id for msg_id in self.commands if msg_id in (0x01, 0x41)]
+
+
+def unix_ms(nav_data: NavData) -> int:
+    """Get the Unix time of a fix in milliseconds."""
+    # the skytraq tow field is centiseconds
+    return LeapSeconds().to_unix_ms(nav_data.gps_week, nav_data.tow * 10)
+
+
+def propagated(node: FakeNode) -> list[Value]:
+    """Read the skytraq_propagated fields, in the order of `PROPAGATED_READ_FIELDS`."""
+    return [node.sdo_read("skytraq_propagated", name) for name in PROPAGATED_READ_FIELDS]
+
+
+def expected_propagated(propagator: Propagator, time_ms: int) -> list[int]:
+    """Get what the skytraq_propagated fields should read for a propagator at a Unix time."""
+    state = propagator.state(LeapSeconds().to_gps_ms(time_ms))
+    assert state is not None
+    values = (*state.position, *state.velocity)
+    return [*(round(v * 100) for v in values), state.age_ms, ms_since_midnight(time_ms)]
+
+
+def streamed_status(events: Subscription) -> int | None:
+    """Get the status of the latest frame streamed, None if nothing was published since."""
+    event = next(events)
+    return None if event.startswith(":") else json.loads(event.split("data: ")[1])["status"]
+
+
+def start_service(
+    tmp_path: Path,
+    gps: SimulatedSkyTraq | None = None,
+    reader: SkyTraqReader | None = None,
+    clock: ClockDiscipline | None = None,
+) -> tuple[GpsService, FakeNode]:
+    """Start a service on a fake node, without its thread."""
+    service = GpsService(gps or SimulatedSkyTraq(), reader, clock=clock)
+    node = FakeNode(tmp_path)
+    service.node = node
+    service.on_start()
+    return service, node
+
+
+EPHEMERIS = tuple(GpsEphemeris(0xB1, sv, bytes([sv]) * 87) for sv in (3, 17))
+
+
+def test_clock_measured_only(tmp_path: Path) -> None:
+    """Test by default the service only measures the clock's offset, it never sets the clock."""
+    service, node = start_service(tmp_path)
+    for _ in range(8):
+        service.on_loop()
+
+    # the simulated fixes are from GPS week 2400, not now, setting the clock to them would show
+    gps_ms = Orbit().gps_week * MS_PER_WEEK
+    offset = time() - LeapSeconds().to_unix_ms(0, gps_ms) / 1000
+    assert service.clock.offset == pytest.approx(offset, abs=60)
+    assert service.clock.steps == 0
+    assert node.sdo_read("skytraq_clock", "steps") == 0
+    assert not node.sdo_read("time_syncd")
+    service.on_stop()
+
+
+def test_clock_stepped(tmp_path: Path) -> None:
+    """Test the service steps the clock to the first fix through the discipline it's given."""
+    steps: list[float] = []
+    slews: list[tuple[float, float]] = []
+    clock = ClockDiscipline(steps.append, lambda offset, jitter: slews.append((offset, jitter)))
+    service, node = start_service(tmp_path, clock=clock)
+    service.on_loop()
+
+    gps_ms = Orbit().gps_week * MS_PER_WEEK
+    assert steps == [pytest.approx(time() - LeapSeconds().to_unix_ms(0, gps_ms) / 1000, abs=60)]
+    assert node.sdo_read("time_syncd")
+    assert node.sdo_read("skytraq_clock", "steps") == 1
+    service.on_stop()
+
+
+def test_reader_counters(tmp_path: Path) -> None:
+    """Test the messages the reader dropped and its failed reads are in the stats and metrics."""
+    gps = FlakySkyTraq()
+    reader = SkyTraqReader(gps, capacity=2)
+    service, node = start_service(tmp_path, gps, reader)
+    deadline = monotonic() + 5
+    while not (reader.ring.dropped and reader.read_errors) and monotonic() < deadline:
+        sleep(0.01)
+    service.on_loop()
+    service.on_stop()
+
+    counters = service.metrics()["counters"]
+    assert counters["messages_dropped"] == reader.ring.dropped > 0
+    assert counters["read_errors"] == reader.read_errors > 0
+    service._update_stats_rec()  # noqa: SLF001
+    assert node.sdo_read("skytraq_stats", "messages_dropped") == reader.ring.dropped
+    assert node.sdo_read("skytraq_stats", "read_errors") == reader.read_errors
+
+
+def test_direct_read_errors(tmp_path: Path) -> None:
+    """Test failed reads are counted when the service reads the receiver itself."""
+    service, _ = start_service(tmp_path, FlakySkyTraq())
+    for _ in range(4):
+        service.on_loop()
+    assert service.metrics()["counters"]["read_errors"] == 2
+    assert service.metrics()["counters"]["messages_dropped"] == 0
+    service.on_stop()
+
+
+def test_tpdos(tmp_path: Path) -> None:
+    """Test the fix TPDOs follow their divisors and the receiver's rate, and the status changes."""
+    # no rate set, the service asks the receiver for the rate it runs at
+    service, node = start_service(tmp_path, SimulatedSkyTraq(4))
+    node.sdo_write("skytraq_tpdo", "tpdo_3_divisor", 1)
+    node.sdo_write("skytraq_tpdo", "tpdo_4_divisor", 2)
+    for _ in range(8):
+        service.on_loop()
+
+    assert [len(node.tpdos(tpdo)) for tpdo in (3, 4, 5, 6)] == [8, 4, 2, 2]
+    assert node.tpdos(5)[-1] == [
+        node.sdo_read("skytraq", "ecef_z"),
+        node.sdo_read("skytraq", "ecef_vx"),
+    ]
+    status = node.tpdos(7)
+    assert status
+    assert all(a != b for a, b in pairwise(status))
+    assert status[-1] == [
+        GpsState.LOCKED.value,
+        node.sdo_read("skytraq", "number_of_sv"),
+        FixMode.FIX_3D.value,
+        False,
+    ]
+
+    # nothing is sent while the bus is down, and sending picks up again once it's back
+    node.bus_state = "NETWORK_DOWN"
+    sent = len(node.sent)
+    for _ in range(4):
+        service.on_loop()
+    assert len(node.sent) == sent
+    assert service.metrics()["counters"]["tpdo_send_errors"] == 0
+    node.bus_state = "NETWORK_UP"
+    for _ in range(4):
+        service.on_loop()
+    assert [len(node.tpdos(tpdo)) for tpdo in (3, 4, 5, 6)] == [12, 6, 3, 3]
+    service.on_stop()
+
+
+def test_od_writes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test only the fields that changed are written to the OD, and the rate of writes."""
+    now = [1000.0]
+    monkeypatch.setattr("oresat_gps.gps_service.monotonic", lambda: now[0])
+    gps = StillSkyTraq()
+    service, node = start_service(tmp_path, gps)
+    for _ in range(5):
+        service.on_loop()
+    now[0] += 2
+    service.on_loop()
+    # every field of the first fix but the message id, and the time since midnight, then nothing
+    assert node.sdo_read("skytraq_stats", "od_writes_per_sec") == len(NavData._fields) / 2
+
+    gps.fix = gps.fix._replace(number_of_sv=gps.fix.number_of_sv + 1)
+    service.on_loop()
+    now[0] += 1
+    service.on_loop()
+    assert node.sdo_read("skytraq_stats", "od_writes_per_sec") == 1
+    assert node.sdo_read("skytraq", "number_of_sv") == gps.fix.number_of_sv
+    assert node.sdo_read("skytraq", "ecef_x") == gps.fix.ecef_x
+    service.on_stop()
+
+
+def test_packets(tmp_path: Path) -> None:
+    """Test the packet count and the last packet are served on SDO reads."""
+    gps = StillSkyTraq()
+    service, node = start_service(tmp_path, gps)
+    assert node.sdo_read("skytraq", "packet_count") == 0
+    for _ in range(3):
+        service.on_loop()
+    assert node.sdo_read("skytraq", "packet_count") == 3
+    assert node.sdo_read("skytraq", "last_packet") == MESSAGE_TYPES[0xA8].fmt.pack(*gps.fix)
+    service.on_stop()
+
+
+def test_propagated_reads(tmp_path: Path) -> None:
+    """Test the propagated state read over SDO seeds from the first fix and blends into the next.
+
+    After a gap past the propagator's max age, a fix seeds it afresh rather than blending.
+    """
+    orbit = SimulatedSkyTraq(1)
+    gps = StillSkyTraq()
+    service, node = start_service(tmp_path, gps)
+    assert propagated(node) == [0] * len(PROPAGATED_READ_FIELDS)
+
+    seeded = Propagator()
+    gps.fix = orbit.nav_data(0)
+    service.on_loop()
+    seeded.seed(gps.fix)
+    time_ms = unix_ms(gps.fix) + 500
+    node.sdo_write("skytraq_propagated", "time", time_ms)
+    assert propagated(node) == pytest.approx(expected_propagated(seeded, time_ms), abs=1)
+
+    # a fix 10 m off the prediction is blended into rather than jumped to
+    blended = Propagator()
+    blended.seed(gps.fix)
+    blended.state(LeapSeconds().to_gps_ms(time_ms))
+    fix = orbit.nav_data(1)
+    gps.fix = fix._replace(ecef_x=fix.ecef_x + 1000)
+    service.on_loop()
+    blended.seed(gps.fix)
+    unblended = Propagator(blend=0)
+    unblended.seed(gps.fix)
+    time_ms = unix_ms(gps.fix) + 250
+    node.sdo_write("skytraq_propagated", "time", time_ms)
+    values = propagated(node)
+    assert values == pytest.approx(expected_propagated(blended, time_ms), abs=1)
+    assert abs(values[0] - expected_propagated(unblended, time_ms)[0]) > 500
+
+    # nothing to propagate that far from the last fix, then the next fix is a fresh start
+    gps.fix = orbit.nav_data(1000)
+    time_ms = unix_ms(gps.fix) + 250
+    node.sdo_write("skytraq_propagated", "time", time_ms)
+    assert propagated(node) == [0] * len(PROPAGATED_READ_FIELDS)
+    service.on_loop()
+    seeded = Propagator()
+    seeded.seed(gps.fix)
+    assert propagated(node) == pytest.approx(expected_propagated(seeded, time_ms), abs=1)
+    service.on_stop()
+
+
+def test_propagated_tpdos(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test TPDOs 8 to 11 carry one propagated state at their rate, and only when there is one."""
+    now = [1000.0]
+    monkeypatch.setattr("oresat_gps.gps_service.monotonic", lambda: now[0])
+    gps = StillSkyTraq()
+    service, node = start_service(tmp_path, gps)
+    node.sdo_write("skytraq_propagated", "tpdo_rate", 2)
+
+    # time 0 is now, far too long after the simulated fix to propagate to
+    service.on_loop()
+    assert not [tpdo for tpdo, _ in node.sent if tpdo in PROPAGATED_TPDOS]
+
+    node.sdo_write("skytraq_propagated", "time", unix_ms(gps.fix) + 500)
+    now[0] += 0.5
+    service.on_loop()
+    assert [tpdo for tpdo, _ in node.sent if tpdo in PROPAGATED_TPDOS] == [8, 9, 10, 11]
+    sent = [value for tpdo in PROPAGATED_TPDOS for value in node.tpdos(tpdo)[0]]
+    read = dict(zip(PROPAGATED_READ_FIELDS, propagated(node), strict=True))
+    assert sent == [read[name] for names in PROPAGATED_TPDOS.values() for name in names]
+    assert read["age"] == 500
+
+    service.on_loop()
+    assert len(node.tpdos(8)) == 1
+    now[0] += 0.5
+    service.on_loop()
+    assert len(node.tpdos(8)) == 2
+    service.on_stop()
+
+
+def test_duty_cycle(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a duty cycle powers the receiver up for a fix and only publishes that one.
+
+    Nothing is published while the receiver is off, and the TTFF of each cycle is in the OD.
+    """
+    now = [1000.0]
+    monkeypatch.setattr("oresat_gps.gps_service.monotonic", lambda: now[0])
+    orbit = SimulatedSkyTraq(1)
+    gps = StillSkyTraq()
+    service, node = start_service(tmp_path, gps)
+    service.stream = FrameStream(keepalive=0.05)
+    events = service.stream.subscribe(1000)
+    assert events is not None
+    service.on_loop()
+    streamed = node.sdo_read("skytraq", "ecef_x")
+
+    # streaming until now, the receiver is powered off to start the first cycle from off
+    node.sdo_write("skytraq_duty_cycle", "timeout", 10)
+    node.sdo_write("skytraq_duty_cycle", "interval", 60)
+    assert not gps.is_connected
+    assert node.sdo_read("status") == GpsState.OFF.value
+    assert streamed_status(events) == GpsState.OFF.value
+
+    for ttff in (3.5, 1.0):
+        start = now[0]
+        fix_tpdos = len(node.tpdos(3))
+        gps.fix = orbit.nav_data(start - 1000)._replace(number_of_sv=2)
+        service.on_loop()
+        assert gps.is_connected
+        assert node.sdo_read("skytraq", "ecef_x") == streamed
+        assert len(node.tpdos(3)) == fix_tpdos
+
+        now[0] += ttff
+        gps.fix = orbit.nav_data(now[0] - 1000)
+        service.on_loop()
+        assert node.sdo_read("skytraq", "ecef_x") == gps.fix.ecef_x
+        assert len(node.tpdos(3)) == fix_tpdos + 1
+        streamed = gps.fix.ecef_x
+
+        # off once it has its fix, until the next cycle
+        service.on_loop()
+        assert not gps.is_connected
+        assert node.sdo_read("status") == GpsState.OFF.value
+        assert streamed_status(events) == GpsState.OFF.value
+        sent = len(node.sent)
+        now[0] = start + 30
+        service.on_loop()
+        assert len(node.sent) == sent
+        assert streamed_status(events) is None
+        now[0] = start + 60
+
+    # a cycle without a good enough fix times out
+    gps.fix = gps.fix._replace(number_of_sv=2)
+    service.on_loop()
+    assert gps.is_connected
+    now[0] += 10
+    service.on_loop()
+    assert not gps.is_connected
+
+    stats = {name: node.sdo_read("skytraq_duty_cycle", name) for name in DutyCycleStats._fields}
+    assert stats == {
+        "cycles": 3,
+        "fixes": 2,
+        "timeouts": 1,
+        "ttff_last": 1000,
+        "ttff_min": 1000,
+        "ttff_max": 3500,
+        "ttff_mean": 2250,
+    }
+    service.on_stop()
+
+
+def test_aiding(tmp_path: Path) -> None:
+    """Test the aiding state is saved on power off and uploaded on power on.
+
+    The saved ephemeris is kept with later fixes until it's due a refresh, only then is the
+    receiver asked for it again.
+    """
+    orbit = orbit_now()
+    gps = AidingSkyTraq(orbit)
+    service, node = start_service(tmp_path, gps)
+    path = tmp_path / "skytraq_aiding"
+    assert not path.exists()
+    assert gps.aiding() == []
+
+    service.on_loop()
+    node.sdo_write("status", None, 0)
+    assert gps.commands.count(0x30) == 1
+    assert load_state(path) == AidingState(gps.fix, EPHEMERIS)
+    assert node.sdo_read("skytraq_aiding", "ephemeris_svs") == len(EPHEMERIS)
+
+    gps.commands.clear()
+    node.sdo_write("status", None, 1)
+    assert gps.aiding() == [0x41, 0x41, 0x01]
+    assert node.sdo_read("skytraq_aiding", "acked") == 3
+
+    # an hour on, the ephemeris is still good, it's kept rather than asked for again
+    gps.fix = SimulatedSkyTraq(1, orbit=orbit).nav_data(3600)
+    service.on_loop()
+    node.sdo_write("status", None, 0)
+    assert gps.commands.count(0x30) == 0
+    assert load_state(path) == AidingState(gps.fix, EPHEMERIS, 3_600_000)
+
+    node.sdo_write("status", None, 1)
+    gps.fix = SimulatedSkyTraq(1, orbit=orbit).nav_data(3 * 3600)
+    service.on_loop()
+    service.on_stop()
+    assert gps.commands.count(0x30) == 1
+    assert load_state(path) == AidingState(gps.fix, EPHEMERIS)
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"not a state file", b"STQAID\x00\x01" + bytes(59), b"STQAID\x00\x02" + bytes(100)],
+)
+def test_aiding_bad_state(tmp_path: Path, data: bytes) -> None:
+    """Test a state file that's corrupt or of an old format is ignored, then replaced."""
+    path = tmp_path / "skytraq_aiding"
+    path.write_bytes(data)
+    gps = AidingSkyTraq(orbit_now())
+    service, node = start_service(tmp_path, gps)
+    assert gps.aiding() == []
+    assert node.sdo_read("skytraq_aiding", "ephemeris_svs") == 0
+
+    service.on_loop()
+    service.on_stop()
+    assert load_state(path) == AidingState(gps.fix, EPHEMERIS)
@@ -0,0 +1,70 @@
+"""Unit tests for the GPS time to UTC conversion."""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from oresat_gps.gps_time import MS_PER_WEEK, LeapSeconds, ms_since_midnight
+
+GPS_EPOCH = datetime(1980, 1, 6, tzinfo=timezone.utc)
+UNIX_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_unix_ms(dt: datetime) -> int:
+    """Get a datetime as milliseconds since the Unix epoch."""
+    return (dt - UNIX_EPOCH) // timedelta(milliseconds=1)
+
+
+def test_to_unix_ms() -> None:
+    """Test conversion against datetime, on both sides of the last leap second."""
+    leap_seconds = LeapSeconds()
+    assert leap_seconds.current == 18
+
+    gps = GPS_EPOCH + timedelta(weeks=2400, milliseconds=123_456_780)
+    assert leap_seconds.to_unix_ms(2400, 123_456_780) == to_unix_ms(gps - timedelta(seconds=18))
+
+    # 2017-01-01 00:00:00 UTC, the first instant with 18 leap seconds
+    utc = datetime(2017, 1, 1, tzinfo=timezone.utc)
+    gps_ms = to_unix_ms(utc) - to_unix_ms(GPS_EPOCH) + 18_000
+    week, tow_ms = divmod(gps_ms, MS_PER_WEEK)
+    assert leap_seconds.to_unix_ms(week, tow_ms) == to_unix_ms(utc)
+    # a second before that is still 17, which lands on the same UTC second as the leap second
+    assert leap_seconds.to_unix_ms(week, tow_ms - 1000) == to_unix_ms(utc)
+    assert leap_seconds.to_unix_ms(week, tow_ms - 2000) == to_unix_ms(utc) - 1000
+
+    assert ms_since_midnight(to_unix_ms(utc) + 1234) == 1234
+
+    assert leap_seconds.to_gps_ms(to_unix_ms(gps - timedelta(seconds=18))) == (
+        2400 * MS_PER_WEEK + 123_456_780
+    )
+    assert leap_seconds.to_gps_ms(to_unix_ms(utc)) == gps_ms - 1000
+    assert leap_seconds.to_gps_ms(to_unix_ms(utc) + 1000) == gps_ms + 1000
+
+
+def test_update() -> None:
+    """Test a leap second reported by the receiver."""
+    leap_seconds = LeapSeconds()
+    gps_ms = 2500 * MS_PER_WEEK
+    assert not leap_seconds.update(gps_ms, 18)
+
+    assert leap_seconds.update(gps_ms, 19)
+    assert leap_seconds.current == 19
+    assert leap_seconds.offset_ms(gps_ms) == 19_000
+    assert leap_seconds.offset_ms(gps_ms - 1) == 18_000
+    # the second before the new leap second repeats
+    assert leap_seconds.to_unix_ms(2500, 0) == leap_seconds.to_unix_ms(2499, MS_PER_WEEK - 1000)
+
+    # reported again later, nothing changes
+    assert not leap_seconds.update(gps_ms + 1000, 19)
+
+
+def test_batch() -> None:
+    """Test the batch conversion matches the one at a time conversion."""
+    leap_seconds = LeapSeconds()
+    weeks = [0, 100, 1000, 1917, 1930, 2400]
+    tows_ms = [0, 5, 604_799_999, 1000, 302_400_000, 86_400_000]
+    out = leap_seconds.to_unix_ms_batch(weeks, tows_ms)
+    assert list(out) == [leap_seconds.to_unix_ms(w, t) for w, t in zip(weeks, tows_ms, strict=True)]
+
+    with pytest.raises(ValueError):  # noqa: PT011
+        leap_seconds.to_unix_ms_batch(weeks, tows_ms[:-1])
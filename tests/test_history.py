@@ -0,0 +1,48 @@
+"""Tests for the fix history."""
+
+from oresat_gps.gps_time import MS_PER_WEEK
+from oresat_gps.history import FixHistory, HistorySummary
+from oresat_gps.simulator import SimulatedSkyTraq
+
+
+def test_ring() -> None:
+    """Test the history keeps the newest fixes in order once it wraps around."""
+    sim = SimulatedSkyTraq(10)
+    fixes = [sim.nav_data(i / 10) for i in range(25)]
+    history = FixHistory(capacity=10)
+    for nav_data in fixes:
+        history.append(nav_data)
+
+    assert len(history) == 10
+    assert history.last(3) == fixes[-3:]
+    assert history.last(100) == fixes[-10:]
+    assert history.between() == fixes[-10:]
+
+    start = 2400 * MS_PER_WEEK + 1700
+    assert history.between(start, start + 300) == fixes[17:20]
+    assert history.between(0, start) == fixes[15:17]
+    assert history.between(start + 10_000) == []
+
+    columns = history.columns(start, last=2)
+    assert columns["gps_ms"] == [start + 600, start + 700]
+    assert columns["ecef_x"] == [f.ecef_x for f in fixes[23:]]
+
+
+def test_summary() -> None:
+    """Test the summary and that time going backwards starts the history over."""
+    sim = SimulatedSkyTraq(1)
+    history = FixHistory()
+    assert history.summary() == HistorySummary(0, 0, 0, 0, 0, 0, 0)
+
+    fixes = [sim.nav_data(i) for i in range(5)]
+    for nav_data in fixes:
+        history.append(nav_data)
+    summary = history.summary()
+    assert summary.fixes == 5
+    assert summary.last_time - summary.first_time == 4
+    assert summary.fixes_3d == 5
+    assert summary.min_sv == min(f.number_of_sv for f in fixes)
+    assert summary.mean_pdop == sum(f.pdop for f in fixes) // 5
+
+    history.append(fixes[0])
+    assert len(history) == 1
@@ -0,0 +1,25 @@
+"""Tests for the pipeline metrics."""
+
+from oresat_gps.metrics import Histogram
+
+
+def test_histogram() -> None:
+    """Test samples land in the right buckets and the summary adds up."""
+    hist = Histogram((10, 100, 1000))
+    for us in [5, 10, 11, 50, 99, 500, 5000]:
+        hist.observe(us * 1000)
+    assert hist.counts == [2, 3, 1, 1]
+    assert hist.percentile_us(25) == 10
+    assert hist.percentile_us(50) == 100
+    assert hist.percentile_us(80) == 1000
+    assert hist.percentile_us(100) == 5000
+
+    summary = hist.as_dict()
+    assert summary["count"] == 7
+    assert summary["max_us"] == 5000
+    assert summary["mean_us"] == (5 + 10 + 11 + 50 + 99 + 500 + 5000) // 7
+
+    hist.reset()
+    assert hist.count == 0
+    assert hist.percentile_us(50) == 0
+    assert hist.counts == [0, 0, 0, 0]
@@ -0,0 +1,26 @@
+"""Unit tests for the runtime OD entries."""
+
+from canopen import ObjectDictionary
+from canopen.objectdictionary import datatypes
+
+from oresat_gps._od import Sub, add_record, add_tpdo
+
+
+def test_add_tpdo() -> None:
+    """Test a TPDO is added like the card's config adds them, at the node's COB-ID for it."""
+    od = ObjectDictionary()
+    od.node_id = 0x34
+    od.device_information.nr_of_TXPDO = 8
+    rec = add_record(
+        od, 0x4008, "state", [Sub("time", datatypes.UNSIGNED32), Sub("age", datatypes.INTEGER32)]
+    )
+    add_tpdo(od, 10, [rec["time"], rec["age"]])
+
+    comm = od["tpdo_10_communication_parameters"]
+    assert comm.index == 0x1809
+    assert comm["cob_id"].value == 0x2B6
+    assert comm[5].name == "event_timer"
+    assert comm[0].value == 6
+    mapping = od[0x1A09]
+    assert [mapping[i].value for i in range(3)] == [2, 0x40080120, 0x40080220]
+    assert od.device_information.nr_of_TXPDO == 10
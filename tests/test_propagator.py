@@ -0,0 +1,107 @@
+"""Unit tests for the orbit propagator."""
+
+import math
+
+import pytest
+
+from oresat_gps.codec import NavData
+from oresat_gps.gps_time import MS_PER_WEEK
+from oresat_gps.propagator import (
+    EARTH_J2,
+    EARTH_MU,
+    EARTH_RADIUS,
+    EARTH_ROTATION,
+    Propagator,
+    Readout,
+    State,
+)
+from oresat_gps.simulator import SimulatedSkyTraq
+
+
+def gps_ms(nav_data: NavData) -> int:
+    """Get the GPS time of a fix in milliseconds."""
+    return nav_data.gps_week * MS_PER_WEEK + nav_data.tow * 10
+
+
+def position(nav_data: NavData) -> tuple[float, float, float]:
+    """Get the ECEF position of a fix in meters."""
+    return (nav_data.ecef_x / 100, nav_data.ecef_y / 100, nav_data.ecef_z / 100)
+
+
+def test_between_fixes() -> None:
+    """Test the state between fixes follows the simulated orbit."""
+    sim = SimulatedSkyTraq(1)
+    propagator = Propagator(blend=0)
+    fix = sim.nav_data(0)
+    assert propagator.state(gps_ms(fix)) is None
+    propagator.seed(fix)
+    assert propagator.epoch_ms == gps_ms(fix)
+
+    # the simulated orbit has no J2, which only starts to show after a few seconds
+    for t in (0.05, 0.5, 1.0, 2.0, 0.25, -0.5):
+        state = propagator.state(gps_ms(fix) + round(t * 1000))
+        assert state is not None
+        expected = sim.nav_data(t)
+        assert math.dist(state.position, position(expected)) < 0.05
+        velocity = (expected.ecef_vx / 100, expected.ecef_vy / 100, expected.ecef_vz / 100)
+        assert math.dist(state.velocity, velocity) < 0.05
+        assert state.age_ms == round(t * 1000)
+
+    assert propagator.state(gps_ms(fix) + 301_000) is None
+
+
+def test_j2() -> None:
+    """Test an equatorial orbit at the circular speed with J2 keeps its radius."""
+    radius = EARTH_RADIUS + 500e3
+    speed = math.sqrt(EARTH_MU / radius * (1 + 1.5 * EARTH_J2 * (EARTH_RADIUS / radius) ** 2))
+    fix = NavData._make([0xA8, 2, 8, 2400, 0, *[0] * 9, round(radius * 100), 0, 0, 0, 0, 0])
+    # the receiver reports velocity relative to the rotating earth
+    fix = fix._replace(ecef_vy=round((speed - EARTH_ROTATION * radius) * 100))
+    propagator = Propagator(blend=0, max_age=6000)
+    propagator.seed(fix)
+    for t in (60, 600, 1500):
+        state = propagator.state(gps_ms(fix) + t * 1000)
+        assert state is not None
+        assert math.hypot(*state.position) == pytest.approx(radius, abs=1)
+        assert state.position[2] == 0
+
+
+def test_reseed_blends() -> None:
+    """Test the jump to a new fix is blended out rather than stepped."""
+    sim = SimulatedSkyTraq(1)
+    propagator = Propagator(blend=1.0)
+    propagator.seed(sim.nav_data(0))
+    fix = sim.nav_data(1)
+    predicted = propagator.state(gps_ms(fix))
+    assert predicted is not None
+
+    # the new fix is 10 m off the prediction in x
+    propagator.seed(fix._replace(ecef_x=fix.ecef_x + 1000))
+    state = propagator.state(gps_ms(fix))
+    assert state is not None
+    assert math.dist(state.position, predicted.position) < 1e-6
+    half = propagator.state(gps_ms(fix) + 500)
+    assert half is not None
+    assert half.position[0] - sim.nav_data(1.5).ecef_x / 100 == pytest.approx(5, 0.1)
+    after = propagator.state(gps_ms(fix) + 1000)
+    assert after is not None
+    assert after.position[0] - sim.nav_data(2).ecef_x / 100 == pytest.approx(10, 0.1)
+
+
+def test_readout() -> None:
+    """Test the fields of a read come from one state, and a field asked again starts a new one."""
+    calls: list[int] = []
+
+    def propagate(time: int) -> State:
+        calls.append(time)
+        return State(len(calls), (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 0)
+
+    readout = Readout(propagate, window=0.5)
+    states = [readout.state(0, field, 10.0 + field * 0.01) for field in range(7)]
+    assert {state.gps_ms for state in states if state is not None} == {1}
+
+    # the next read of the same fields, another time and a read that took too long
+    assert readout.state(0, 0, 11.0) == State(2, (0.0, 0.0, 0.0), (0.0, 0.0, 0.0), 0)
+    readout.state(1234, 1, 11.0)
+    readout.state(1234, 2, 12.0)
+    assert calls == [0, 0, 1234, 1234]
@@ -0,0 +1,52 @@
+"""Tests for the background SkyTraq reader."""
+
+from pathlib import Path
+from time import monotonic
+
+import pytest
+import serial
+
+from oresat_gps.codec import Ack, NavData
+from oresat_gps.reader import MessageRing, OverflowPolicy, SkyTraqReader
+from oresat_gps.skytraq import MockSkyTraq, SkyTraq
+
+MSGS = [Ack(0x83, i) for i in range(5)]
+READ_TIMEOUT = 5
+"""Most seconds to wait for the reader to read what was written"""
+
+
+@pytest.mark.parametrize(
+    ("policy", "expected", "dropped"),
+    [
+        (OverflowPolicy.DROP_OLDEST, MSGS[2:], 2),
+        (OverflowPolicy.KEEP_LATEST, MSGS[3:], 3),
+    ],
+)
+def test_ring_overflow(policy: OverflowPolicy, expected: list[Ack], dropped: int) -> None:
+    """Test the ring overflow policies."""
+    ring = MessageRing(3, policy)
+    for msg in MSGS:
+        ring.put(msg)
+    assert ring.drain() == expected
+    assert ring.dropped == dropped
+    assert len(ring) == 0
+
+
+def test_reader() -> None:
+    """Test the reader thread drains a serial interface into the ring."""
+    gps = SkyTraq(Path("loop://"))
+    gps._ser = serial.serial_for_url("loop://", timeout=0.1)  # noqa: SLF001
+    gps._ser.write(MockSkyTraq.MOCK_DATA * 2)  # noqa: SLF001
+    reader = SkyTraqReader(gps)
+    reader.start()
+    deadline = monotonic() + READ_TIMEOUT
+    msgs = reader.drain(timeout=1)
+    try:
+        while len(msgs) < 2 and monotonic() < deadline:
+            msgs += reader.drain(timeout=1)
+    finally:
+        reader.stop()
+        gps._ser.close()  # noqa: SLF001
+    assert len(msgs) == 2, f"read {len(msgs)} of 2 messages in {READ_TIMEOUT} s"
+    assert all(isinstance(msg, NavData) for msg in msgs)
+    assert not reader.is_running
@@ -0,0 +1,62 @@
+"""Tests for the synthetic SkyTraq receiver."""
+
+import math
+
+import pytest
+
+from oresat_gps.codec import FrameDecoder, NavData, SkyTraqError
+from oresat_gps.propagator import EARTH_RADIUS
+from oresat_gps.simulator import Faults, Orbit, SimulatedSkyTraq
+
+
+def test_trajectory() -> None:
+    """Test the navigation data follows the orbit on the virtual clock."""
+    sim = SimulatedSkyTraq(100, orbit=Orbit(altitude=500e3, gps_week=2400, tow=10.0))
+    sim.connect()
+    msgs = [sim.read() for _ in range(200)]
+    assert all(isinstance(msg, NavData) for msg in msgs)
+    assert sim.clock == pytest.approx(2.0)
+
+    first, last = msgs[0], msgs[-1]
+    assert isinstance(first, NavData)
+    assert isinstance(last, NavData)
+    assert (first.gps_week, first.tow) == (2400, 1000)
+    assert last.tow == 1000 + 199
+    radius = math.dist((0, 0, 0), (last.ecef_x, last.ecef_y, last.ecef_z)) / 100
+    assert radius == pytest.approx(EARTH_RADIUS + 500e3, abs=1)
+    # about 7.6 km/s in inertial space, the earth fixed speed differs by the earth's rotation
+    speed = math.dist((0, 0, 0), (last.ecef_vx, last.ecef_vy, last.ecef_vz)) / 100
+    assert 7000 < speed < 8000
+
+
+def test_injection() -> None:
+    """Test injected bad frames are all caught and the run is repeatable."""
+
+    def run() -> tuple[int, int, int, int, int]:
+        faults = Faults(corrupt_rate=0.1, truncate_rate=0.1, non_nav_rate=0.2)
+        sim = SimulatedSkyTraq(200, seed=1, faults=faults, frames_per_read=4)
+        sim.connect()
+        decoder = FrameDecoder()
+        nav = bad = 0
+        for _ in range(100):
+            decoder.feed(sim._read_chunk())  # noqa: SLF001
+            while True:
+                try:
+                    msg = decoder.next_message()
+                except SkyTraqError:
+                    bad += 1
+                    continue
+                if msg is None:
+                    break
+                nav += isinstance(msg, NavData)
+        assert sim.nav_frames == 400
+        assert sim.corrupted > 0
+        assert sim.truncated > 0
+        assert sim.non_nav_frames > 0
+        assert bad == 0
+        assert decoder.resyncs >= sim.corrupted
+        # a truncated frame takes whatever follows it down with it
+        assert nav <= sim.nav_frames - sim.corrupted - sim.truncated
+        return nav, sim.corrupted, sim.truncated, sim.non_nav_frames, decoder.bytes_discarded
+
+    assert run() == run()
@@ -1,11 +1,26 @@
 """Tests for the SkyTraq module."""
 
+import os
+import struct
 from collections.abc import Generator
+from pathlib import Path
+from threading import Thread
+from time import sleep
 
 import pytest
 import serial
 
-from oresat_gps.skytraq import MockSkyTraq, NavData, SkyTraq, SkyTraqError
+from oresat_gps.codec import (
+    Ack,
+    FrameDecoder,
+    GpsTime,
+    Nack,
+    NavData,
+    RawMeas,
+    SkyTraqError,
+    SvChStatus,
+)
+from oresat_gps.skytraq import CommandEngine, MockSkyTraq, SkyTraq
 
 ENCODE_CASES = [
     (0x09, b"\x02\x00", b"\xa0\xa1\x00\x03\x09\x02\x00\x0b\x0d\x0a"),
@@ -30,7 +45,7 @@ def test_encode_binary(msg_id: int, body: bytes, expected: bytes) -> None:
 @pytest.fixture
 def loopback_skytraq() -> Generator[SkyTraq]:
     """Pyserial loopback fixture."""
-    gps = SkyTraq.__new__(SkyTraq)
+    gps = SkyTraq(Path("loop://"))
     gps._ser = serial.serial_for_url("loop://", timeout=1)  # noqa: SLF001
     yield gps
     gps._ser.close()  # noqa: SLF001
@@ -39,8 +54,9 @@ def loopback_skytraq() -> Generator[SkyTraq]:
 def test_read(loopback_skytraq: SkyTraq) -> None:
     """Test the read method."""
     loopback_skytraq._ser.write(MockSkyTraq.MOCK_DATA)  # noqa: SLF001
-    nav, _payload = loopback_skytraq.read()
+    nav = loopback_skytraq.read()
     assert isinstance(nav, NavData)
+    assert loopback_skytraq.last_packet == MockSkyTraq.MOCK_DATA[4:-3]
 
 
 def test_read_terminator_payload(loopback_skytraq: SkyTraq) -> None:
@@ -49,3 +65,222 @@ def test_read_terminator_payload(loopback_skytraq: SkyTraq) -> None:
     loopback_skytraq._ser.write(raw)  # noqa: SLF001
     with pytest.raises(SkyTraqError):
         loopback_skytraq.read()
+
+
+def test_decoder_chunks() -> None:
+    """Test the decoder with frames split across arbitrary chunks."""
+    raw = MockSkyTraq.MOCK_DATA + DECODE_CASES[0][0]
+    decoder = FrameDecoder()
+    frames = []
+    for i in range(0, len(raw), 7):
+        decoder.feed(raw[i : i + 7])
+        frames.extend(decoder)
+    assert frames == [MockSkyTraq.MOCK_DATA[4:-3], DECODE_CASES[0][1]]
+    assert decoder.bytes_discarded == 0
+
+
+@pytest.mark.parametrize(("raw", "expected"), DECODE_CASES)
+def test_decoder_resync(raw: bytes, expected: bytes) -> None:
+    """Test the decoder recovers a good frame buffered right behind a corrupt one."""
+    corrupt = bytearray(MockSkyTraq.MOCK_DATA)
+    corrupt[20] ^= 0xFF
+    decoder = FrameDecoder()
+    decoder.feed(b"\x0d\xa0" + bytes(corrupt) + raw)
+    assert list(decoder) == [expected]
+    assert decoder.resyncs == 1
+    assert decoder.checksum_failures == 1
+
+
+def test_read_skips_unknown(loopback_skytraq: SkyTraq) -> None:
+    """Test the read method skips unknown message ids and decodes other known ones."""
+    loopback_skytraq._ser.write(  # noqa: SLF001
+        SkyTraq.encode_binary(0x01, b"\x00") + DECODE_CASES[0][0] + MockSkyTraq.MOCK_DATA
+    )
+    assert loopback_skytraq.read() == Ack(0x83, 0x09)
+    assert isinstance(loopback_skytraq.read(), NavData)
+    assert loopback_skytraq.metrics.read.count >= 1
+    assert loopback_skytraq.metrics.decode.count == 2
+    assert loopback_skytraq.metrics.checksum.count == 3
+
+
+def test_decoder_sub_id() -> None:
+    """Test messages with a sub-id are decoded on both ids, other sub-ids are skipped."""
+    body = b"\x8e" + (123_456_780).to_bytes(4, "big") + bytes(4) + (2400).to_bytes(2, "big")
+    body += b"\x12\x12\x07"
+    decoder = FrameDecoder()
+    decoder.feed(
+        SkyTraq.encode_binary(0x64, b"\x8f" + bytes(4)) + SkyTraq.encode_binary(0x64, body)
+    )
+    assert decoder.next_message() == GpsTime(0x64, 0x8E, 123_456_780, 0, 2400, 18, 18, 7)
+
+
+def test_decoder_channels() -> None:
+    """Test messages with a block per channel are decoded into columns."""
+    raw_meas = bytes([7, 3]) + b"".join(
+        struct.pack(">BBddfB", sv, 30 + sv, 2.1e7 + sv, -12.5 * sv, 1000.5, 0b111)
+        for sv in (4, 9, 17)
+    )
+    status = bytes([7, 2]) + struct.pack(">4BbhhB", 0, 4, 7, 1, 35, 45, -170, 0x1F)
+    status += struct.pack(">4BbhhB", 1, 9, 3, 2, 28, 5, 359, 0x03)
+    decoder = FrameDecoder()
+    decoder.feed(
+        SkyTraq.encode_binary(0xDD, raw_meas)
+        + SkyTraq.encode_binary(0xDE, status)
+        + SkyTraq.encode_binary(0xDD, bytes([8, 0]))
+        + SkyTraq.encode_binary(0xDD, raw_meas[:-1])
+    )
+
+    meas = decoder.next_message()
+    assert isinstance(meas, RawMeas)
+    assert (meas.iod, meas.nmeas) == (7, 3)
+    assert meas.sv_id.tolist() == [4, 9, 17]
+    assert meas.cn0.tolist() == [34, 39, 47]
+    assert meas.pseudorange.tolist() == [2.1e7 + 4, 2.1e7 + 9, 2.1e7 + 17]
+    assert meas.carrier_phase.tolist() == [-50.0, -112.5, -212.5]
+    assert meas.doppler.tolist() == [1000.5] * 3
+    assert meas.indicator.tolist() == [0b111] * 3
+
+    sv_status = decoder.next_message()
+    assert isinstance(sv_status, SvChStatus)
+    assert sv_status.channel_id.tolist() == [0, 1]
+    assert sv_status.elevation.tolist() == [45, 5]
+    assert sv_status.azimuth.tolist() == [-170, 359]
+    assert sv_status.channel_status.tolist() == [0x1F, 0x03]
+
+    empty = decoder.next_message()
+    assert isinstance(empty, RawMeas)
+    assert len(empty.sv_id) == 0
+    with pytest.raises(SkyTraqError, match="3 channels"):
+        decoder.next_message()
+
+
+def test_decoder_last_packet() -> None:
+    """Test the last packet survives the buffer being compacted by the next feed."""
+    decoder = FrameDecoder()
+    decoder.feed(b"\x00" + MockSkyTraq.MOCK_DATA + DECODE_CASES[0][0][:5])
+    assert isinstance(decoder.next_message(), NavData)
+    assert decoder.next_message() is None
+    decoder.feed(DECODE_CASES[0][0][5:])
+    assert decoder.last_packet == MockSkyTraq.MOCK_DATA[4:-3]
+    assert decoder.next_message() == Ack(0x83, 0x09)
+    assert decoder.last_packet == DECODE_CASES[0][1]
+
+
+def test_decoder_received() -> None:
+    """Test the time each frame's first byte arrived at is worked back from the chunk times."""
+    ack = DECODE_CASES[0][0]
+    decoder = FrameDecoder()
+    decoder.byte_time = 0.001
+    decoder.feed(b"\x00\x00" + MockSkyTraq.MOCK_DATA[:10], 10.0)
+    assert decoder.next_message() is None
+    decoder.feed(MockSkyTraq.MOCK_DATA[10:] + ack, 20.0)
+    assert isinstance(decoder.next_message(), NavData)
+    assert decoder.last_received == pytest.approx(10.0 - 0.009)
+    assert decoder.next_message() == Ack(0x83, 0x09)
+    assert decoder.last_received == pytest.approx(20.0 - 0.001 * (len(ack) - 1))
+
+    decoder.feed(ack)
+    assert decoder.next_message() == Ack(0x83, 0x09)
+    assert decoder.last_received is None
+
+
+def test_time_marks() -> None:
+    """Test fixes leave a time mark with their GPS time."""
+    gps = MockSkyTraq()
+    gps.connect()
+    nav_data = gps.read()
+    assert isinstance(nav_data, NavData)
+    marks = gps.time_marks()
+    assert len(marks) == 1
+    assert marks[0].gps_ms == nav_data.gps_week * 604_800_000 + nav_data.tow * 10
+    assert gps.metrics.arrival.count == 1
+    assert gps.time_marks() == []
+
+
+def test_command_engine() -> None:
+    """Test replies are routed to in-flight commands and everything else passes through."""
+    engine = CommandEngine()
+    rate = engine.track(0x0E, timeout=1)
+    binary = engine.track(0x09, timeout=1)
+    stale = engine.track(0x09, timeout=0)
+    assert not engine.route(NavData._make(range(20)))
+    assert engine.route(Nack(0x84, 0x09))
+    assert engine.route(Ack(0x83, 0x0E))
+    assert not engine.route(Ack(0x83, 0x0E))
+    engine.expire()
+    assert rate.reply == Ack(0x83, 0x0E)
+    assert binary.reply == Nack(0x84, 0x09)
+    assert stale.done()
+    assert stale.reply is None
+    assert (engine.acks, engine.nacks, engine.timeouts, engine.in_flight) == (1, 1, 1, 0)
+
+
+def test_command_keeps_nav_data(loopback_skytraq: SkyTraq) -> None:
+    """Test waiting on a command doesn't throw away the navigation data read in the meantime."""
+    loopback_skytraq._ser.write(MockSkyTraq.MOCK_DATA + SkyTraq.encode_binary(0x83, b"\x0e"))  # noqa: SLF001
+    assert loopback_skytraq.command(0x0E, b"\x01\x00") == Ack(0x83, 0x0E)
+    assert isinstance(loopback_skytraq.read(), NavData)
+
+
+def test_query_update_rate(loopback_skytraq: SkyTraq) -> None:
+    """Test the update rate query returns the rate and keeps the messages read before the reply."""
+    reply = SkyTraq.encode_binary(0x83, b"\x10") + SkyTraq.encode_binary(0x86, b"\x05")
+    loopback_skytraq._ser.write(reply[:9] + MockSkyTraq.MOCK_DATA + reply[9:])  # noqa: SLF001
+    assert loopback_skytraq.query_update_rate() == 5
+    assert isinstance(loopback_skytraq.read(), NavData)
+
+    gps = MockSkyTraq()
+    assert gps.query_update_rate() == 1
+    gps.set_update_rate(10)
+    assert gps.query_update_rate() == 10
+
+
+def test_set_baud_fallback(loopback_skytraq: SkyTraq) -> None:
+    """Test the link falls back to the default baud rate when the switch isn't ACKed."""
+    loopback_skytraq._ser.timeout = 0.1  # noqa: SLF001
+    assert not loopback_skytraq.set_baud(460800)
+    assert loopback_skytraq.baud == SkyTraq.BAUD
+    assert loopback_skytraq.target_baud == 460800
+    with pytest.raises(ValueError, match="unsupported"):
+        loopback_skytraq.set_baud(1234)
+
+
+def test_set_update_rate() -> None:
+    """Test setting the update rate, the mock ACKs everything."""
+    gps = MockSkyTraq()
+    gps.set_update_rate(10)
+    assert gps.update_rate == 10
+    assert gps.set_baud(460800)
+    assert gps.baud == 460800
+
+
+def test_connect_timing() -> None:
+    """Test connect waits for the UART and retries binary mode until it is ACKed."""
+    controller, peripheral = os.openpty()
+
+    def receiver() -> None:
+        sleep(0.05)
+        os.write(controller, b"$GPGGA,booting\r\n")
+        os.read(controller, 64)  # first binary mode command is ignored
+        os.read(controller, 64)
+        os.write(controller, MockSkyTraq.MOCK_DATA + DECODE_CASES[0][0])
+
+    thread = Thread(target=receiver)
+    thread.start()
+    gps = SkyTraq(Path(os.ttyname(peripheral)))
+    try:
+        gps.connect()
+        assert isinstance(gps.read(), NavData)
+    finally:
+        thread.join()
+        gps.disconnect()
+        os.close(controller)
+        os.close(peripheral)
+    startup = gps.startup
+    assert startup.binary_mode_attempts == 2
+    assert startup.uart_alive is not None
+    assert startup.binary_mode is not None
+    assert startup.first_fix is not None
+    assert startup.power_on < startup.uart_alive < startup.binary_mode
+    # the first attempt times out after its own ACK timeout, not the serial read's
+    assert startup.binary_mode - startup.uart_alive < SkyTraq.READ_TIMEOUT / 2
@@ -0,0 +1,111 @@
+"""Micro-benchmarks for the SkyTraq codec.
+
+Each benchmark reports frames/sec, run with `pytest -s tests/test_skytraq_bench.py` to see them.
+"""
+
+import struct
+from collections.abc import Callable
+from contextlib import suppress
+from functools import reduce
+from operator import xor
+from time import perf_counter
+
+import pytest
+
+from oresat_gps.codec import FrameDecoder, SkyTraqError
+from oresat_gps.simulator import Faults, SimulatedSkyTraq
+from oresat_gps.skytraq import MockSkyTraq, SkyTraq
+
+MIN_TIME = 0.1
+"""Minimum time to run each benchmark for, in seconds"""
+
+RAW_MEAS = bytes([1, 32]) + b"".join(
+    struct.pack(">BBddfB", sv, 40, 2.2e7 + sv, 1e6 * sv, -1000.5, 0b111) for sv in range(1, 33)
+)
+"""Raw measurement body with all 32 channels in use"""
+
+CASES = [
+    ("mock", MockSkyTraq.MOCK_DATA[4], MockSkyTraq.MOCK_DATA[5:-3]),
+    ("raw_meas", 0xDD, RAW_MEAS),
+    ("max", 0xA8, bytes(range(256)) * 255 + bytes(range(254))),
+]
+
+
+def rate(func: Callable[[], object]) -> float:
+    """Call func repeatedly for at least MIN_TIME and return the calls per second."""
+    count = 0
+    start = perf_counter()
+    while (elapsed := perf_counter() - start) < MIN_TIME:
+        for _ in range(10):
+            func()
+        count += 10
+    return count / elapsed
+
+
+def report(record_property: Callable[[str, object], None], name: str, value: float) -> None:
+    """Print and record a benchmark result."""
+    record_property("frames_per_sec", value)
+    print(f"{name}: {value:,.0f} frames/sec")  # noqa: T201
+
+
+@pytest.mark.parametrize(("case", "msg_id", "body"), CASES)
+def test_bench_checksum(
+    record_property: Callable[[str, object], None], case: str, msg_id: int, body: bytes
+) -> None:
+    """Benchmark the checksum."""
+    payload = bytes([msg_id]) + body
+    assert SkyTraq.checksum(payload) == reduce(xor, payload, 0)
+    report(record_property, f"checksum {case}", rate(lambda: SkyTraq.checksum(payload)))
+
+
+@pytest.mark.parametrize(("case", "msg_id", "body"), CASES)
+def test_bench_encode(
+    record_property: Callable[[str, object], None], case: str, msg_id: int, body: bytes
+) -> None:
+    """Benchmark encoding into a preallocated buffer."""
+    buf = bytearray(len(body) + 8)
+    SkyTraq.encode_binary_into(buf, 0, msg_id, body)
+    if case == "mock":
+        assert buf == MockSkyTraq.MOCK_DATA
+    report(
+        record_property,
+        f"encode {case}",
+        rate(lambda: SkyTraq.encode_binary_into(buf, 0, msg_id, body)),
+    )
+
+
+@pytest.mark.parametrize(("case", "msg_id", "body"), CASES)
+def test_bench_decode(
+    record_property: Callable[[str, object], None], case: str, msg_id: int, body: bytes
+) -> None:
+    """Benchmark feeding a frame through the decoder and decoding the message."""
+    frame = SkyTraq.encode_binary(msg_id, body)
+    decoder = FrameDecoder()
+    # the synthetic payload isn't a valid 0xA8 message, so it only goes as far as the frame
+    pull = decoder.next_frame if case == "max" else decoder.next_message
+
+    def decode() -> None:
+        decoder.feed(frame)
+        pull()
+
+    decoder.feed(frame)
+    assert decoder.next_frame() == frame[4:-3]
+    report(record_property, f"decode {case}", rate(decode))
+    assert decoder.bytes_discarded == 0
+
+
+@pytest.mark.parametrize(
+    ("case", "faults"), [("clean", Faults()), ("faulty", Faults(0.05, 0.05, 0.2))]
+)
+def test_bench_read(
+    record_property: Callable[[str, object], None], case: str, faults: Faults
+) -> None:
+    """Benchmark reading a simulated receiver through the full driver read path."""
+    sim = SimulatedSkyTraq(100, faults=faults, frames_per_read=10)
+    sim.connect()
+
+    def read() -> None:
+        with suppress(SkyTraqError):
+            sim.read()
+
+    report(record_property, f"read simulated {case}", rate(read))
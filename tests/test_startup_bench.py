@@ -0,0 +1,97 @@
+"""Startup benchmarks.
+
+Each runs in a fresh interpreter, as the app does after a reboot, and reports seconds from before
+the first import. Run with `pytest -s tests/test_startup_bench.py` to see them.
+"""
+
+import json
+import subprocess
+import sys
+from collections.abc import Callable
+
+import pytest
+
+FRAMEWORK_MODULES = ("olaf", "canopen", "flask", "gpiod", "serial")
+"""Modules only `main()` or the hardware SkyTraqs should load"""
+IMPORT_BUDGET = 0.5
+"""Most seconds importing a module may take"""
+FIRST_FIX_BUDGET = 1.5
+"""Most seconds to the first fix from the reader, `MockSkyTraq` sends one every 0.5 s"""
+RUN_TIMEOUT = 30
+"""Most seconds a benchmark's interpreter may run for, so a hang fails rather than stalls the run"""
+
+IMPORT_SCRIPT = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import {module}
+print(json.dumps([perf_counter() - start, [m for m in {modules} if m in sys.modules]]))
+"""
+
+FIRST_FIX_SCRIPT = """
+import json
+from time import perf_counter
+start = perf_counter()
+from oresat_gps.codec import NavData
+from oresat_gps.reader import SkyTraqReader
+from oresat_gps.skytraq import MockSkyTraq
+imported = perf_counter()
+gps = MockSkyTraq()
+gps.connect()
+reader = SkyTraqReader(gps)
+reader.start()
+deadline = start + {deadline}
+while not any(isinstance(msg, NavData) and msg.fix_mode for msg in reader.drain(1)):
+    if perf_counter() > deadline:
+        raise TimeoutError("no fix from the reader")
+fixed = perf_counter()
+reader.stop()
+gps.disconnect()
+print(json.dumps([imported - start, fixed - start]))
+"""
+
+
+def run(script: str) -> list:
+    """Run a script in a fresh interpreter and return the JSON it printed."""
+    result = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", script],
+        check=True,
+        capture_output=True,
+        text=True,
+        timeout=RUN_TIMEOUT,
+    )
+    return json.loads(result.stdout)
+
+
+def report(record_property: Callable[[str, object], None], name: str, value: float) -> None:
+    """Print and record a benchmark result."""
+    record_property("seconds", value)
+    print(f"{name}: {value * 1000:,.1f} ms")  # noqa: T201
+
+
+@pytest.mark.parametrize(
+    "module",
+    [
+        "oresat_gps",
+        "oresat_gps.codec",
+        "oresat_gps.skytraq",
+        "oresat_gps.reader",
+        "oresat_gps.simulator",
+        "oresat_gps.decode",
+    ],
+)
+def test_bench_import(record_property: Callable[[str, object], None], module: str) -> None:
+    """Benchmark importing a module, which shouldn't load OLAF or the hardware libraries."""
+    elapsed, loaded = run(IMPORT_SCRIPT.format(module=module, modules=FRAMEWORK_MODULES))
+    report(record_property, f"import {module}", elapsed)
+    assert loaded == []
+    assert elapsed < IMPORT_BUDGET
+
+
+def test_bench_first_fix(record_property: Callable[[str, object], None]) -> None:
+    """Benchmark the time from a cold start to the first fix out of the reader."""
+    # well past the budget, so a slow start is reported and fails the budget below
+    imported, fixed = run(FIRST_FIX_SCRIPT.format(deadline=RUN_TIMEOUT / 2))
+    report(record_property, "first fix imports", imported)
+    report(record_property, "first fix", fixed)
+    assert fixed < FIRST_FIX_BUDGET
@@ -0,0 +1,80 @@
+"""Unit tests for live streaming."""
+
+import json
+from http.client import HTTPConnection
+from threading import Thread
+
+from oresat_gps.stream import FrameStream, serve
+
+
+def test_latest_frame() -> None:
+    """Test clients get the latest frame, with frames published in between merged into it."""
+    stream = FrameStream()
+    events = stream.subscribe(1000)
+    assert events is not None
+    assert stream.clients == 1
+
+    stream.publish({"status": "ON", "tow": 1})
+    stream.publish({"tow": 2})
+    stream.publish({"tow": 3})
+    event = next(events)
+    assert event.startswith("id: 3\n")
+    assert json.loads(event.split("data: ")[1]) == {"status": "ON", "tow": 3}
+
+    events.close()
+    events.close()
+    assert stream.clients == 0
+
+
+def test_keepalive_and_close() -> None:
+    """Test a keepalive is sent while there are no frames and closing ends every stream."""
+    stream = FrameStream(keepalive=0.01)
+    events = stream.subscribe(1000)
+    assert events is not None
+    assert next(events) == ": keepalive\n\n"
+
+    stream.close()
+    assert list(events) == []
+    assert stream.clients == 0
+    assert stream.subscribe(1) is None
+
+
+def test_max_clients() -> None:
+    """Test clients past max_clients are turned away until one leaves."""
+    stream = FrameStream(max_clients=2)
+    first = stream.subscribe(1)
+    assert first is not None
+    assert stream.subscribe(1) is not None
+    assert stream.subscribe(1) is None
+    first.close()
+    assert stream.subscribe(1) is not None
+
+
+def test_serve() -> None:
+    """Test the events are served over HTTP."""
+    stream = FrameStream(max_clients=1)
+    server = serve(stream, "localhost", 0)
+    port = server.server_address[1]
+    try:
+        conn = HTTPConnection("localhost", port, timeout=5)
+        conn.request("GET", "/skytraq/stream?rate=1000")
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.getheader("Content-Type") == "text/event-stream"
+
+        busy = HTTPConnection("localhost", port, timeout=5)
+        busy.request("GET", "/skytraq/stream")
+        assert busy.getresponse().status == 503
+        busy.close()
+
+        stream.publish({"tow": 1})
+        assert response.readline() == b"id: 1\n"
+        assert json.loads(response.readline().removeprefix(b"data: ")) == {"tow": 1}
+
+        # the handler ends the response once the stream is closed
+        Thread(target=stream.close).start()
+        assert response.read() == b"\n"
+        conn.close()
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,83 @@
+"""Unit tests for the TPDO scheduler."""
+
+from olaf import NetworkError
+
+from oresat_gps.tpdo import TpdoScheduler
+
+
+class FakeBus:
+    """Records the TPDOs sent, or fails them while down."""
+
+    def __init__(self) -> None:
+        self.up = True
+        self.failing = False
+        self.sent: list[int] = []
+
+    def send(self, tpdo: int) -> None:
+        """Send a TPDO."""
+        if self.failing:
+            raise NetworkError("can network is down")
+        self.sent.append(tpdo)
+
+
+def test_divisor() -> None:
+    """Test periodic TPDOs go out every divisor fixes, or follow the update rate at 0."""
+    bus = FakeBus()
+    scheduler = TpdoScheduler(bus.send, lambda: bus.up)
+    scheduler.set_divisor(3, 1)
+    scheduler.set_divisor(4, 0)
+    scheduler.fix_rate = 4
+    for _ in range(8):
+        scheduler.on_fix()
+    assert bus.sent == [3, 3, 3, 3, 4, 3, 3, 3, 3, 4]
+    assert scheduler.sent == 10
+
+
+def test_on_change() -> None:
+    """Test change triggered TPDOs only go out when their contents change."""
+    bus = FakeBus()
+    scheduler = TpdoScheduler(bus.send, lambda: bus.up)
+    for contents in [(0, 0), (0, 0), (2, 5), (2, 5), (3, 5)]:
+        scheduler.on_change(7, contents)
+    assert bus.sent == [7, 7, 7]
+
+
+def test_send() -> None:
+    """Test TPDOs sent outside the schedule, stopping at the first failure."""
+    bus = FakeBus()
+    scheduler = TpdoScheduler(bus.send, lambda: bus.up)
+    scheduler.send([3, 4])
+    bus.failing = True
+    scheduler.send([5, 6])
+    assert bus.sent == [3, 4]
+    assert scheduler.send_errors == 1
+
+
+def test_bus_down() -> None:
+    """Test nothing is attempted while the bus is down or backed off from after a failure."""
+    bus = FakeBus()
+    scheduler = TpdoScheduler(bus.send, lambda: bus.up)
+    scheduler.set_divisor(3, 1)
+    scheduler.set_divisor(4, 1)
+
+    bus.up = False
+    scheduler.on_fix()
+    scheduler.on_change(7, 1)
+    assert bus.sent == []
+    assert scheduler.send_errors == 0
+
+    bus.up = True
+    bus.failing = True
+    scheduler.on_fix()
+    assert scheduler.send_errors == 1  # the second TPDO isn't tried
+    scheduler.on_fix()
+    scheduler.on_change(7, 1)
+    assert scheduler.send_errors == 1  # backing off
+    assert not scheduler.can_send
+
+    bus.failing = False
+    scheduler._retry_at = 0  # noqa: SLF001
+    scheduler.on_change(7, 1)
+    scheduler.on_fix()
+    assert bus.sent == [7, 3, 4]
+    assert scheduler.can_send